@@ -1,13 +1,21 @@
 from django.contrib import admin
-from .models import Assistant, Chat, ChatMessage
+from .models import Assistant, AssistantUsageDaily, Chat, ChatJob, ChatMessage, OwnerUsageDaily
 
 
 @admin.register(Assistant)
 class AssistantAdmin(admin.ModelAdmin):
-    list_display = ['name', 'mode_id', 'assistant_id', 'mode', 'created_at']
-    list_filter = ['mode', 'created_at']
+    list_display = ['name', 'mode_id', 'assistant_id', 'mode', 'engine', 'created_at']
+    list_filter = ['mode', 'engine', 'created_at']
     search_fields = ['name', 'mode_id', 'assistant_id', 'description']
-    readonly_fields = ['assistant_id', 'created_at', 'updated_at']
+    readonly_fields = ['assistant_id', 'sync_hash', 'limits_changed_at', 'created_at', 'updated_at']
+    fieldsets = [
+        (None, {'fields': ['name', 'mode_id', 'assistant_id', 'mode', 'description', 'system_prompt', 'engine']}),
+        ('Context window', {
+            'fields': ['truncation_last_messages', 'max_prompt_tokens', 'max_completion_tokens', 'limits_changed_at'],
+            'description': 'Limits sent with every run. Leave blank for no limit.',
+        }),
+        ('Sync', {'fields': ['sync_hash', 'created_at', 'updated_at']}),
+    ]
 
 
 @admin.register(Chat)
@@ -23,10 +31,47 @@ class ChatAdmin(admin.ModelAdmin):
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
-    list_display = ['__str__', 'chat', 'role', 'created_at']
-    list_filter = ['role', 'created_at', 'chat__assistant__mode']
+    list_display = ['__str__', 'chat', 'role', 'model', 'prompt_tokens', 'completion_tokens', 'created_at']
+    list_filter = ['role', 'run_state', 'created_at', 'chat__assistant__mode']
     search_fields = ['content', 'chat__title', 'chat__user__username']
-    readonly_fields = ['created_at']
+    readonly_fields = ['model', 'prompt_tokens', 'completion_tokens', 'created_at']
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('chat', 'chat__assistant', 'chat__user')
+
+
+@admin.register(ChatJob)
+class ChatJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'chat', 'status', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['id', 'chat__title', 'error']
+    readonly_fields = ['id', 'chat', 'message', 'created_at', 'started_at', 'finished_at']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('chat', 'chat__assistant')
+
+
+class UsageAdmin(admin.ModelAdmin):
+    """Rollups are maintained by the run pipeline; the admin only reads them."""
+    date_hierarchy = 'day'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AssistantUsageDaily)
+class AssistantUsageDailyAdmin(UsageAdmin):
+    list_display = ['day', 'assistant', 'model', 'turns', 'prompt_tokens', 'completion_tokens']
+    list_filter = ['assistant', 'model']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('assistant')
+
+
+@admin.register(OwnerUsageDaily)
+class OwnerUsageDailyAdmin(UsageAdmin):
+    list_display = ['day', 'owner', 'turns', 'prompt_tokens', 'completion_tokens']
+    search_fields = ['owner']
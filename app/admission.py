@@ -0,0 +1,263 @@
+"""
+Admission control for assistant runs.
+
+Each client (user, else session, else IP) has a token bucket per mode:
+``burst`` tokens, refilled at ``rate`` per second, one spent per chat turn.
+Admitted turns then take a slot from the global pool of
+``ADMISSION_MAX_IN_FLIGHT`` run slots (and from the mode's own pool when
+``max_in_flight`` is set for it). When all slots are taken, a request may
+wait up to ``ADMISSION_QUEUE_TIMEOUT`` seconds, but only if one of the
+``ADMISSION_QUEUE_SIZE`` queue slots is free. Otherwise it is rejected at
+once with 429 and ``Retry-After``. The views charge the rate limit before
+looking in the reply cache, so cached replies are limited too, and take slots
+only for turns that run.
+
+All state lives in the database and is changed with conditional UPDATEs, like
+the per-chat run lease, so limits hold across worker processes. Slots are
+leases: a crashed holder's slot frees itself after ``CHAT_RUN_LOCK_TTL``.
+Buckets that have refilled to full are deleted by the retention pass.
+"""
+import asyncio
+import math
+import time
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Q, Subquery, Value
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from .models import RateBucket, RunSlot
+
+
+class Rejected(Exception):
+    """The request is over a limit; retry after ``retry_after`` seconds."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def limits_for(mode):
+    """Effective limits for an assistant mode: global settings plus per-mode overrides."""
+    limits = {
+        'rate': settings.ADMISSION_RATE,
+        'burst': settings.ADMISSION_BURST,
+        'max_in_flight': None,
+    }
+    limits.update(settings.ADMISSION_MODE_LIMITS.get(mode, {}))
+    return limits
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.id}'
+    session_key = request.session.session_key if hasattr(request, 'session') else None
+    if session_key:
+        return f'session:{session_key}'
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+
+# Token bucket -------------------------------------------------------------------
+
+def take_token(key, rate, burst):
+    """Spend one token from bucket ``key``; return 0, or seconds until one is available."""
+    now = time.time()
+    elapsed = Value(now) - F('refilled_at')
+    taken = RateBucket.objects.filter(
+        key=key, tokens__gte=Value(1.0) - elapsed * Value(rate),
+    ).update(
+        tokens=Least(Value(float(burst)), F('tokens') + elapsed * Value(rate)) - Value(1.0),
+        refilled_at=now,
+    )
+    if taken:
+        return 0
+
+    bucket = RateBucket.objects.filter(key=key).first()
+    if bucket is None:
+        try:
+            RateBucket.objects.create(key=key, tokens=burst - 1, refilled_at=now)
+            return 0
+        except IntegrityError:
+            # Created concurrently; go through the conditional UPDATE again
+            return take_token(key, rate, burst)
+    available = min(burst, bucket.tokens + (now - bucket.refilled_at) * rate)
+    return (1 - available) / rate if rate > 0 else settings.CHAT_RUN_LOCK_TTL
+
+
+def idle_buckets(now=None):
+    """Buckets idle for ``burst / rate`` seconds, i.e. refilled to full.
+
+    A full bucket admits exactly like a missing one (take_token creates it on
+    the next turn), so these can be deleted. Modes with ``rate`` 0 never refill
+    and are kept.
+    """
+    now = time.time() if now is None else now
+    idle = Q(pk__in=[])
+    overridden = Q(pk__in=[])
+    for mode in settings.ADMISSION_MODE_LIMITS:
+        prefix = Q(key__startswith=f'{mode}:')
+        limits = limits_for(mode)
+        if limits['rate'] > 0:
+            idle |= prefix & Q(refilled_at__lt=now - limits['burst'] / limits['rate'])
+        overridden |= prefix
+    if settings.ADMISSION_RATE > 0:
+        idle |= ~overridden & Q(refilled_at__lt=now - settings.ADMISSION_BURST / settings.ADMISSION_RATE)
+    return RateBucket.objects.filter(idle)
+
+
+# Slots ----------------------------------------------------------------------------
+
+def _provision(scope, capacity):
+    """Create any missing slot rows 0..capacity-1 for ``scope``."""
+    RunSlot.objects.bulk_create(
+        [RunSlot(scope=scope, slot=i) for i in range(capacity)], ignore_conflicts=True,
+    )
+
+
+def acquire_slot(scope, capacity):
+    """Lease a free slot of ``scope``; return the lease token, or None if all are taken."""
+    if capacity <= 0:
+        return None
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    slots = RunSlot.objects.filter(scope=scope, slot__lt=capacity)
+    free = slots.filter(Q(expires_at__isnull=True) | Q(expires_at__lt=now))
+    for _ in range(3):
+        # The free-slot condition is repeated on the outer UPDATE, so two
+        # requests racing for the same row cannot both win it
+        if free.filter(id__in=Subquery(free.values('id')[:1])).update(
+            token=token, expires_at=now + timedelta(seconds=settings.CHAT_RUN_LOCK_TTL),
+        ):
+            return token
+        if slots.count() < capacity:
+            # First use of this scope, or its capacity was raised
+            _provision(scope, capacity)
+        elif not free.exists():
+            return None
+    return None
+
+
+def release_slot(token):
+    RunSlot.objects.filter(token=token).update(token='', expires_at=None)
+
+
+# Admission ------------------------------------------------------------------------
+
+class Ticket:
+    """Run slots held by an admitted request; release exactly once."""
+
+    def __init__(self, leases=()):
+        self.leases = list(leases)
+
+    def release(self):
+        leases, self.leases = self.leases, []
+        for lease in leases:
+            release_slot(lease)
+
+
+def _pools(mode, limits):
+    pools = [('global', settings.ADMISSION_MAX_IN_FLIGHT)]
+    if limits['max_in_flight']:
+        pools.append((f'mode:{mode}', limits['max_in_flight']))
+    return pools
+
+
+def _try_slots(pools):
+    """Take one slot from every pool, or none at all."""
+    leases = []
+    for scope, capacity in pools:
+        lease = acquire_slot(scope, capacity)
+        if lease is None:
+            for held in leases:
+                release_slot(held)
+            return None
+        leases.append(lease)
+    return leases
+
+
+def check_rate(request, mode):
+    """Spend one of the client's tokens for a turn of ``mode``, or raise Rejected.
+
+    Charged for every turn, including those answered from the reply cache.
+    """
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        return
+    limits = limits_for(mode)
+    wait = take_token(f'{mode}:{client_key(request)}', limits['rate'], limits['burst'])
+    if wait:
+        raise Rejected('Too many messages, please slow down', wait)
+
+
+async def acheck_rate(request, mode):
+    await sync_to_async(check_rate)(request, mode)
+
+
+def take_slots(mode):
+    """Take the run slots for a turn of ``mode`` (waiting in the queue); return a Ticket or raise Rejected."""
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        return Ticket()
+    pools = _pools(mode, limits_for(mode))
+    leases = _try_slots(pools)
+    if leases is not None:
+        return Ticket(leases)
+
+    queue_lease = acquire_slot('queue', settings.ADMISSION_QUEUE_SIZE)
+    if queue_lease is None:
+        raise Rejected('Server is busy, please try again shortly', settings.ADMISSION_QUEUE_TIMEOUT)
+    try:
+        deadline = time.monotonic() + settings.ADMISSION_QUEUE_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(settings.CHAT_RUN_POLL_INTERVAL)
+            leases = _try_slots(pools)
+            if leases is not None:
+                return Ticket(leases)
+    finally:
+        release_slot(queue_lease)
+    raise Rejected('Server is busy, please try again shortly', settings.ADMISSION_QUEUE_TIMEOUT)
+
+
+async def atake_slots(mode):
+    """Async version of take_slots; waits without holding a thread."""
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        return Ticket()
+    pools = _pools(mode, limits_for(mode))
+    leases = await sync_to_async(_try_slots)(pools)
+    if leases is not None:
+        return Ticket(leases)
+
+    queue_lease = await sync_to_async(acquire_slot)('queue', settings.ADMISSION_QUEUE_SIZE)
+    if queue_lease is None:
+        raise Rejected('Server is busy, please try again shortly', settings.ADMISSION_QUEUE_TIMEOUT)
+    try:
+        deadline = time.monotonic() + settings.ADMISSION_QUEUE_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.CHAT_RUN_POLL_INTERVAL)
+            leases = await sync_to_async(_try_slots)(pools)
+            if leases is not None:
+                return Ticket(leases)
+    finally:
+        await sync_to_async(release_slot)(queue_lease)
+    raise Rejected('Server is busy, please try again shortly', settings.ADMISSION_QUEUE_TIMEOUT)
+
+
+def admit(request, mode, wait=True):
+    """Admit one chat turn for ``mode``: charge the rate limit, then take run slots.
+
+    With ``wait=False`` only the rate limit is applied (for turns whose
+    concurrency is bounded elsewhere, e.g. background jobs). Returns a Ticket
+    or raises Rejected.
+    """
+    check_rate(request, mode)
+    return take_slots(mode) if wait else Ticket()
+
+
+async def aadmit(request, mode, wait=True):
+    """Async version of admit."""
+    await acheck_rate(request, mode)
+    return await atake_slots(mode) if wait else Ticket()
@@ -0,0 +1,37 @@
+"""
+Avatar thumbnails.
+
+The mode cards show 80x80 avatars, but the source PNGs in ``static/img/`` are
+1-2 MB each. ``python manage.py build_avatars`` writes resized AVIF/WebP/PNG
+copies at 1x and 2x with content-hashed names (so they can be cached
+forever) into ``AVATAR_OUTPUT_DIR``, plus a manifest mapping each source image
+to its variants. The ``{% avatar %}`` template tag reads that manifest and
+falls back to the source image when no thumbnails have been built.
+"""
+import json
+from functools import lru_cache
+
+from django.conf import settings
+
+
+# Preferred first: browsers pick the first <source> type they support
+FORMATS = [
+    ('avif', 'image/avif'),
+    ('webp', 'image/webp'),
+    ('png', 'image/png'),
+]
+DENSITIES = (1, 2)
+
+
+def manifest_path():
+    return settings.AVATAR_OUTPUT_DIR / 'manifest.json'
+
+
+@lru_cache(maxsize=1)
+def load_manifest():
+    """Source static path -> variants, as written by build_avatars ({} if not built)."""
+    try:
+        with open(manifest_path(), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
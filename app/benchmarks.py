@@ -0,0 +1,37 @@
+"""
+Helpers shared by the benchmark and report commands.
+
+``throwaway_database()`` runs a benchmark (bench_chat, bench_db_writes,
+compare_chat_concurrency) against the test database, created on a temporary
+SQLite file so worker threads share one file, and deletes it (with its WAL
+files) afterwards. ``percentile()`` reads a nearest-rank percentile from
+sorted values, for bench_chat, bench_db_writes and prompt_token_report.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import setup_databases, teardown_databases
+
+
+def percentile(values, pct):
+    """Nearest-rank ``pct`` percentile of sorted, non-empty ``values``."""
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+@contextmanager
+def throwaway_database():
+    """Create the test database on a temporary file; drop and delete it on exit."""
+    db_file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+    db_file.close()
+    connections['default'].settings_dict.setdefault('TEST', {})['NAME'] = db_file.name
+    connections['default'].close()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_file.name + suffix):
+                os.unlink(db_file.name + suffix)
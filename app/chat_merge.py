@@ -0,0 +1,112 @@
+"""
+Merging duplicate chats into one canonical chat per owner and assistant.
+
+``create_chat`` used to insert a new ``Chat`` row on every visit, reusing the
+thread of the owner's latest chat, so one conversation ended up spread over
+many rows. Chats are now unique per (user or session, assistant) among active
+chats; this module folds the old duplicates together so that constraint can
+be added.
+
+For each group of active duplicates, the most recently active chat is kept.
+Duplicates on the same thread (or, for the chat-completions engine, with no
+thread) are merged into it: their messages and jobs are moved over in
+batches and the emptied rows deleted. Duplicates on a different thread hold
+a conversation the kept thread does not know, so they are only deactivated
+and stay readable as history. Groups with a run in progress are skipped;
+running again picks them (and any interrupted group) up. The data migration
+passes ``force=True``: it must leave no duplicates for the constraint, so it
+merges those groups too and deactivates any row it could not empty.
+
+The functions take the model classes so the data migration can pass its
+historical models.
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+
+DEFAULT_TITLE = 'New Chat'
+
+OWNER_FIELDS = ['user_id', 'session_key']
+
+
+def duplicate_groups(Chat, batch_size):
+    """Yield lookups (owner and assistant) of groups with more than one active chat, in keyset batches."""
+    for field in OWNER_FIELDS:
+        last = None
+        while True:
+            groups = (
+                Chat.objects.filter(is_active=True, **{f'{field}__isnull': False})
+                .values(field, 'assistant_id').annotate(chats=Count('id')).filter(chats__gt=1)
+                .order_by(field, 'assistant_id')
+            )
+            if last is not None:
+                groups = groups.filter(
+                    Q(**{f'{field}__gt': last[0]}) | Q(**{field: last[0], 'assistant_id__gt': last[1]})
+                )
+            batch = list(groups[:batch_size])
+            for group in batch:
+                yield {field: group[field], 'assistant_id': group['assistant_id']}
+            if len(batch) < batch_size:
+                break
+            last = (batch[-1][field], batch[-1]['assistant_id'])
+
+
+def merge_group(Chat, ChatMessage, ChatJob, lookup, batch_size, force=False):
+    """Merge one group; return counts, or None if a run on it is in progress (unless ``force``)."""
+    with transaction.atomic():
+        chats = list(
+            Chat.objects.select_for_update().filter(is_active=True, **lookup).order_by('-last_activity', '-id')
+        )
+        if len(chats) < 2:
+            return {'merged': 0, 'deactivated': 0, 'messages': 0}
+        now = timezone.now()
+        if not force and any(chat.run_lock_expires_at and chat.run_lock_expires_at > now for chat in chats):
+            return None
+        canonical, rest = chats[0], chats[1:]
+        same = [chat.id for chat in rest if chat.thread_id == canonical.thread_id]
+        other = [chat.id for chat in rest if chat.thread_id != canonical.thread_id]
+        Chat.objects.filter(id__in=other).update(is_active=False)
+        if canonical.title in ('', DEFAULT_TITLE):
+            titled = next((chat.title for chat in rest if chat.id in same and chat.title not in ('', DEFAULT_TITLE)), '')
+            if titled:
+                Chat.objects.filter(id=canonical.id).update(title=titled)
+        ChatJob.objects.filter(chat_id__in=same).update(chat_id=canonical.id)
+
+    # Messages are moved in bounded transactions; an interrupted group keeps
+    # the same canonical chat (moving messages does not touch last_activity)
+    moved = 0
+    while True:
+        ids = list(ChatMessage.objects.filter(chat_id__in=same).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        moved += ChatMessage.objects.filter(id__in=ids).update(chat_id=canonical.id)
+
+    # Rows that got a message meanwhile are left for the next run
+    with transaction.atomic():
+        ChatJob.objects.filter(chat_id__in=same).update(chat_id=canonical.id)
+        Chat.objects.filter(id__in=same).exclude(
+            id__in=ChatMessage.objects.filter(chat_id__in=same).values('chat_id'),
+        ).delete()
+        if force:
+            Chat.objects.filter(id__in=same).update(is_active=False)
+    return {'merged': len(same), 'deactivated': len(other), 'messages': moved}
+
+
+def merge_duplicates(Chat, ChatMessage, ChatJob, batch_size=500, dry_run=False, progress=None, force=False):
+    """Merge every duplicate group; return totals. ``progress`` is called with the totals after each group."""
+    totals = {'groups': 0, 'merged': 0, 'deactivated': 0, 'messages': 0, 'skipped': 0}
+    for lookup in duplicate_groups(Chat, batch_size):
+        totals['groups'] += 1
+        if dry_run:
+            totals['merged'] += Chat.objects.filter(is_active=True, **lookup).count() - 1
+            continue
+        result = merge_group(Chat, ChatMessage, ChatJob, lookup, batch_size, force)
+        if result is None:
+            totals['skipped'] += 1
+        else:
+            for key, value in result.items():
+                totals[key] += value
+        if progress:
+            progress(totals)
+    return totals
@@ -0,0 +1,144 @@
+"""
+Chat Completions engine.
+
+For assistants with ``engine='chat_completions'`` a turn is a single
+``chat.completions.create`` call. The context is built from the ChatMessage
+rows already stored plus the assistant's ``system_prompt``, so no thread
+message/run/poll/list round trips are needed.
+
+The history is cut to fit ``CHAT_CONTEXT_TOKEN_BUDGET``: the newest messages
+are kept and older ones are dropped. Tokens are counted with ``tiktoken``
+when it is installed, and estimated from text length otherwise.
+"""
+from django.conf import settings
+
+from . import metrics, usage as usage_ledger
+from .models import ChatMessage
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+
+
+def count_tokens(text):
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.encoding_for_model(settings.OPENAI_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding('o200k_base')
+        return len(_encoding.encode(text))
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def _history_queryset(chat, batch):
+    """Messages that form the context for ``batch``, newest first."""
+    return (
+        chat.messages
+        .filter(id__lte=max(m.id for m in batch))
+        .exclude(run_state__in=[ChatMessage.RUN_PENDING, ChatMessage.RUN_FAILED])
+        .order_by('-created_at', '-id')
+        # The related manager reads chat_id of every row; deferring it would cost a query each
+        .only('id', 'chat', 'role', 'content')[:chat.assistant.truncation_last_messages or settings.CHAT_CONTEXT_MAX_MESSAGES]
+    )
+
+
+def _max_completion_tokens(assistant):
+    return assistant.max_completion_tokens or settings.CHAT_COMPLETION_MAX_TOKENS
+
+
+def build_context(assistant, history):
+    """Chat Completions ``messages`` for ``history`` (newest first), within the token budget.
+
+    The assistant's ``max_prompt_tokens`` caps the prompt when set; otherwise
+    room for the reply is reserved out of ``CHAT_CONTEXT_TOKEN_BUDGET``.
+    The newest message is always kept.
+    """
+    budget = (
+        (assistant.max_prompt_tokens or settings.CHAT_CONTEXT_TOKEN_BUDGET - _max_completion_tokens(assistant))
+        - count_tokens(assistant.system_prompt) - MESSAGE_OVERHEAD_TOKENS
+    )
+    kept = []
+    for message in history:
+        cost = count_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+        if kept and cost > budget:
+            break
+        budget -= cost
+        kept.append({'role': message.role, 'content': message.content})
+    kept.reverse()
+    return [{'role': 'system', 'content': assistant.system_prompt}] + kept
+
+
+def request_kwargs(chat, batch):
+    return {
+        'model': settings.OPENAI_MODEL,
+        'messages': build_context(chat.assistant, list(_history_queryset(chat, batch))),
+        'max_completion_tokens': _max_completion_tokens(chat.assistant),
+    }
+
+
+async def arequest_kwargs(chat, batch):
+    history = [m async for m in _history_queryset(chat, batch)]
+    return {
+        'model': settings.OPENAI_MODEL,
+        'messages': build_context(chat.assistant, history),
+        'max_completion_tokens': _max_completion_tokens(chat.assistant),
+    }
+
+
+def complete(chat, batch, client):
+    """Answer a claimed batch with one Chat Completions call; return ``(reply, error, usage)``."""
+    try:
+        completion = client.chat.completions.create(**request_kwargs(chat, batch))
+        content = completion.choices[0].message.content if completion.choices else None
+        if not content:
+            return None, 'No response from assistant', usage_ledger.from_response(completion)
+        return content, '', usage_ledger.from_response(completion)
+    except Exception as e:
+        metrics.record_error(chat.assistant.mode_id, e)
+        return None, str(e), None
+
+
+async def acomplete(chat, batch, client):
+    """Async version of complete."""
+    try:
+        completion = await client.chat.completions.create(**await arequest_kwargs(chat, batch))
+        content = completion.choices[0].message.content if completion.choices else None
+        if not content:
+            return None, 'No response from assistant', usage_ledger.from_response(completion)
+        return content, '', usage_ledger.from_response(completion)
+    except Exception as e:
+        metrics.record_error(chat.assistant.mode_id, e)
+        return None, str(e), None
+
+
+def stream(chat, batch, client):
+    """Yield text deltas of a streamed completion; return ``(reply, error, usage)``."""
+    parts = []
+    usage = None
+    try:
+        chunks = client.chat.completions.create(
+            stream=True, stream_options={'include_usage': True}, **request_kwargs(chat, batch),
+        )
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+            # The last chunk carries the usage of the whole completion
+            usage = usage_ledger.from_response(chunk) or usage
+    except Exception as e:
+        metrics.record_error(chat.assistant.mode_id, e)
+        return None, str(e), usage
+    content = ''.join(parts)
+    if not content:
+        return None, 'No response from assistant', usage
+    return content, '', usage
@@ -0,0 +1,413 @@
+"""
+Minimal local stand-in for the OpenAI Assistants API.
+
+Serves just enough of the threads/messages/runs/assistants and chat
+completions endpoints for the ``openai`` SDK calls this app makes, so benchmarks can exercise the chat
+pipeline without network access. Run latency, streaming token rate and error
+rate are configurable.
+"""
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+REPLY_TEXT = (
+    'This is a reply from the local fake OpenAI server. It stands in for a real '
+    'assistant run so the chat pipeline can be measured without the network.'
+)
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server imitating the OpenAI Assistants endpoints.
+
+    ``run_latency`` is how long (seconds) a run stays in progress before it
+    completes, ``token_rate`` how many streamed tokens are sent per second, and
+    ``error_rate`` the fraction of runs that end with status ``failed``.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, run_latency=1.0, token_rate=50.0,
+                 error_rate=0.0, reply_text=REPLY_TEXT, poll_after_ms=50):
+        self.run_latency = run_latency
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.reply_text = reply_text
+        self.poll_after_ms = poll_after_ms
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.threads = {}
+        self.runs = {}
+        self.request_count = 0
+
+        handler = type('Handler', (_Handler,), {'fake': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.request_queue_size = 1024
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -- state helpers -----------------------------------------------------
+
+    def new_id(self, prefix):
+        return f'{prefix}_fake{next(self._ids)}'
+
+    def message(self, thread_id, role, text):
+        return {
+            'id': self.new_id('msg'),
+            'object': 'thread.message',
+            'created_at': int(time.time()),
+            'thread_id': thread_id,
+            'role': role,
+            'status': 'completed',
+            'content': [{'type': 'text', 'text': {'value': text, 'annotations': []}}],
+            'attachments': [],
+            'metadata': {},
+        }
+
+    def create_run(self, thread_id, assistant_id, body):
+        run = {
+            'id': self.new_id('run'),
+            'object': 'thread.run',
+            'created_at': int(time.time()),
+            'thread_id': thread_id,
+            'assistant_id': assistant_id,
+            'status': 'queued',
+            'model': body.get('model') or 'fake-model',
+            'instructions': '',
+            'tools': [],
+            'metadata': {},
+            'usage': None,
+            'truncation_strategy': body.get('truncation_strategy'),
+            'max_prompt_tokens': body.get('max_prompt_tokens'),
+            'max_completion_tokens': body.get('max_completion_tokens'),
+        }
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.runs[run['id']] = {
+                'run': run,
+                'started': time.monotonic(),
+                'failed': failed,
+                'finished': False,
+            }
+        return run
+
+    def active_run(self, thread_id):
+        """Return True if the thread has a run that has not finished yet."""
+        with self._lock:
+            active = [state for state in self.runs.values()
+                      if state['run']['thread_id'] == thread_id and not state['finished']]
+        for state in active:
+            if self.run_state(state['run']['id'])['status'] in ('queued', 'in_progress'):
+                return True
+        return False
+
+    def run_state(self, run_id):
+        """Return the run object, finishing it once its latency has elapsed."""
+        with self._lock:
+            state = self.runs[run_id]
+            run = state['run']
+            if state['finished']:
+                return run
+            if time.monotonic() - state['started'] < self.run_latency:
+                run['status'] = 'in_progress'
+                return run
+            self._finish(state)
+            return run
+
+    def _finish(self, state):
+        run = state['run']
+        state['finished'] = True
+        if state['failed']:
+            run['status'] = 'failed'
+            run['last_error'] = {'code': 'server_error', 'message': 'Injected failure'}
+            return
+        run['status'] = 'completed'
+        messages = self.threads.get(run['thread_id'], [])
+        truncation = run.get('truncation_strategy') or {}
+        if truncation.get('type') == 'last_messages':
+            messages = messages[-truncation['last_messages']:]
+        prompt_tokens = sum(len(m['content'][0]['text']['value'].split()) for m in messages)
+        if run.get('max_prompt_tokens'):
+            prompt_tokens = min(prompt_tokens, run['max_prompt_tokens'])
+        completion_tokens = len(self.reply_text.split())
+        run['usage'] = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+        self.threads.setdefault(run['thread_id'], []).append(
+            self.message(run['thread_id'], 'assistant', self.reply_text)
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    # -- plumbing ------------------------------------------------------------
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _json(self, data, status=200):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('openai-poll-after-ms', str(self.fake.poll_after_ms))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _event(self, name, data):
+        frame = f'event: {name}\ndata: {json.dumps(data) if not isinstance(data, str) else data}\n\n'
+        chunk = frame.encode()
+        self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+        self.wfile.flush()
+
+    def _route(self, method):
+        fake = self.fake
+        with fake._lock:
+            fake.request_count += 1
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        query = parse_qs(url.query)
+
+        if method == 'POST' and path == '/v1/threads':
+            self._body()
+            thread_id = fake.new_id('thread')
+            with fake._lock:
+                fake.threads[thread_id] = []
+            return self._json({'id': thread_id, 'object': 'thread',
+                               'created_at': int(time.time()), 'metadata': {}})
+
+        if method == 'POST' and path == '/v1/assistants':
+            body = self._body()
+            return self._json({
+                'id': fake.new_id('asst'), 'object': 'assistant',
+                'created_at': int(time.time()), 'name': body.get('name'),
+                'description': body.get('description'), 'model': body.get('model'),
+                'instructions': body.get('instructions'), 'tools': body.get('tools') or [],
+                'metadata': {},
+            })
+
+        if method == 'POST' and path == '/v1/chat/completions':
+            return self._completion(self._body())
+
+        match = re.fullmatch(r'/v1/assistants/([^/]+)', path)
+        if match and method == 'POST':
+            body = self._body()
+            return self._json({
+                'id': match.group(1), 'object': 'assistant',
+                'created_at': int(time.time()), 'name': body.get('name'),
+                'description': body.get('description'), 'model': body.get('model'),
+                'instructions': body.get('instructions'), 'tools': body.get('tools') or [],
+                'metadata': {},
+            })
+
+        match = re.fullmatch(r'/v1/threads/([^/]+)/messages', path)
+        if match:
+            thread_id = match.group(1)
+            if method == 'POST':
+                body = self._body()
+                content = body.get('content')
+                if isinstance(content, list):
+                    content = ''.join(part.get('text', '') for part in content)
+                message = fake.message(thread_id, body.get('role', 'user'), content or '')
+                with fake._lock:
+                    fake.threads.setdefault(thread_id, []).append(message)
+                return self._json(message)
+            messages = list(fake.threads.get(thread_id, []))
+            if (query.get('order') or ['desc'])[0] == 'desc':
+                messages.reverse()
+            limit = int((query.get('limit') or ['20'])[0])
+            data = messages[:limit]
+            return self._json({
+                'object': 'list', 'data': data, 'has_more': len(messages) > limit,
+                'first_id': data[0]['id'] if data else None,
+                'last_id': data[-1]['id'] if data else None,
+            })
+
+        match = re.fullmatch(r'/v1/threads/([^/]+)/runs', path)
+        if match and method == 'POST':
+            body = self._body()
+            thread_id = match.group(1)
+            if fake.active_run(thread_id):
+                return self._json({'error': {
+                    'message': f'Thread {thread_id} already has an active run.',
+                    'type': 'invalid_request_error',
+                }}, status=400)
+            for extra in body.get('additional_messages') or []:
+                content = extra.get('content')
+                if isinstance(content, list):
+                    content = ''.join(part.get('text', '') for part in content)
+                with fake._lock:
+                    fake.threads.setdefault(thread_id, []).append(
+                        fake.message(thread_id, extra.get('role', 'user'), content or ''))
+            run = fake.create_run(thread_id, body.get('assistant_id'), body)
+            if body.get('stream'):
+                return self._stream_run(run)
+            return self._json(run)
+        if match and method == 'GET':
+            with fake._lock:
+                runs = [state['run'] for state in fake.runs.values()
+                        if state['run']['thread_id'] == match.group(1)]
+            if (query.get('order') or ['desc'])[0] == 'desc':
+                runs.reverse()
+            limit = int((query.get('limit') or ['20'])[0])
+            data = runs[:limit]
+            return self._json({
+                'object': 'list', 'data': data, 'has_more': len(runs) > limit,
+                'first_id': data[0]['id'] if data else None,
+                'last_id': data[-1]['id'] if data else None,
+            })
+
+        match = re.fullmatch(r'/v1/threads/([^/]+)/runs/([^/]+)', path)
+        if match and method == 'GET':
+            return self._json(fake.run_state(match.group(2)))
+
+        match = re.fullmatch(r'/v1/threads/([^/]+)/runs/([^/]+)/cancel', path)
+        if match and method == 'POST':
+            run = fake.run_state(match.group(2))
+            run['status'] = 'cancelled'
+            return self._json(run)
+
+        self._json({'error': {'message': f'Unknown route {method} {path}'}}, status=404)
+
+    def _completion(self, body):
+        """Answer a chat completion after ``run_latency``, streamed or whole."""
+        fake = self.fake
+        completion_id = fake.new_id('chatcmpl')
+        model = body.get('model') or 'fake-model'
+        words = fake.reply_text.split(' ')
+        stream_time = len(words) / fake.token_rate if body.get('stream') and fake.token_rate else 0
+        time.sleep(max(fake.run_latency - stream_time, 0))
+        if random.random() < fake.error_rate:
+            return self._json({'error': {'message': 'Injected failure', 'type': 'server_error'}},
+                              status=500)
+
+        prompt_tokens = sum(len(str(m.get('content') or '').split()) for m in body.get('messages') or [])
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(words),
+            'total_tokens': prompt_tokens + len(words),
+        }
+        if not body.get('stream'):
+            return self._json({
+                'id': completion_id, 'object': 'chat.completion',
+                'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': fake.reply_text}}],
+                'usage': usage,
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, word in enumerate(words):
+            self._data({
+                'id': completion_id, 'object': 'chat.completion.chunk',
+                'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'finish_reason': None,
+                             'delta': {'content': word if i == 0 else ' ' + word}}],
+            })
+            if fake.token_rate:
+                time.sleep(1 / fake.token_rate)
+        self._data({
+            'id': completion_id, 'object': 'chat.completion.chunk',
+            'created': int(time.time()), 'model': model,
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'delta': {}}],
+        })
+        if (body.get('stream_options') or {}).get('include_usage'):
+            self._data({
+                'id': completion_id, 'object': 'chat.completion.chunk',
+                'created': int(time.time()), 'model': model, 'choices': [], 'usage': usage,
+            })
+        self._data('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def _data(self, data):
+        chunk = f'data: {json.dumps(data) if not isinstance(data, str) else data}\n\n'.encode()
+        self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+        self.wfile.flush()
+
+    def _stream_run(self, run):
+        fake = self.fake
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        self._event('thread.run.created', run)
+        run['status'] = 'in_progress'
+        self._event('thread.run.in_progress', run)
+
+        words = fake.reply_text.split(' ')
+        # Time to first token takes the configured latency minus streaming time.
+        stream_time = len(words) / fake.token_rate if fake.token_rate else 0
+        time.sleep(max(fake.run_latency - stream_time, 0))
+
+        state = fake.runs[run['id']]
+        if state['failed']:
+            with fake._lock:
+                fake._finish(state)
+            self._event('thread.run.failed', run)
+        else:
+            message = fake.message(run['thread_id'], 'assistant', '')
+            message['status'] = 'in_progress'
+            message['content'] = []
+            self._event('thread.message.created', message)
+            for i, word in enumerate(words):
+                text = word if i == 0 else ' ' + word
+                self._event('thread.message.delta', {
+                    'id': message['id'], 'object': 'thread.message.delta',
+                    'delta': {'content': [{'index': 0, 'type': 'text',
+                                           'text': {'value': text, 'annotations': []}}]},
+                })
+                if fake.token_rate:
+                    time.sleep(1 / fake.token_rate)
+            with fake._lock:
+                fake._finish(state)
+            self._event('thread.run.completed', run)
+        self._event('done', '[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_DELETE(self):
+        self._json({'deleted': True})
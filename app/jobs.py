@@ -0,0 +1,110 @@
+"""
+Background chat jobs.
+
+In job mode the chat API stores the user message, records a ChatJob row and
+returns immediately. The turn is then run on a small in-process thread pool.
+Job state lives in the project database, so no external broker is needed, and
+any process can pick up a job: jobs are claimed with a conditional UPDATE.
+Jobs stranded by a restarted web process are recovered by the
+``run_chat_jobs`` management command.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import ChatJob, ChatMessage
+from .openai_client import get_client
+from .runs import run_turn
+
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def get_executor():
+    """Return this process's job thread pool, creating it on first use."""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    with _lock:
+        if _executor is None or _executor_pid != pid:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.CHAT_JOB_WORKERS,
+                thread_name_prefix='chat-job',
+            )
+            _executor_pid = pid
+        return _executor
+
+
+def enqueue(chat, message):
+    """Record a job for ``message`` and schedule it once the transaction commits."""
+    job = ChatJob.objects.create(chat=chat, message=message)
+    transaction.on_commit(lambda: get_executor().submit(process_job, job.id))
+    return job
+
+
+def claim_job(job_id):
+    """Move a queued job to running; return False if someone else has it."""
+    return ChatJob.objects.filter(id=job_id, status=ChatJob.QUEUED).update(
+        status=ChatJob.RUNNING, started_at=timezone.now(),
+    ) == 1
+
+
+def process_job(job_id):
+    """Run one job to completion. Safe to call from any thread or process."""
+    close_old_connections()
+    try:
+        if not claim_job(job_id):
+            return
+        job = ChatJob.objects.select_related('chat__assistant', 'message').get(id=job_id)
+        try:
+            reply, error = run_turn(job.chat, job.message, get_client())
+        except Exception as e:
+            reply, error = None, str(e)
+        ChatJob.objects.filter(id=job_id).update(
+            status=ChatJob.FAILED if error else ChatJob.DONE,
+            reply=reply or '',
+            error=(error or '')[:255],
+            finished_at=timezone.now(),
+        )
+    finally:
+        close_old_connections()
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker died mid-run; return how many were requeued.
+
+    Their messages go back to pending in the same transaction. Left running,
+    or already marked interrupted by a later run, the next attempt would find
+    nothing to claim and fail the job without running the turn.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.CHAT_RUN_LOCK_TTL)
+    with transaction.atomic():
+        stale = list(
+            ChatJob.objects.select_for_update().filter(status=ChatJob.RUNNING, started_at__lt=cutoff)
+            .values_list('id', 'message_id')
+        )
+        if not stale:
+            return 0
+        ChatMessage.objects.filter(
+            id__in=[message_id for _, message_id in stale],
+            run_state__in=[ChatMessage.RUN_RUNNING, ChatMessage.RUN_FAILED],
+        ).update(run_state=ChatMessage.RUN_PENDING, run_error='')
+        return ChatJob.objects.filter(id__in=[job_id for job_id, _ in stale]).update(
+            status=ChatJob.QUEUED, started_at=None,
+        )
+
+
+def job_payload(job):
+    """JSON body describing a job's state."""
+    data = {'job_id': str(job.id), 'status': job.status}
+    if job.status == ChatJob.DONE:
+        data['reply'] = job.reply
+    elif job.status == ChatJob.FAILED:
+        data['error'] = job.error
+    return data
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.retention import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Archive chats past their retention (CHAT_RETENTION_DAYS, USER_CHAT_RETENTION_DAYS) to gzipped JSONL '
+        'in CHAT_ARCHIVE_DIR, delete them in batches, and clear expired sessions and idle rate buckets. '
+        'Resumes an interrupted pass'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Chats archived and deleted per batch')
+        parser.add_argument('--duty-cycle', type=float, default=0.5,
+                            help='Fraction of the time spent working; the rest is spent sleeping between '
+                                 'batches (1 = no pauses)')
+        parser.add_argument('--time-limit', type=float,
+                            help='Stop after about this many seconds; the next run resumes where this one stopped')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if not 0 < options['duty_cycle'] <= 1:
+            raise CommandError('--duty-cycle must be in (0, 1]')
+
+        def progress(totals):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{totals["chats"]} chat(s), {totals["messages"]} message(s) archived')
+
+        totals = archive(
+            batch_size=options['batch_size'], duty_cycle=options['duty_cycle'], time_limit=options['time_limit'],
+            dry_run=options['dry_run'], progress=progress,
+        )
+        if options['dry_run']:
+            sessions = 'unknown' if totals['sessions'] is None else totals['sessions']
+            self.stdout.write(
+                f'{totals["chats"]} chat(s) with {totals["messages"]} message(s) to archive, '
+                f'{sessions} expired session(s), {totals["buckets"]} idle rate bucket(s)'
+            )
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived and deleted {totals["chats"]} chat(s) with {totals["messages"]} message(s)'
+            + (f' to {totals["file"]}' if totals['file'] else '')
+        ))
+        if totals['skipped']:
+            self.stdout.write(f'Skipped {totals["skipped"]} chat(s) with a run in progress')
+        if totals['finished']:
+            if totals['sessions'] is not None:
+                self.stdout.write(f'Deleted {totals["sessions"]} expired session(s)')
+            self.stdout.write(f'Deleted {totals["buckets"]} idle rate bucket(s)')
+        else:
+            self.stdout.write(self.style.WARNING('Stopped at the time limit; run again to continue'))
@@ -0,0 +1,235 @@
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+
+from app.benchmarks import percentile, throwaway_database
+from app.fake_openai import FakeOpenAIServer
+from app.models import Assistant, Chat, ChatMessage
+from app.openai_client import reset_clients
+
+
+SCENARIOS = ['create_chat', 'chat_api', 'chat_detail', 'modes']
+
+
+def _rss_mb():
+    """Current resident set size of this process in MB (peak RSS where /proc is missing)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if platform.system() == 'Darwin' else peak / 1024
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test create_chat, chat_api, chat_detail and /api/modes/ against a local fake '
+        'OpenAI server and a throwaway database; report throughput, latency percentiles, '
+        'queries per request and memory, and optionally save or compare JSON results'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', default=SCENARIOS, choices=SCENARIOS)
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Concurrent simulated clients (worker threads), each sending back to back')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario')
+        parser.add_argument('--engine', choices=[e for e, _ in Assistant.ENGINES], default=Assistant.ENGINE_ASSISTANTS)
+        parser.add_argument('--backend', choices=['fake', 'stub'], default='fake',
+                            help='fake: local fake OpenAI HTTP server; stub: in-process stub backend '
+                                 '(no HTTP, isolates this project\'s own overhead)')
+        parser.add_argument('--run-latency', type=float, default=0.2, help='Fake run/completion duration in seconds')
+        parser.add_argument('--token-rate', type=float, default=50.0, help='Fake streamed tokens per second')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake runs that fail')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Earlier results JSON to compare against')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        fake = None
+        if options['backend'] == 'stub':
+            if options['error_rate']:
+                raise CommandError('The stub backend is deterministic; --error-rate needs --backend fake')
+            settings.LLM_BACKEND = 'stub'
+            settings.LLM_STUB_LATENCY = options['run_latency']
+            settings.LLM_STUB_TOKEN_RATE = options['token_rate']
+        else:
+            fake = FakeOpenAIServer(
+                run_latency=options['run_latency'], token_rate=options['token_rate'],
+                error_rate=options['error_rate'],
+            ).start()
+            settings.LLM_BACKEND = 'openai'
+            settings.OPENAI_API_KEY = 'sk-fake'
+            settings.OPENAI_BASE_URL = fake.base_url
+        reset_clients()
+
+        try:
+            with throwaway_database():
+                self.assistant = Assistant.objects.create(
+                    mode_id='bench', assistant_id='asst_bench', name='Bench',
+                    system_prompt='Benchmark assistant', mode='professional', engine=options['engine'],
+                )
+                connections['default'].close()
+                scenarios = {}
+                for name in options['scenarios']:
+                    scenarios[name] = self._run(name, options)
+                    self._print(name, scenarios[name], baseline)
+        finally:
+            if fake is not None:
+                fake.stop()
+            reset_clients()
+
+        results = {
+            'commit': _git_commit(),
+            'timestamp': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'database': connections['default'].vendor,
+            'config': {
+                key: options[key] for key in (
+                    'concurrency', 'requests', 'warmup', 'backend', 'engine', 'run_latency', 'token_rate', 'error_rate',
+                )
+            },
+            'scenarios': scenarios,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+        else:
+            self.stdout.write(json.dumps(results))
+
+    # Simulated clients ----------------------------------------------------------------
+
+    def _client(self, with_chat):
+        """A test client with its own session, plus a chat of its own if asked."""
+        session = SessionStore()
+        session.create()
+        client = Client()
+        client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        chat = None
+        if with_chat:
+            chat = Chat.objects.create(
+                assistant=self.assistant, session_key=session.session_key,
+                thread_id='' if self.assistant.engine == Assistant.ENGINE_CHAT_COMPLETIONS else f'thread_{session.session_key}',
+                title='New Chat',
+            )
+        return client, chat
+
+    def _request(self, name, client, chat):
+        if name == 'create_chat':
+            # A new session each time, so every request creates a chat (and thread)
+            return Client().get('/chat/create/?assistant_id=bench')
+        if name == 'chat_api':
+            return client.post('/api/chat/', json.dumps({'message': 'Hello', 'chat_id': chat.id}),
+                               content_type='application/json')
+        if name == 'chat_detail':
+            return client.get(f'/chat/{chat.id}/')
+        return client.get('/api/modes/')
+
+    def _run(self, name, options):
+        """Closed loop: each worker sends its next request as soon as the last one returns."""
+        total = options['warmup'] + options['requests']
+        issued = iter(range(total))
+        issued_lock = threading.Lock()
+        samples = []  # (latency, status, queries) of measured requests
+        samples_lock = threading.Lock()
+        workers = [self._client(with_chat=name in ('chat_api', 'chat_detail')) for _ in range(options['concurrency'])]
+        if name == 'chat_detail':
+            # A short history to render on every page
+            ChatMessage.objects.bulk_create([
+                ChatMessage(chat=chat, role=role, content=f'{role} message {i}', run_state=ChatMessage.RUN_DONE)
+                for _, chat in workers for i, role in enumerate(['user', 'assistant'] * 5)
+            ])
+        connections['default'].close()
+
+        def worker(client, chat):
+            queries = [0]
+
+            def count(execute, sql, params, many, context):
+                queries[0] += 1
+                return execute(sql, params, many, context)
+
+            while True:
+                with issued_lock:
+                    index = next(issued, None)
+                if index is None:
+                    break
+                queries[0] = 0
+                start = time.perf_counter()
+                with connection.execute_wrapper(count):
+                    response = self._request(name, client, chat)
+                latency = time.perf_counter() - start
+                if index >= options['warmup']:
+                    with samples_lock:
+                        samples.append((latency, response.status_code, queries[0]))
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=pair) for pair in workers]
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        rss_after = _rss_mb()
+
+        latencies = sorted(latency for latency, _, _ in samples)
+        queries = [count for _, _, count in samples]
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for _, status, _ in samples if status >= 400),
+            'wall_s': round(wall, 3),
+            'throughput_rps': round(len(samples) / wall, 1) if wall else 0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'max_ms': round(latencies[-1] * 1000, 1),
+            'queries_per_request': round(statistics.mean(queries), 1),
+            'max_queries': max(queries),
+            'rss_mb': round(rss_after, 1),
+            # Workers are threads of this process: growth while they ran, split per worker
+            'rss_mb_per_worker': round(max(rss_after - rss_before, 0) / options['concurrency'], 2),
+        }
+
+    def _print(self, name, result, baseline):
+        line = (
+            f'{name:>11}: {result["throughput_rps"]:.1f} req/s, p50 {result["p50_ms"]:.1f} ms, '
+            f'p95 {result["p95_ms"]:.1f} ms, p99 {result["p99_ms"]:.1f} ms, '
+            f'{result["queries_per_request"]:.1f} queries/req, errors {result["errors"]}, '
+            f'rss {result["rss_mb"]:.0f} MB'
+        )
+        before = (baseline or {}).get('scenarios', {}).get(name)
+        if before and before.get('throughput_rps') and before.get('p95_ms'):
+            throughput = (result['throughput_rps'] / before['throughput_rps'] - 1) * 100
+            p95 = (result['p95_ms'] / before['p95_ms'] - 1) * 100
+            line += (f'  [vs {baseline.get("commit") or "baseline"}: throughput {throughput:+.0f}%, '
+                     f'p95 {p95:+.0f}%, queries {result["queries_per_request"] - before["queries_per_request"]:+.1f}]')
+        self.stdout.write(line)
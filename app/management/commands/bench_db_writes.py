@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+
+from app.benchmarks import percentile, throwaway_database
+from app.models import Assistant, Chat, ChatMessage
+from app.runs import queue_user_message
+
+
+PROFILES = {
+    'sqlite': ({}, {}),
+    'sqlite-tuned': (settings.SQLITE_TUNED_PRAGMAS, settings.SQLITE_TUNED_OPTIONS),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure concurrent chat-turn write throughput and "database is locked" errors '
+        'for the plain and tuned SQLite profiles, on throwaway database files'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Concurrent writer threads')
+        parser.add_argument('--readers', type=int, default=4, help='Concurrent reader threads (history page)')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile')
+        parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('bench_db_writes compares SQLite profiles; set DB_PROFILE to sqlite or sqlite-tuned')
+
+        results = {}
+        for profile in options['profiles']:
+            results[profile] = self._bench(profile, options)
+            r = results[profile]
+            self.stdout.write(
+                f'{profile:>13}: {r["writes_per_s"]:.0f} writes/s, {r["reads_per_s"]:.0f} reads/s, '
+                f'locked errors {r["locked_errors"]}, p99 write {r["p99_write_ms"]:.1f} ms'
+            )
+        self.stdout.write(json.dumps(results))
+
+    def _bench(self, profile, options):
+        pragmas, db_options = PROFILES[profile]
+        settings.SQLITE_PRAGMAS = pragmas
+        db_settings = connections['default'].settings_dict
+        db_settings['OPTIONS'] = dict(db_options)
+
+        with throwaway_database():
+            assistant = Assistant.objects.create(
+                mode_id='bench', assistant_id='asst_bench', name='Bench',
+                system_prompt='Benchmark assistant', mode='professional',
+            )
+            chats = [
+                Chat.objects.create(assistant=assistant, session_key=f'bench{i:034d}',
+                                    thread_id=f'thread_bench{i}', title='New Chat')
+                for i in range(options['writers'])
+            ]
+            connections['default'].close()
+            return self._run_threads(chats, options)
+
+    def _run_threads(self, chats, options):
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {'writes': 0, 'reads': 0, 'locked_errors': 0, 'write_ms': []}
+
+        def writer(chat):
+            close_old_connections()
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    # One chat turn's intake and completion writes
+                    message = queue_user_message(chat, 'Benchmark message')
+                    ChatMessage.objects.create(chat=chat, role='assistant', content='Benchmark reply')
+                    ChatMessage.objects.filter(id=message.id).update(run_state=ChatMessage.RUN_DONE)
+                except OperationalError:
+                    with lock:
+                        stats['locked_errors'] += 1
+                    continue
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    stats['writes'] += 1
+                    stats['write_ms'].append(elapsed)
+            connections.close_all()
+
+        def reader(chat):
+            close_old_connections()
+            while not stop.is_set():
+                try:
+                    list(chat.messages.order_by('-created_at', '-id')[:50])
+                except OperationalError:
+                    with lock:
+                        stats['locked_errors'] += 1
+                    continue
+                with lock:
+                    stats['reads'] += 1
+            connections.close_all()
+
+        threads = [threading.Thread(target=writer, args=(chat,)) for chat in chats]
+        threads += [threading.Thread(target=reader, args=(chats[i % len(chats)],))
+                    for i in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        write_ms = sorted(stats['write_ms']) or [0]
+        return {
+            'writes_per_s': stats['writes'] / options['duration'],
+            'reads_per_s': stats['reads'] / options['duration'],
+            'locked_errors': stats['locked_errors'],
+            'p99_write_ms': percentile(write_ms, 99),
+        }
@@ -0,0 +1,125 @@
+import hashlib
+import io
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.text import slugify
+
+from app.avatars import DENSITIES, FORMATS, load_manifest, manifest_path
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # optional dependency, only needed to build
+    Image = None
+
+
+ENCODE_OPTIONS = {
+    'avif': {'quality': 55},
+    'webp': {'quality': 82, 'method': 6},
+    'png': {'optimize': True},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Build resized, content-hashed AVIF/WebP/PNG avatar thumbnails (1x and 2x) '
+        'from static/img/ for the {% avatar %} template tag'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=80, help='Displayed (1x) width and height in pixels')
+        parser.add_argument('--source', default='img', help='Static subdirectory holding the source PNGs')
+        parser.add_argument('--force', action='store_true', help='Rebuild thumbnails whose source is unchanged')
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError('build_avatars needs Pillow: pip install Pillow')
+
+        output_dir = Path(settings.AVATAR_OUTPUT_DIR)
+        static_dir = next(
+            (Path(d) for d in settings.STATICFILES_DIRS if output_dir.is_relative_to(d)), None
+        )
+        if static_dir is None:
+            raise CommandError('AVATAR_OUTPUT_DIR must be inside one of STATICFILES_DIRS')
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        formats = []
+        for ext, mime in FORMATS:
+            if ext == 'png' or features.check(ext):
+                formats.append((ext, mime))
+            else:
+                self.stdout.write(self.style.WARNING(f'Pillow lacks {ext} support; skipping {ext}'))
+
+        load_manifest.cache_clear()
+        previous = load_manifest()
+        manifest = {}
+        before_bytes = after_bytes = 0
+        for source in sorted((static_dir / options['source']).glob('*.png')):
+            key = source.relative_to(static_dir).as_posix()
+            data = source.read_bytes()
+            source_hash = hashlib.sha256(data).hexdigest()[:16]
+            before_bytes += len(data)
+
+            entry = previous.get(key)
+            if (not options['force'] and entry and entry['source_hash'] == source_hash
+                    and entry['size'] == options['size']
+                    and [ext for ext, _ in formats] == [s['format'] for s in entry['sources']]
+                    and all((static_dir / path).exists()
+                            for s in entry['sources'] for path in s['files'].values())):
+                manifest[key] = entry
+                after_bytes += entry['bytes']
+                continue
+
+            entry = self._build(source, data, source_hash, static_dir, output_dir, formats, options['size'])
+            manifest[key] = entry
+            after_bytes += entry['bytes']
+            self.stdout.write(
+                f'  {key}: {len(data) / 1024:.0f} KB -> {entry["bytes"] / 1024:.1f} KB '
+                f'({entry["sources"][0]["format"]}, 1x)'
+            )
+
+        with open(manifest_path(), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        load_manifest.cache_clear()
+
+        # Drop thumbnails no longer referenced by the manifest
+        keep = {static_dir / path for entry in manifest.values()
+                for s in entry['sources'] for path in s['files'].values()}
+        for path in output_dir.iterdir():
+            if path.is_file() and path != manifest_path() and path not in keep:
+                path.unlink()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {len(manifest)} avatar(s): {before_bytes // 1024} KB of source images, '
+            f'{after_bytes / 1024:.1f} KB per page load at 1x'
+        ))
+
+    def _build(self, source, data, source_hash, static_dir, output_dir, formats, size):
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            image = image.convert('RGBA')
+            slug = slugify(source.stem)
+            sources = []
+            for ext, mime in formats:
+                files = {}
+                for density in DENSITIES:
+                    pixels = size * density
+                    thumb = ImageOps.fit(image, (pixels, pixels), Image.Resampling.LANCZOS)
+                    buffer = io.BytesIO()
+                    thumb.save(buffer, format=ext.upper(), **ENCODE_OPTIONS[ext])
+                    content = buffer.getvalue()
+                    digest = hashlib.sha256(content).hexdigest()[:12]
+                    path = output_dir / f'{slug}-{pixels}.{digest}.{ext}'
+                    if not path.exists():
+                        path.write_bytes(content)
+                    files[str(density)] = path.relative_to(static_dir).as_posix()
+                sources.append({'format': ext, 'type': mime, 'files': files})
+        first = static_dir / sources[0]['files']['1']
+        return {
+            'source_hash': source_hash,
+            'size': size,
+            'bytes': first.stat().st_size,
+            'sources': sources,
+        }
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+
+from app.benchmarks import throwaway_database
+from app.fake_openai import FakeOpenAIServer
+from app.models import Assistant, Chat
+from app.openai_client import reset_clients
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent chat_api capacity of the sync view (bounded worker threads) '
+        'against the async view, using a local fake OpenAI server and a throwaway database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=64, help='Concurrent chat requests per path')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Worker threads available to the sync path (like WSGI threads)')
+        parser.add_argument('--run-latency', type=float, default=0.5, help='Fake run duration in seconds')
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        workers = options['workers']
+        self.run_latency = options['run_latency']
+
+        fake = FakeOpenAIServer(run_latency=options['run_latency']).start()
+        settings.OPENAI_API_KEY = 'sk-fake'
+        settings.OPENAI_BASE_URL = fake.base_url
+        reset_clients()
+
+        try:
+            with throwaway_database():
+                assistant = Assistant.objects.create(
+                    mode_id='bench', assistant_id='asst_bench', name='Bench',
+                    system_prompt='Benchmark assistant', mode='professional',
+                )
+                results = {
+                    'sync': self._run_sync(self._make_chats(assistant, n), workers),
+                    'async': asyncio.run(self._run_async(self._make_chats(assistant, n))),
+                }
+        finally:
+            fake.stop()
+
+        self.stdout.write(f'Requests per path: {n}, sync workers: {workers}, '
+                          f'run latency: {options["run_latency"]}s')
+        for name, result in results.items():
+            self.stdout.write(
+                f'  {name:>5}: wall {result["wall_s"]:.2f}s, '
+                f'{result["throughput_rps"]:.1f} req/s, '
+                f'p50 {result["p50_s"]:.2f}s, max {result["max_s"]:.2f}s, '
+                f'effective concurrency {result["concurrency"]:.1f}, '
+                f'errors {result["errors"]}'
+            )
+        self.stdout.write(json.dumps(results))
+
+    def _make_chats(self, assistant, n):
+        """Create one anonymous session and chat per simulated client."""
+        pairs = []
+        for i in range(n):
+            session = SessionStore()
+            session.create()
+            chat = Chat.objects.create(
+                assistant=assistant, session_key=session.session_key,
+                thread_id=f'thread_bench{i}', title='New Chat',
+            )
+            pairs.append((session.session_key, chat.id))
+        return pairs
+
+    def _summary(self, latencies, wall, errors):
+        return {
+            'wall_s': wall,
+            'throughput_rps': len(latencies) / wall if wall else 0,
+            'p50_s': statistics.median(latencies),
+            'max_s': max(latencies),
+            'concurrency': len(latencies) * self.run_latency / wall if wall else 0,
+            'errors': errors,
+        }
+
+    def _run_sync(self, pairs, workers):
+        def one(pair):
+            session_key, chat_id = pair
+            client = Client()
+            client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+            start = time.perf_counter()
+            response = client.post('/api/chat/', json.dumps({'message': 'Hello', 'chat_id': chat_id}),
+                                   content_type='application/json')
+            return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(one, pairs))
+        wall = time.perf_counter() - start
+        errors = sum(1 for _, status in outcomes if status != 200)
+        return self._summary([lat for lat, _ in outcomes], wall, errors)
+
+    async def _run_async(self, pairs):
+        async def one(pair):
+            session_key, chat_id = pair
+            client = AsyncClient()
+            client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+            start = time.perf_counter()
+            response = await client.post('/api/chat/async/', json.dumps({'message': 'Hello', 'chat_id': chat_id}),
+                                         content_type='application/json')
+            return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(one(pair) for pair in pairs))
+        wall = time.perf_counter() - start
+        errors = sum(1 for _, status in outcomes if status != 200)
+        return self._summary([lat for lat, _ in outcomes], wall, errors)
@@ -1,107 +1,148 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from openai import OpenAI
 from app.models import Assistant
 from app.modes import MODES
+from app.openai_client import get_client, is_configured
+
+
+ASSISTANT_TOOLS = [{"type": "code_interpreter"}]
+
+
+def assistant_spec(assistant_data):
+    """Definition of a remote assistant, as sent to assistants.create/update."""
+    return {
+        'name': assistant_data['name'],
+        'description': assistant_data['description'],
+        'instructions': assistant_data['system_prompt'],
+        'model': settings.OPENAI_ASSISTANT_MODEL,
+        'tools': ASSISTANT_TOOLS,
+    }
+
+
+def spec_hash(spec):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
 
 
 class Command(BaseCommand):
-    help = 'Create OpenAI assistants for each mode and store them in the database'
+    help = (
+        'Sync OpenAI assistants for each mode and store them in the database. Only entries '
+        'whose definition changed since the last sync are sent, concurrently'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--force',
             action='store_true',
-            help='Force recreation of assistants even if they already exist',
+            help='Update every remote assistant even if its definition is unchanged',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=16,
+            help='Concurrent OpenAI requests',
         )
 
     def handle(self, *args, **options):
-        if not settings.OPENAI_API_KEY:
+        if not is_configured():
             self.stdout.write(
                 self.style.ERROR('OPENAI_API_KEY not found in environment variables')
             )
             return
 
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        force = options['force']
-        
-        created_count = 0
-        updated_count = 0
-        skipped_count = 0
+        existing = {a.mode_id: a for a in Assistant.objects.all()}
 
+        # Plan: (action, mode_key, assistant_data, db_assistant, spec, hash)
+        plan = []
+        skipped_count = 0
         for mode_key, mode_data in MODES.items():
-            self.stdout.write(f'\nProcessing mode: {mode_data["name"]}')
-            
             for assistant_data in mode_data['assistants']:
-                assistant_id = assistant_data['id']
-                name = assistant_data['name']
-                description = assistant_data['description']
-                system_prompt = assistant_data['system_prompt']
-                
-                # Check if assistant already exists in database
-                db_assistant, created = Assistant.objects.get_or_create(
-                    mode_id=assistant_id,
-                    defaults={
-                        'name': name,
-                        'description': description,
-                        'system_prompt': system_prompt,
-                        'mode': mode_key,
-                        'assistant_id': '',  # Will be updated after OpenAI creation
-                    }
-                )
-                
-                if created:
-                    self.stdout.write(f'  Created database record for: {name}')
-                elif force:
-                    # Update existing record
-                    db_assistant.name = name
-                    db_assistant.description = description
-                    db_assistant.system_prompt = system_prompt
-                    db_assistant.mode = mode_key
-                    db_assistant.save()
-                    self.stdout.write(f'  Updated database record for: {name}')
+                spec = assistant_spec(assistant_data)
+                digest = spec_hash(spec)
+                db_assistant = existing.get(assistant_data['id'])
+                if db_assistant is None or not db_assistant.assistant_id:
+                    action = 'create'
+                elif db_assistant.engine == Assistant.ENGINE_CHAT_COMPLETIONS:
+                    # No remote assistant is used; keep the local prompt current
+                    action = 'local' if db_assistant.sync_hash != digest else None
+                elif options['force'] or db_assistant.sync_hash != digest:
+                    action = 'update'
+                else:
+                    action = None
+
+                if action is None:
+                    skipped_count += 1
+                    self.stdout.write(f'  - Skipped: {spec["name"]} (unchanged)')
                 else:
-                    self.stdout.write(f'  Database record already exists for: {name}')
-                
-                # Create or update OpenAI assistant
+                    plan.append((action, mode_key, assistant_data, db_assistant, spec, digest))
+
+        client = get_client()
+
+        def sync(item):
+            action, _, _, db_assistant, spec, _ = item
+            if action == 'local':
+                return db_assistant.assistant_id
+            if action == 'update':
                 try:
-                    if force or not db_assistant.assistant_id:
-                        # Create new OpenAI assistant
-                        openai_assistant = client.beta.assistants.create(
-                            name=name,
-                            description=description,
-                            instructions=system_prompt,
-                            model=settings.OPENAI_ASSISTANT_MODEL,
-                            tools=[{"type": "code_interpreter"}]
-                        )
-                        
-                        # Update database with OpenAI assistant ID
-                        db_assistant.assistant_id = openai_assistant.id
-                        db_assistant.save()
-                        created_count += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(f'  ✓ Created OpenAI assistant: {name} (ID: {openai_assistant.id})')
-                        )
-                    else:
-                        # Assistant already exists in OpenAI
-                        skipped_count += 1
-                        self.stdout.write(f'  - Skipped: {name} (already exists)')
-                        
+                    return client.beta.assistants.update(db_assistant.assistant_id, **spec).id
+                except openai.NotFoundError:
+                    # Deleted remotely; recreate it below
+                    pass
+            return client.beta.assistants.create(**spec).id
+
+        created_count = 0
+        updated_count = 0
+        failed_count = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futures = [(item, pool.submit(sync, item)) for item in plan]
+            for item, future in futures:
+                action, mode_key, assistant_data, db_assistant, spec, digest = item
+                try:
+                    openai_id = future.result()
                 except Exception as e:
+                    failed_count += 1
+                    self.stdout.write(
+                        self.style.ERROR(f'  ✗ Failed to sync assistant {spec["name"]}: {str(e)}')
+                    )
+                    continue
+
+                if db_assistant is None:
+                    db_assistant = Assistant(mode_id=assistant_data['id'])
+                db_assistant.assistant_id = openai_id
+                db_assistant.name = assistant_data['name']
+                db_assistant.description = assistant_data['description']
+                db_assistant.system_prompt = assistant_data['system_prompt']
+                db_assistant.mode = mode_key
+                db_assistant.sync_hash = digest
+                db_assistant.save()
+
+                if action == 'create':
+                    created_count += 1
                     self.stdout.write(
-                        self.style.ERROR(f'  ✗ Failed to create assistant {name}: {str(e)}')
+                        self.style.SUCCESS(f'  ✓ Created OpenAI assistant: {spec["name"]} (ID: {openai_id})')
+                    )
+                else:
+                    updated_count += 1
+                    self.stdout.write(
+                        self.style.SUCCESS(f'  ✓ Updated assistant: {spec["name"]} (ID: {openai_id})')
                     )
 
         self.stdout.write(f'\n{self.style.SUCCESS("Summary:")}')
         self.stdout.write(f'  Created: {created_count}')
         self.stdout.write(f'  Updated: {updated_count}')
         self.stdout.write(f'  Skipped: {skipped_count}')
-        
+        if failed_count:
+            self.stdout.write(f'  Failed: {failed_count}')
+
         if created_count > 0 or updated_count > 0:
             self.stdout.write(
-                self.style.SUCCESS('\n✓ Assistants created successfully!')
+                self.style.SUCCESS('\n✓ Assistants synced successfully!')
             )
         else:
             self.stdout.write(
-                self.style.WARNING('\n- No new assistants were created.')
+                self.style.WARNING('\n- Nothing to sync.')
             )
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app import thread_pool
+from app.openai_client import is_configured
+
+
+class Command(BaseCommand):
+    help = 'Fill the spare-thread pool up to THREAD_POOL_SIZE (e.g. at deploy), so the first new chats do not wait'
+
+    def handle(self, *args, **options):
+        if not is_configured():
+            raise CommandError('OPENAI_API_KEY not found in environment variables')
+        if settings.THREAD_POOL_SIZE <= 0:
+            raise CommandError('The thread pool is disabled (THREAD_POOL_SIZE=0)')
+        added = thread_pool.refill(low_water=settings.THREAD_POOL_SIZE)
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {added} thread(s); {thread_pool.stats()["available"]} spare thread(s) available'
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.chat_merge import merge_duplicates
+from app.models import Chat, ChatJob, ChatMessage
+
+
+class Command(BaseCommand):
+    help = (
+        'Merge duplicate active chats of the same owner and assistant (and their messages) into one '
+        'canonical chat, in batches; run before migrating to the unique-chat constraint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Duplicate groups fetched, and messages moved, per query')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the duplicates')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        def progress(totals):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'{totals["groups"]} group(s): {totals["merged"]} merged, '
+                    f'{totals["deactivated"]} deactivated, {totals["messages"]} message(s) moved'
+                )
+
+        totals = merge_duplicates(
+            Chat, ChatMessage, ChatJob, batch_size=options['batch_size'], dry_run=options['dry_run'],
+            progress=progress,
+        )
+        if options['dry_run']:
+            self.stdout.write(f'{totals["groups"]} duplicate group(s), {totals["merged"]} chat(s) to fold')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'{totals["groups"]} duplicate group(s): merged {totals["merged"]} chat(s) '
+            f'({totals["messages"]} message(s) moved), deactivated {totals["deactivated"]} on other threads'
+        ))
+        if totals['skipped']:
+            self.stdout.write(self.style.WARNING(
+                f'Skipped {totals["skipped"]} group(s) with a run in progress; run again to merge them'
+            ))
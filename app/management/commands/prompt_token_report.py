@@ -0,0 +1,105 @@
+import json
+import statistics
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from app.benchmarks import percentile
+from app.models import Assistant
+from app.openai_client import get_client, is_configured
+
+
+def _summary(values):
+    if not values:
+        return {'runs': 0}
+    values = sorted(values)
+    return {
+        'runs': len(values),
+        'mean': round(statistics.mean(values)),
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': values[-1],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Show the prompt-token distribution of recent thread runs per assistant, split into '
+        'runs before and after a point in time (by default when the assistant\'s limits last changed)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assistant', action='append', dest='assistants', metavar='MODE_ID',
+                            help='Limit the report to these assistants (repeatable)')
+        parser.add_argument('--since', help='Split point as an ISO datetime instead of when each '
+                                            'assistant\'s limits last changed')
+        parser.add_argument('--chats', type=int, default=50, help='Most recent chats sampled per assistant')
+        parser.add_argument('--runs-per-thread', type=int, default=20, help='Most recent runs read per thread')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if not is_configured():
+            raise CommandError('OPENAI_API_KEY not found in environment variables')
+
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f'Invalid --since datetime: {options["since"]}')
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=dt_timezone.utc)
+
+        assistants = Assistant.objects.filter(engine=Assistant.ENGINE_ASSISTANTS)
+        if options['assistants']:
+            assistants = assistants.filter(mode_id__in=options['assistants'])
+
+        client = get_client()
+        report = {}
+        for assistant in assistants:
+            split = since or assistant.limits_changed_at
+            if split is None:
+                self.stderr.write(f'{assistant.mode_id}: limits never changed; pass --since to split its runs')
+                continue
+            thread_ids = list(dict.fromkeys(
+                assistant.chat_set.exclude(thread_id='').order_by('-last_activity')
+                .values_list('thread_id', flat=True)[:options['chats']]
+            ))
+            before, after = [], []
+            for thread_id in thread_ids:
+                try:
+                    runs = client.beta.threads.runs.list(
+                        thread_id=thread_id, order='desc', limit=options['runs_per_thread'],
+                    )
+                except Exception as e:
+                    self.stderr.write(f'{assistant.mode_id}: skipping thread {thread_id}: {e}')
+                    continue
+                for run in runs.data:
+                    if not run.usage:
+                        continue
+                    created = datetime.fromtimestamp(run.created_at, tz=dt_timezone.utc)
+                    (after if created >= split else before).append(run.usage.prompt_tokens)
+
+            report[assistant.mode_id] = {
+                'split_at': split.isoformat(),
+                'limits': assistant.run_limits(),
+                'before': _summary(before),
+                'after': _summary(after),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for mode_id, row in report.items():
+            self.stdout.write(f'\n{mode_id} (split at {row["split_at"]}, limits {row["limits"] or "none"})')
+            for label in ('before', 'after'):
+                s = row[label]
+                if not s['runs']:
+                    self.stdout.write(f'  {label:>6}: no runs')
+                    continue
+                self.stdout.write(
+                    f'  {label:>6}: {s["runs"]} runs, mean {s["mean"]}, p50 {s["p50"]}, '
+                    f'p90 {s["p90"]}, p99 {s["p99"]}, max {s["max"]} prompt tokens'
+                )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import ChatMessage
+from app.rendering import RENDER_VERSION, render_markdown
+
+
+class Command(BaseCommand):
+    help = (
+        'Render stored assistant messages to HTML for the current renderer version, '
+        'in primary-key batches. Safe to interrupt and re-run'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Messages rendered per transaction')
+        parser.add_argument('--force', action='store_true', help='Re-render messages already at the current version')
+
+    def handle(self, *args, **options):
+        queryset = ChatMessage.objects.filter(role='assistant')
+        if not options['force']:
+            queryset = queryset.exclude(render_version=RENDER_VERSION)
+
+        rendered = 0
+        last_id = 0
+        while True:
+            batch = list(
+                queryset.filter(id__gt=last_id).order_by('id')
+                .only('id', 'content')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            for message in batch:
+                message.content_html = render_markdown(message.content)
+                message.render_version = RENDER_VERSION
+            with transaction.atomic():
+                ChatMessage.objects.bulk_update(batch, ['content_html', 'render_version'])
+            rendered += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f'Rendered {rendered} message(s) (up to id {last_id})')
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {rendered} message(s) rendered at version {RENDER_VERSION}'))
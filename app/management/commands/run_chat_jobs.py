@@ -0,0 +1,45 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.jobs import process_job, requeue_stale_jobs
+from app.models import ChatJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Process queued chat jobs from the database. Use it as a dedicated job worker, '
+        'or with --once to recover jobs left behind by a restarted web process'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process what is queued, then exit')
+        parser.add_argument('--min-age', type=float, default=5.0,
+                            help='Only take jobs queued at least this many seconds ago, '
+                                 'leaving fresh ones to the web process pool')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls')
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                self.stdout.write(f'Requeued {requeued} stale job(s)')
+
+            cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+            job_ids = list(
+                ChatJob.objects.filter(status=ChatJob.QUEUED, created_at__lte=cutoff)
+                .order_by('created_at').values_list('id', flat=True)[:100]
+            )
+            for job_id in job_ids:
+                process_job(job_id)
+                processed += 1
+
+            if options['once']:
+                break
+            if not job_ids:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
@@ -0,0 +1,260 @@
+"""
+Chat pipeline metrics in Prometheus text format.
+
+A small in-process registry of counters, gauges and histograms with labels,
+served by the ``/metrics`` view. Recording is a dict lookup plus a short lock,
+so it can sit on every phase of a chat turn. Values are per process: scrape
+each worker, or run a single ASGI worker per container.
+
+Phases of a turn (``chat_phase_seconds``):
+
+* ``admission``: rate limit and run-slot checks
+* ``intake``: storing the user message
+* ``queue_wait``: waiting for the chat's run lease (other runs on the chat)
+* ``claim``: taking the lease and claiming pending messages
+* ``run``: creating the run and polling it to completion (or the completion call)
+* ``messages_list``: fetching the reply from the thread
+* ``complete``: storing the reply and settling the batch
+
+Individual OpenAI HTTP calls (run create, each poll, messages list) are timed
+separately in ``openai_request_seconds`` by the client's httpx hooks.
+"""
+import asyncio
+import bisect
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        _registry.append(self)
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    @contextmanager
+    def track_in_progress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def _render_child(self, values, child):
+        return [f'{self.name}_total{self._label_text(values)} {_format_value(child.value)}']
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{self._label_text(values)} {_format_value(child.value)}']
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """``with histogram.time():`` without the cost of a generator context manager."""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = self._label_text(values, [('le', _format_value(float(bound)))])
+            lines.append(f'{self.name}_bucket{le} {cumulative}')
+        lines.append(f'{self.name}_sum{self._label_text(values)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{self._label_text(values)} {cumulative}')
+        return lines
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Chat pipeline metrics --------------------------------------------------------------
+
+REQUEST_SECONDS = Histogram(
+    'chat_request_seconds', 'Time to produce the chat API response', ['view', 'status'],
+)
+REQUESTS_IN_FLIGHT = Gauge('chat_requests_in_flight', 'Chat API requests being handled', ['view'])
+PHASE_SECONDS = Histogram('chat_phase_seconds', 'Time spent in each phase of a chat turn', ['phase', 'assistant'])
+RUNS_IN_FLIGHT = Gauge('assistant_runs_in_flight', 'Assistant runs currently executing', ['assistant'])
+RUNS = Counter('assistant_runs', 'Assistant runs by final status', ['assistant', 'status'])
+OPENAI_ERRORS = Counter('openai_errors', 'Errors raised by OpenAI calls', ['assistant', 'error'])
+OPENAI_REQUEST_SECONDS = Histogram(
+    'openai_request_seconds', 'OpenAI HTTP request latency until response headers', ['endpoint', 'status'],
+)
+
+
+def phase(name, assistant):
+    """Context manager timing one phase of a turn."""
+    return PHASE_SECONDS.labels(name, assistant).time()
+
+
+_ID_SEGMENT = re.compile(r'/(?:thread|run|msg|asst|step|chatcmpl)_[^/]+')
+
+
+def endpoint_label(method, path):
+    """``POST /v1/threads/{id}/runs`` style label for an OpenAI request path."""
+    return f'{method} {_ID_SEGMENT.sub("/{id}", path)}'
+
+
+def observe_phase(name, assistant, seconds):
+    PHASE_SECONDS.labels(name, assistant).observe(seconds)
+
+
+def record_error(assistant, exc):
+    OPENAI_ERRORS.labels(assistant, type(exc).__name__).inc()
+
+
+def instrumented(name):
+    """View decorator: request latency by status and requests in flight.
+
+    For streaming responses the latency is the time until the response
+    starts, not until the stream ends (see ``chat_phase_seconds`` for that).
+    """
+    def decorator(view):
+        in_flight = REQUESTS_IN_FLIGHT.labels(name)
+
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                start = time.perf_counter()
+                status = 500
+                with in_flight.track_in_progress():
+                    try:
+                        response = await view(request, *args, **kwargs)
+                        status = response.status_code
+                        return response
+                    finally:
+                        REQUEST_SECONDS.labels(name, status).observe(time.perf_counter() - start)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                start = time.perf_counter()
+                status = 500
+                with in_flight.track_in_progress():
+                    try:
+                        response = view(request, *args, **kwargs)
+                        status = response.status_code
+                        return response
+                    finally:
+                        REQUEST_SECONDS.labels(name, status).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_alter_chat_thread_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='run_lock_expires_at',
+            field=models.DateTimeField(blank=True, help_text='When the active run lock lapses', null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='run_lock_token',
+            field=models.CharField(blank=True, default='', help_text='Owner of the active run lock', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='run_error',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='run_state',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_chatmessage_unsynced_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assistant',
+            name='engine',
+            field=models.CharField(choices=[('assistants', 'Assistants API (OpenAI thread runs)'), ('chat_completions', 'Chat Completions (local history)')], default='assistants', help_text='How replies are generated', max_length=20),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:04
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_assistant_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assistant',
+            name='max_completion_tokens',
+            field=models.PositiveIntegerField(blank=True, help_text='Upper bound on completion tokens per run', null=True, validators=[django.core.validators.MinValueValidator(256)]),
+        ),
+        migrations.AddField(
+            model_name='assistant',
+            name='max_prompt_tokens',
+            field=models.PositiveIntegerField(blank=True, help_text='Upper bound on prompt tokens per run', null=True, validators=[django.core.validators.MinValueValidator(256)]),
+        ),
+        migrations.AddField(
+            model_name='assistant',
+            name='truncation_last_messages',
+            field=models.PositiveIntegerField(blank=True, help_text='Only send the last N thread messages to the model', null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_assistant_run_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assistant',
+            name='sync_hash',
+            field=models.CharField(blank=True, help_text='Hash of the definition last synced to OpenAI', max_length=64),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_chatmessage_content_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='<mode>:<user or session>', max_length=150, unique=True)),
+                ('tokens', models.FloatField(help_text='Tokens left at refilled_at')),
+                ('refilled_at', models.FloatField(help_text='Epoch seconds of the last refill')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RunSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(help_text="'global', 'queue' or 'mode:<mode>'", max_length=50)),
+                ('slot', models.PositiveIntegerField()),
+                ('token', models.CharField(blank=True, default='', help_text='Holder of the slot', max_length=32)),
+                ('expires_at', models.DateTimeField(blank=True, help_text='When the lease lapses', null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'slot'), name='unique_run_slot')],
+            },
+        ),
+    ]
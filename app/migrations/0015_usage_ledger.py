@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_admission_control'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='completion_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='model',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='prompt_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='OwnerUsageDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(help_text='user:<id> or session:<key>', max_length=60)),
+                ('day', models.DateField()),
+                ('turns', models.PositiveIntegerField(default=0, help_text='Replies produced')),
+                ('prompt_tokens', models.PositiveBigIntegerField(default=0)),
+                ('completion_tokens', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'owner usage (daily)',
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'day'), name='unique_owner_usage_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AssistantUsageDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('model', models.CharField(blank=True, default='', max_length=100)),
+                ('turns', models.PositiveIntegerField(default=0, help_text='Replies produced')),
+                ('prompt_tokens', models.PositiveBigIntegerField(default=0)),
+                ('completion_tokens', models.PositiveBigIntegerField(default=0)),
+                ('assistant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_days', to='app.assistant')),
+            ],
+            options={
+                'verbose_name_plural': 'assistant usage (daily)',
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('assistant', 'day', 'model'), name='unique_assistant_usage_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from app.chat_merge import merge_duplicates
+
+
+def merge(apps, schema_editor):
+    # Usually a no-op: on large tables run `manage.py merge_duplicate_chats`
+    # before migrating, so this does not hold up the deploy. Groups that
+    # command skipped for a run in progress are merged anyway, since 0018
+    # cannot add the constraint while any duplicate is left
+    merge_duplicates(
+        apps.get_model('app', 'Chat'), apps.get_model('app', 'ChatMessage'), apps.get_model('app', 'ChatJob'),
+        force=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_spare_thread_pool'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge, migrations.RunPython.noop),
+    ]
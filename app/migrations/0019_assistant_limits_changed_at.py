@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_chat_unique_active_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assistant',
+            name='limits_changed_at',
+            field=models.DateTimeField(blank=True, help_text='When the context-window limits last changed', null=True),
+        ),
+    ]
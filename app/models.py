@@ -1,3 +1,6 @@
+import uuid
+
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -5,12 +8,39 @@ from django.utils import timezone
 
 class Assistant(models.Model):
     """Stores OpenAI assistant configurations"""
+    ENGINE_ASSISTANTS = 'assistants'
+    ENGINE_CHAT_COMPLETIONS = 'chat_completions'
+    ENGINES = [
+        (ENGINE_ASSISTANTS, 'Assistants API (OpenAI thread runs)'),
+        (ENGINE_CHAT_COMPLETIONS, 'Chat Completions (local history)'),
+    ]
+
     mode_id = models.CharField(max_length=255, unique=True, default='', help_text="Mode identifier (e.g., teacher_tutor)")
     assistant_id = models.CharField(max_length=255, unique=True, help_text="OpenAI assistant ID")
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     system_prompt = models.TextField()
     mode = models.CharField(max_length=50, help_text="Mode category (professional, personal, creative)")
+    engine = models.CharField(max_length=20, choices=ENGINES, default=ENGINE_ASSISTANTS, help_text="How replies are generated")
+    sync_hash = models.CharField(max_length=64, blank=True, help_text="Hash of the definition last synced to OpenAI")
+
+    # Context-window limits applied to every run (blank = no limit)
+    truncation_last_messages = models.PositiveIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(1)],
+        help_text="Only send the last N thread messages to the model",
+    )
+    max_prompt_tokens = models.PositiveIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(256)],
+        help_text="Upper bound on prompt tokens per run",
+    )
+    max_completion_tokens = models.PositiveIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(256)],
+        help_text="Upper bound on completion tokens per run",
+    )
+    LIMIT_FIELDS = ['truncation_last_messages', 'max_prompt_tokens', 'max_completion_tokens']
+    # Set by save() when a limit changes (updated_at also moves on every sync),
+    # so prompt_token_report can compare runs before and after it
+    limits_changed_at = models.DateTimeField(null=True, blank=True, help_text="When the context-window limits last changed")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -20,6 +50,38 @@ class Assistant(models.Model):
     def __str__(self):
         return f"{self.name} ({self.mode})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_limits = {f: instance.__dict__[f] for f in cls.LIMIT_FIELDS if f in instance.__dict__}
+        return instance
+
+    def _limits_changed(self):
+        if self._state.adding:
+            return any(getattr(self, f) for f in self.LIMIT_FIELDS)
+        return any(self.__dict__.get(f) != value for f, value in getattr(self, '_loaded_limits', {}).items())
+
+    def save(self, *args, **kwargs):
+        if self._limits_changed():
+            self.limits_changed_at = timezone.now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'limits_changed_at'}
+        super().save(*args, **kwargs)
+        self._loaded_limits = {f: self.__dict__[f] for f in self.LIMIT_FIELDS if f in self.__dict__}
+
+    def run_limits(self):
+        """Keyword arguments for ``runs.create`` carrying the configured limits."""
+        limits = {}
+        if self.truncation_last_messages:
+            limits['truncation_strategy'] = {
+                'type': 'last_messages', 'last_messages': self.truncation_last_messages,
+            }
+        if self.max_prompt_tokens:
+            limits['max_prompt_tokens'] = self.max_prompt_tokens
+        if self.max_completion_tokens:
+            limits['max_completion_tokens'] = self.max_completion_tokens
+        return limits
+
 
 class Chat(models.Model):
     """Stores chat sessions with assistants"""
@@ -42,6 +104,10 @@ class Chat(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     last_activity = models.DateTimeField(default=timezone.now)
 
+    # Cross-process lease serializing assistant runs on this chat's thread
+    run_lock_token = models.CharField(max_length=32, blank=True, default='', help_text="Owner of the active run lock")
+    run_lock_expires_at = models.DateTimeField(null=True, blank=True, help_text="When the active run lock lapses")
+
     class Meta:
         ordering = ['-last_activity']
         indexes = [
@@ -50,6 +116,17 @@ class Chat(models.Model):
             models.Index(fields=['last_activity']),
             models.Index(fields=['is_active']),
         ]
+        # One active chat per owner and assistant; create_chat gets or creates it
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'assistant'], condition=models.Q(is_active=True, user__isnull=False),
+                name='unique_active_user_assistant',
+            ),
+            models.UniqueConstraint(
+                fields=['session_key', 'assistant'], condition=models.Q(is_active=True, session_key__isnull=False),
+                name='unique_active_session_assistant',
+            ),
+        ]
 
     def __str__(self):
         if self.user:
@@ -74,9 +151,34 @@ class Chat(models.Model):
 
 class ChatMessage(models.Model):
     """Stores individual messages in a chat"""
+    RUN_PENDING = 'pending'
+    RUN_RUNNING = 'running'
+    RUN_DONE = 'done'
+    RUN_FAILED = 'failed'
+    # Stored locally (e.g. served from the reply cache) but not yet on the
+    # OpenAI thread; sent along with the next run
+    RUN_UNSYNCED = 'unsynced'
+    RUN_STATES = [
+        (RUN_PENDING, 'Pending'),
+        (RUN_RUNNING, 'Running'),
+        (RUN_DONE, 'Done'),
+        (RUN_FAILED, 'Failed'),
+        (RUN_UNSYNCED, 'Unsynced'),
+    ]
+
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     role = models.CharField(max_length=20, choices=[('user', 'User'), ('assistant', 'Assistant')])
     content = models.TextField()
+    # Progress of a user message through the chat's run queue
+    run_state = models.CharField(max_length=10, choices=RUN_STATES, blank=True, default='')
+    run_error = models.CharField(max_length=255, blank=True, default='')
+    # Assistant content rendered to HTML, and the renderer version that produced it
+    content_html = models.TextField(blank=True, default='')
+    render_version = models.PositiveSmallIntegerField(default=0)
+    # Model and token usage of the run that produced an assistant message
+    model = models.CharField(max_length=100, blank=True, default='')
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -87,3 +189,110 @@ class ChatMessage(models.Model):
 
     def __str__(self):
         return f"{self.role}: {self.content[:50]}... ({self.chat})"
+
+
+class ChatJob(models.Model):
+    """Tracks a chat turn processed in the background (job mode of the chat API)"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='jobs')
+    message = models.OneToOneField(ChatMessage, on_delete=models.CASCADE, related_name='job', help_text="User message this job answers")
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    reply = models.TextField(blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+
+class RateBucket(models.Model):
+    """Token bucket of one client for one mode (admission control)"""
+    key = models.CharField(max_length=150, unique=True, help_text="<mode>:<user or session>")
+    tokens = models.FloatField(help_text="Tokens left at refilled_at")
+    refilled_at = models.FloatField(help_text="Epoch seconds of the last refill")
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.1f}"
+
+
+class RunSlot(models.Model):
+    """One unit of run capacity, held as a lease (admission control)"""
+    scope = models.CharField(max_length=50, help_text="'global', 'queue' or 'mode:<mode>'")
+    slot = models.PositiveIntegerField()
+    token = models.CharField(max_length=32, blank=True, default='', help_text="Holder of the slot")
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="When the lease lapses")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'slot'], name='unique_run_slot'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}#{self.slot}"
+
+
+class SpareThread(models.Model):
+    """A pre-created, unused OpenAI thread waiting to be handed to a new chat"""
+    thread_id = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.thread_id
+
+
+class AssistantUsageDaily(models.Model):
+    """Token usage of one assistant and model on one day, bumped with every run"""
+    assistant = models.ForeignKey(Assistant, on_delete=models.CASCADE, related_name='usage_days')
+    day = models.DateField()
+    model = models.CharField(max_length=100, blank=True, default='')
+    turns = models.PositiveIntegerField(default=0, help_text="Replies produced")
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name_plural = 'assistant usage (daily)'
+        constraints = [
+            models.UniqueConstraint(fields=['assistant', 'day', 'model'], name='unique_assistant_usage_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.assistant_id} {self.model} {self.day}"
+
+
+class OwnerUsageDaily(models.Model):
+    """Token usage of one user or anonymous session on one day, bumped with every run"""
+    owner = models.CharField(max_length=60, help_text="user:<id> or session:<key>")
+    day = models.DateField()
+    turns = models.PositiveIntegerField(default=0, help_text="Replies produced")
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name_plural = 'owner usage (daily)'
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'day'], name='unique_owner_usage_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner} {self.day}"
@@ -1,3 +1,5 @@
+import hashlib
+import json
 from typing import Dict, List, Any
 
 
@@ -383,6 +385,31 @@ def list_modes() -> Dict[str, Any]:
     return MODES
 
 
+def catalog() -> Dict[str, Any]:
+    """Compact projection of MODES for the UI: names and descriptions, no prompts."""
+    return {
+        mode_key: {
+            'name': mode['name'],
+            'assistants': [
+                {'id': a['id'], 'name': a['name'], 'description': a['description']}
+                for a in mode['assistants']
+            ],
+        }
+        for mode_key, mode in MODES.items()
+    }
+
+
+def _escape_for_script(text: str) -> str:
+    # Same escaping as Django's json_script, so the JSON is safe inside <script>
+    return text.replace('<', '\\u003C').replace('>', '\\u003E').replace('&', '\\u0026')
+
+
+# Serialized once at import: the catalog only changes with a deploy.
+CATALOG_JSON: str = json.dumps({'modes': catalog()}, separators=(',', ':'))
+CATALOG_ETAG: str = '"' + hashlib.sha256(CATALOG_JSON.encode('utf-8')).hexdigest()[:32] + '"'
+CATALOG_SCRIPT_JSON: str = _escape_for_script(CATALOG_JSON)
+
+
 def get_assistant_prompt(assistant_id: str) -> str:
     for mode_key, mode in MODES.items():
         for a in mode['assistants']:
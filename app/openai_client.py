@@ -0,0 +1,190 @@
+"""
+Process-wide OpenAI clients.
+
+Building ``OpenAI(...)`` per request creates a fresh httpx connection pool, so
+every call pays a new TCP/TLS handshake. ``get_client`` and
+``get_async_client`` instead hand out one lazily created client per process
+(and per event loop for the async client) whose keep-alive pool is shared by
+all views and management commands.
+
+Forked workers get their own client: the cached one is discarded when the
+process id changes, so sockets are never shared across processes.
+
+``LLM_BACKEND`` selects what these functions return: ``'openai'`` (the SDK
+clients above) or ``'stub'``, the in-process stand-in from
+``app/stub_backend.py`` that serves the same calls without the network.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+import httpx
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from openai import AsyncOpenAI, OpenAI
+
+from . import metrics
+
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_pid = None
+
+# Connection pool counters: a "hit" is a request served on an already open
+# keep-alive connection, a "miss" one that had to open a new connection.
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _record(new_connection):
+    with _stats_lock:
+        _stats['misses' if new_connection else 'hits'] += 1
+
+
+def pool_stats():
+    """Return a snapshot of the connection pool hit/miss counters."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / total if total else None
+    return stats
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=settings.OPENAI_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.OPENAI_POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout():
+    return httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
+
+
+def _is_connect_event(name):
+    return name.startswith('connection.connect_') and name.endswith('.started')
+
+
+def _on_request(request):
+    state = request.extensions['pool_state'] = {'new_connection': False, 'started': time.perf_counter()}
+
+    def trace(name, info):
+        if _is_connect_event(name):
+            state['new_connection'] = True
+
+    request.extensions['trace'] = trace
+
+
+def _on_response(response):
+    state = response.request.extensions.get('pool_state')
+    if state is not None:
+        _record(state['new_connection'])
+        # One sample per HTTP call: run create, each poll, messages list...
+        request = response.request
+        metrics.OPENAI_REQUEST_SECONDS.labels(
+            metrics.endpoint_label(request.method, request.url.path), response.status_code,
+        ).observe(time.perf_counter() - state['started'])
+
+
+async def _aon_request(request):
+    state = request.extensions['pool_state'] = {'new_connection': False, 'started': time.perf_counter()}
+
+    async def trace(name, info):
+        if _is_connect_event(name):
+            state['new_connection'] = True
+
+    request.extensions['trace'] = trace
+
+
+async def _aon_response(response):
+    _on_response(response)
+
+
+def _client_kwargs():
+    return {
+        'api_key': settings.OPENAI_API_KEY,
+        'base_url': settings.OPENAI_BASE_URL,
+        'max_retries': settings.OPENAI_MAX_RETRIES,
+        'timeout': _timeout(),
+    }
+
+
+BACKENDS = ('openai', 'stub')
+
+
+def _use_stub():
+    if settings.LLM_BACKEND not in BACKENDS:
+        raise ImproperlyConfigured(f'LLM_BACKEND must be one of {", ".join(BACKENDS)}, not {settings.LLM_BACKEND!r}')
+    return settings.LLM_BACKEND == 'stub'
+
+
+def is_configured():
+    """Whether the selected backend can serve requests (the stub needs no API key)."""
+    return _use_stub() or bool(settings.OPENAI_API_KEY)
+
+
+def get_client():
+    """Return the shared sync OpenAI client, creating it on first use."""
+    global _client, _client_pid
+    if _use_stub():
+        from . import stub_backend
+        return stub_backend.client
+    pid = os.getpid()
+    client = _client
+    if client is not None and _client_pid == pid:
+        return client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            http_client = httpx.Client(
+                limits=_limits(),
+                timeout=_timeout(),
+                event_hooks={'request': [_on_request], 'response': [_on_response]},
+            )
+            _client = OpenAI(http_client=http_client, **_client_kwargs())
+            _client_pid = pid
+        return _client
+
+
+def get_async_client():
+    """Return the shared AsyncOpenAI client for the running event loop.
+
+    httpx async pools are bound to the loop they were created on, so one
+    client is kept per loop (an ASGI worker normally runs exactly one).
+    """
+    global _async_clients_pid
+    if _use_stub():
+        from . import stub_backend
+        return stub_backend.async_client
+    loop = asyncio.get_running_loop()
+    pid = os.getpid()
+    with _lock:
+        if _async_clients_pid != pid:
+            _async_clients.clear()
+            _async_clients_pid = pid
+        client = _async_clients.get(loop)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=_limits(),
+                timeout=_timeout(),
+                event_hooks={'request': [_aon_request], 'response': [_aon_response]},
+            )
+            client = AsyncOpenAI(http_client=http_client, **_client_kwargs())
+            _async_clients[loop] = client
+        return client
+
+
+def reset_clients():
+    """Drop cached clients so the next call picks up changed settings."""
+    global _client, _client_pid
+    with _lock:
+        _client = None
+        _client_pid = None
+        _async_clients.clear()
+    with _stats_lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
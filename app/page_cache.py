@@ -0,0 +1,69 @@
+"""
+Rendered page cache for the modes page and the chat shell.
+
+The modes page is cached whole and served with ETag/Last-Modified; the
+static parts of the chat page are cached as template fragments keyed by
+assistant. Every entry is keyed by ``page_version()``, which changes when:
+
+* an ``Assistant`` row is saved or deleted (the latest ``updated_at`` and
+  the row count, read from the database so every process agrees), or
+* ``MODES``, the templates or the avatar manifest change (their digests are
+  part of the version).
+
+So entries are never invalidated one by one; they just stop being used.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
+from django.template.loader import get_template
+
+from .avatars import load_manifest
+from .models import Assistant
+from .modes import CATALOG_ETAG
+
+
+CACHED_TEMPLATES = ('modes.html', 'chat.html')
+
+_template_digest = None
+
+
+def _cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def _templates_digest():
+    global _template_digest
+    if _template_digest is None:
+        digest = hashlib.sha256()
+        for name in CACHED_TEMPLATES:
+            digest.update(get_template(name).template.source.encode('utf-8'))
+        _template_digest = digest.hexdigest()[:16]
+    return _template_digest
+
+
+def assistants_state():
+    """Latest Assistant change and row count; a delete lowers the count."""
+    state = Assistant.objects.aggregate(changed=Max('updated_at'), count=Count('id'))
+    return f'{state["changed"] and state["changed"].isoformat()}:{state["count"]}'
+
+
+def _avatars_digest():
+    manifest = json.dumps(load_manifest(), sort_keys=True)
+    return hashlib.sha256(manifest.encode('utf-8')).hexdigest()[:16]
+
+
+def page_version():
+    raw = f'{assistants_state()}:{CATALOG_ETAG}:{_templates_digest()}:{_avatars_digest()}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:20]
+
+
+def get_page(name, version):
+    """Return ``(html, rendered_at)`` for a cached page, or None."""
+    return _cache().get(f'pages:{name}:{version}')
+
+
+def set_page(name, version, html, rendered_at):
+    _cache().set(f'pages:{name}:{version}', (html, rendered_at), timeout=settings.PAGE_CACHE_TIMEOUT)
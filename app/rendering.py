@@ -0,0 +1,58 @@
+"""
+Server-side rendering of assistant messages.
+
+Assistant replies use a small markdown subset (``**bold**``, ``###``/``####``
+headings, blank-line paragraphs), matching ``renderAssistantHtml`` in
+``chat.html``. Text is escaped before any markup is added, so the output is
+safe to insert as HTML.
+
+The HTML is rendered once per message and stored in ``content_html`` with
+``render_version``. Bump ``RENDER_VERSION`` when the renderer changes; stale
+rows are re-rendered lazily when displayed, or in bulk with
+``python manage.py render_messages``.
+"""
+import re
+
+from django.utils.html import escape
+
+from .models import ChatMessage
+
+
+RENDER_VERSION = 1
+
+_BOLD = re.compile(r'\*\*(.+?)\*\*')
+_HEADING = re.compile(r'^#{3,4}\s+')
+_HEADING_BLOCK = re.compile(r'^<h3[\s\S]*</h3>$')
+
+
+def render_markdown(text):
+    """Render an assistant message to HTML."""
+    escaped = _BOLD.sub(r'<strong>\1</strong>', escape(text))
+    lines = []
+    for line in escaped.split('\n'):
+        if _HEADING.match(line):
+            line = f'<h3 class="text-lg font-semibold mt-4">{_HEADING.sub("", line)}</h3>'
+        lines.append(line)
+    blocks = re.split(r'\n{2,}', '\n'.join(lines))
+    return ''.join(
+        block if _HEADING_BLOCK.match(block.strip()) else f'<p>{block}</p>'
+        for block in blocks
+    )
+
+
+def rendered_fields(role, content):
+    """``content_html``/``render_version`` values for a new message."""
+    if role != 'assistant':
+        return {}
+    return {'content_html': render_markdown(content), 'render_version': RENDER_VERSION}
+
+
+def ensure_rendered(messages):
+    """Render assistant messages whose stored HTML is missing or stale, in one UPDATE."""
+    stale = [m for m in messages if m.role == 'assistant' and m.render_version != RENDER_VERSION]
+    for message in stale:
+        message.content_html = render_markdown(message.content)
+        message.render_version = RENDER_VERSION
+    if stale:
+        ChatMessage.objects.bulk_update(stale, ['content_html', 'render_version'])
+    return messages
@@ -0,0 +1,52 @@
+"""
+Exact-match cache for first-turn replies.
+
+Many chats open with the same question ("What can you do?"). When
+``REPLY_CACHE_ENABLED`` is set, the reply to a chat's first message is cached
+under the assistant's ``mode_id``, a hash of its ``system_prompt`` (so editing
+the prompt invalidates old replies) and the normalized message text. Storage
+goes through Django's cache framework (``REPLY_CACHE_ALIAS``); the default
+local-memory backend gives TTL expiry and LRU eviction at ``MAX_ENTRIES``.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def normalize(text):
+    """Case- and whitespace-insensitive form of a message, ignoring trailing punctuation."""
+    return ' '.join(text.casefold().split()).rstrip(' ?!.')
+
+
+def prompt_version(assistant):
+    return hashlib.sha256(assistant.system_prompt.encode('utf-8')).hexdigest()[:16]
+
+
+def cache_key(assistant, text):
+    raw = '\0'.join([assistant.mode_id, prompt_version(assistant), normalize(text)])
+    return 'reply:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def get_reply(assistant, text):
+    """Return the cached first-turn reply for ``text``, or None."""
+    if not settings.REPLY_CACHE_ENABLED:
+        return None
+    return caches[settings.REPLY_CACHE_ALIAS].get(cache_key(assistant, text))
+
+
+def store_reply(assistant, text, reply):
+    if settings.REPLY_CACHE_ENABLED and reply:
+        caches[settings.REPLY_CACHE_ALIAS].set(cache_key(assistant, text), reply, settings.REPLY_CACHE_TTL)
+
+
+async def aget_reply(assistant, text):
+    """Async version of get_reply."""
+    if not settings.REPLY_CACHE_ENABLED:
+        return None
+    return await caches[settings.REPLY_CACHE_ALIAS].aget(cache_key(assistant, text))
+
+
+async def astore_reply(assistant, text, reply):
+    if settings.REPLY_CACHE_ENABLED and reply:
+        await caches[settings.REPLY_CACHE_ALIAS].aset(cache_key(assistant, text), reply, settings.REPLY_CACHE_TTL)
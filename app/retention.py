@@ -0,0 +1,252 @@
+"""
+Retention: archive and delete chats nobody will open again.
+
+Chats selected (by ``last_activity`` age, with a fixed ``now`` per pass):
+
+* anonymous chats idle for ``CHAT_RETENTION_DAYS``, or whose session has
+  expired or is gone (no one holds the key to them any more)
+* archived chats (``is_active=False``) idle for ``CHAT_RETENTION_DAYS``
+* signed-in users' active chats idle for ``USER_CHAT_RETENTION_DAYS``
+  (0, the default, keeps them)
+
+They are read in keyset batches (``id > last id``), each batch written with
+its messages as one gzip member appended to ``chats-<date>.jsonl.gz`` in
+``CHAT_ARCHIVE_DIR`` (one JSON object per chat and line; concatenated members
+read back as one file) and fsynced, and only then deleted, messages in
+bounded transactions first. Chats with a run in progress are skipped.
+
+A state file next to the archives records the size of the archive about to be
+appended to, then the ids of the batch being deleted. After an interruption,
+the next pass truncates a partly written member, finishes the pending deletes
+(those chats are already archived) and resumes after the last id. Between
+batches the pass sleeps so it is busy only ``duty_cycle`` of the time, and can
+run at peak traffic.
+
+Expired ``django_session`` rows, and admission buckets that have refilled to
+full, are deleted in the same pass, in batches.
+"""
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .admission import idle_buckets
+from .models import Chat, ChatJob, ChatMessage, RateBucket
+
+
+STATE_FILE = 'archive_chats.state.json'
+
+# Sessions stored in django_session, so expired ones can be found with a query
+DB_SESSION_ENGINES = ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db')
+
+# An anonymous chat whose session is gone is kept this long, so a request
+# still in flight under the old key is not affected
+ORPHAN_GRACE = timedelta(hours=1)
+
+MESSAGE_FIELDS = ['chat_id', 'role', 'content', 'run_state', 'model', 'prompt_tokens', 'completion_tokens', 'created_at']
+
+
+def _db_sessions():
+    return settings.SESSION_ENGINE in DB_SESSION_ENGINES
+
+
+def selection(now):
+    """Q of the chats to archive as of ``now``."""
+    cutoff = now - timedelta(days=settings.CHAT_RETENTION_DAYS)
+    anonymous = Q(last_activity__lt=cutoff)
+    if _db_sessions():
+        live_session = Session.objects.filter(session_key=OuterRef('session_key'), expire_date__gte=now)
+        anonymous |= Q(last_activity__lt=now - ORPHAN_GRACE) & ~Exists(live_session)
+    selected = (Q(user__isnull=True) & anonymous) | Q(is_active=False, last_activity__lt=cutoff)
+    if settings.USER_CHAT_RETENTION_DAYS > 0:
+        selected |= Q(user__isnull=False, last_activity__lt=now - timedelta(days=settings.USER_CHAT_RETENTION_DAYS))
+    return selected
+
+
+# State ----------------------------------------------------------------------------
+
+def _state_path(archive_dir):
+    return os.path.join(archive_dir, STATE_FILE)
+
+
+def _load_state(archive_dir):
+    try:
+        with open(_state_path(archive_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_state(archive_dir, state):
+    path = _state_path(archive_dir)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _recover(archive_dir, state):
+    """Cut a partly written member off the archive; return ids archived but not yet deleted."""
+    if state.get('file'):
+        path = os.path.join(archive_dir, state['file'])
+        if os.path.exists(path) and os.path.getsize(path) > state['size']:
+            os.truncate(path, state['size'])
+    return state.get('pending', [])
+
+
+# Batches --------------------------------------------------------------------------
+
+def _records(chats):
+    messages = {chat.id: [] for chat in chats}
+    rows = (
+        ChatMessage.objects.filter(chat_id__in=list(messages)).order_by('chat_id', 'created_at', 'id')
+        .values(*MESSAGE_FIELDS)
+    )
+    for row in rows.iterator(chunk_size=2000):
+        messages[row.pop('chat_id')].append(row)
+    for chat in chats:
+        yield {
+            'id': chat.id,
+            'assistant': chat.assistant.mode_id,
+            'user_id': chat.user_id,
+            'session_key': chat.session_key,
+            'thread_id': chat.thread_id,
+            'title': chat.title,
+            'is_active': chat.is_active,
+            'created_at': chat.created_at,
+            'last_activity': chat.last_activity,
+            'messages': messages[chat.id],
+        }
+
+
+def _append(path, records):
+    """Append records as one gzip member and fsync; return the new file size."""
+    data = ''.join(json.dumps(record, cls=DjangoJSONEncoder) + '\n' for record in records).encode()
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as member:
+            member.write(data)
+        raw.flush()
+        os.fsync(raw.fileno())
+        return raw.tell()
+
+
+def _delete(chat_ids, now, batch_size):
+    """Delete archived chats that still qualify; return (chats, messages) deleted."""
+    # Re-checked: a chat used again since it was read stays (its archived copy is just stale)
+    chat_ids = list(
+        Chat.objects.filter(selection(now), id__in=chat_ids).exclude(run_lock_expires_at__gt=timezone.now())
+        .values_list('id', flat=True)
+    )
+    messages = 0
+    while True:
+        ids = list(ChatMessage.objects.filter(chat_id__in=chat_ids).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            ChatJob.objects.filter(message_id__in=ids).delete()
+            messages += ChatMessage.objects.filter(id__in=ids).delete()[1].get(ChatMessage._meta.label, 0)
+    with transaction.atomic():
+        ChatJob.objects.filter(chat_id__in=chat_ids).delete()
+        chats = Chat.objects.filter(id__in=chat_ids).delete()[1].get(Chat._meta.label, 0)
+    return chats, messages
+
+
+def _throttle(started, duty_cycle):
+    if 0 < duty_cycle < 1:
+        time.sleep((time.monotonic() - started) * (1 - duty_cycle) / duty_cycle)
+
+
+def clear_expired_sessions(now, batch_size, duty_cycle=1.0):
+    """Delete expired sessions in batches; return how many were deleted (None if not countable)."""
+    if not _db_sessions():
+        import_module(settings.SESSION_ENGINE).SessionStore.clear_expired()
+        return None
+    deleted = 0
+    while True:
+        started = time.monotonic()
+        keys = list(Session.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+        _throttle(started, duty_cycle)
+
+
+def clear_idle_buckets(batch_size, duty_cycle=1.0):
+    """Delete full, idle rate buckets in batches; return how many were deleted."""
+    deleted = 0
+    while True:
+        started = time.monotonic()
+        ids = list(idle_buckets().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += RateBucket.objects.filter(id__in=ids).delete()[0]
+        _throttle(started, duty_cycle)
+
+
+def archive(batch_size=200, duty_cycle=0.5, time_limit=None, dry_run=False, progress=None):
+    """Run one retention pass; return totals. ``progress`` is called with the totals after each batch."""
+    now = timezone.now()
+    selected = Chat.objects.filter(selection(now))
+    if dry_run:
+        sessions = Session.objects.filter(expire_date__lt=now).count() if _db_sessions() else None
+        return {'chats': selected.count(), 'messages': ChatMessage.objects.filter(chat__in=selected).count(),
+                'sessions': sessions, 'buckets': idle_buckets().count()}
+
+    archive_dir = settings.CHAT_ARCHIVE_DIR
+    os.makedirs(archive_dir, exist_ok=True)
+    state = _load_state(archive_dir)
+    totals = {'chats': 0, 'messages': 0, 'skipped': 0, 'sessions': 0, 'buckets': 0, 'file': '', 'finished': False}
+    pending = _recover(archive_dir, state)
+    if pending:
+        chats, messages = _delete(pending, now, batch_size)
+        totals['chats'] += chats
+        totals['messages'] += messages
+    last_id = state.get('last_id', 0)
+    deadline = time.monotonic() + time_limit if time_limit else None
+
+    while True:
+        started = time.monotonic()
+        batch = list(selected.filter(id__gt=last_id).select_related('assistant').order_by('id')[:batch_size])
+        if not batch:
+            totals['finished'] = True
+            last_id = 0
+            break
+        resume_id, last_id = last_id, batch[-1].id
+        chats = [chat for chat in batch if not (chat.run_lock_expires_at and chat.run_lock_expires_at > now)]
+        totals['skipped'] += len(batch) - len(chats)
+        if chats:
+            name = f'chats-{timezone.localdate().isoformat()}.jsonl.gz'
+            path = os.path.join(archive_dir, name)
+            # Recorded before writing, so an interrupted append is cut off the file being written
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            _save_state(archive_dir, {'file': name, 'size': size, 'pending': [], 'last_id': resume_id})
+            size = _append(path, _records(chats))
+            pending = [chat.id for chat in chats]
+            _save_state(archive_dir, {'file': name, 'size': size, 'pending': pending, 'last_id': last_id})
+            deleted, messages = _delete(pending, now, batch_size)
+            totals['chats'] += deleted
+            totals['messages'] += messages
+            totals['file'] = name
+            state = {'file': name, 'size': size}
+        _save_state(archive_dir, {**state, 'pending': [], 'last_id': last_id})
+        if progress:
+            progress(totals)
+        if deadline and time.monotonic() >= deadline:
+            break
+        _throttle(started, duty_cycle)
+
+    _save_state(archive_dir, {**state, 'pending': [], 'last_id': last_id})
+    if totals['finished']:
+        totals['sessions'] = clear_expired_sessions(now, batch_size, duty_cycle)
+        totals['buckets'] = clear_idle_buckets(batch_size, duty_cycle)
+    return totals
@@ -0,0 +1,349 @@
+"""
+Per-chat run queue.
+
+An OpenAI thread accepts only one active run at a time, so two requests on the
+same chat (double submit, two tabs) must not start runs concurrently. Each chat
+carries a database lease (``run_lock_token``/``run_lock_expires_at``) taken with
+a conditional UPDATE, which makes it safe across worker processes. While a run
+is in flight a heartbeat thread extends the lease, since one OpenAI call (with
+retries) can take longer than ``CHAT_RUN_LOCK_TTL``. A stream interrupted
+mid-run keeps the lease until its OpenAI run is cancelled and has ended.
+
+User messages are stored with ``run_state='pending'``. Whoever holds the lease
+claims every pending message of the chat and sends them in a single run, so
+messages that arrive while a run is active are batched into the next run
+instead of failing. Requests that do not get the lease wait for their message
+to be answered by the holder. Messages stored without a run (``unsynced``) are
+sent ahead of the batch so the thread history catches up.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import completions, metrics, usage as usage_ledger
+from .models import Assistant, Chat, ChatMessage
+from .rendering import rendered_fields
+
+
+def _touch_chat(chat, text):
+    """Bump activity (and set the title on the first message) with one UPDATE."""
+    now = timezone.now()
+    changes = {'last_activity': now, 'updated_at': now}
+    if chat.title == "New Chat":
+        changes['title'] = text[:50] + "..." if len(text) > 50 else text
+    Chat.objects.filter(id=chat.id).update(**changes)
+    for field, value in changes.items():
+        setattr(chat, field, value)
+
+
+def queue_user_message(chat, text):
+    """Store a user message as pending and bump the chat, in one transaction.
+
+    The chat row is touched with a single UPDATE of only the columns that
+    change (activity timestamps, and the title on the first message).
+    """
+    with transaction.atomic():
+        message = ChatMessage.objects.create(
+            chat=chat, role='user', content=text, run_state=ChatMessage.RUN_PENDING,
+        )
+        _touch_chat(chat, text)
+    return message
+
+
+def record_local_turn(chat, text, reply):
+    """Store a turn answered without a run (e.g. from the reply cache).
+
+    Both messages are marked unsynced; the next run on the chat sends them to
+    the OpenAI thread first, so follow-up turns see the same history.
+    """
+    with transaction.atomic():
+        ChatMessage.objects.bulk_create([
+            ChatMessage(chat=chat, role='user', content=text, run_state=ChatMessage.RUN_UNSYNCED),
+            ChatMessage(chat=chat, role='assistant', content=reply, run_state=ChatMessage.RUN_UNSYNCED,
+                        **rendered_fields('assistant', reply)),
+        ])
+        _touch_chat(chat, text)
+
+
+def acquire_run_lock(chat_id):
+    """Try to take the chat's run lease; return its token or None if held."""
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    acquired = Chat.objects.filter(id=chat_id).filter(
+        Q(run_lock_expires_at__isnull=True) | Q(run_lock_expires_at__lt=now)
+    ).update(
+        run_lock_token=token,
+        run_lock_expires_at=now + timedelta(seconds=settings.CHAT_RUN_LOCK_TTL),
+    )
+    return token if acquired else None
+
+
+def release_run_lock(chat_id, token):
+    Chat.objects.filter(id=chat_id, run_lock_token=token).update(
+        run_lock_token='', run_lock_expires_at=None,
+    )
+
+
+def renew_run_lock(chat_id, token):
+    """Extend the lease if ``token`` still holds it; return whether it did."""
+    return bool(Chat.objects.filter(id=chat_id, run_lock_token=token).update(
+        run_lock_expires_at=timezone.now() + timedelta(seconds=settings.CHAT_RUN_LOCK_TTL),
+    ))
+
+
+@contextmanager
+def renewing_run_lock(chat_id, token):
+    """Renew the lease every third of its TTL until the block exits (or it is released)."""
+    stop = threading.Event()
+
+    def heartbeat():
+        try:
+            while not stop.wait(settings.CHAT_RUN_LOCK_TTL / 3):
+                if not renew_run_lock(chat_id, token):
+                    return
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=heartbeat, name=f'run-lease-{chat_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+# Run statuses after which the thread accepts a new run
+TERMINAL_RUN_STATUSES = {'completed', 'failed', 'cancelled', 'expired', 'incomplete'}
+
+
+def end_run(client, thread_id, run_id):
+    """Cancel a run abandoned by an interrupted stream and wait until it ends.
+
+    Returns whether the thread is free for the next run; if not (or OpenAI
+    cannot be reached), the caller keeps the lease and lets it lapse.
+    """
+    if run_id is None:
+        return True
+    try:
+        run = client.beta.threads.runs.retrieve(run_id, thread_id=thread_id)
+        if run.status not in TERMINAL_RUN_STATUSES:
+            client.beta.threads.runs.cancel(run_id, thread_id=thread_id)
+            run = client.beta.threads.runs.poll(run_id, thread_id=thread_id)
+    except Exception:
+        return False
+    return run.status in TERMINAL_RUN_STATUSES
+
+
+def begin_run(chat):
+    """Take the run lease and claim all pending user messages, in one transaction.
+
+    Returns ``(token, batch)``, or ``(None, [])`` when the lease is held
+    elsewhere or there is nothing to run.
+    """
+    with transaction.atomic():
+        token = acquire_run_lock(chat.id)
+        if not token:
+            return None, []
+        # Messages left 'running' belong to a holder whose lease lapsed.
+        ChatMessage.objects.filter(chat_id=chat.id, run_state=ChatMessage.RUN_RUNNING).update(
+            run_state=ChatMessage.RUN_FAILED, run_error='Assistant run was interrupted',
+        )
+        batch = list(
+            chat.messages.filter(
+                Q(role='user', run_state=ChatMessage.RUN_PENDING) | Q(run_state=ChatMessage.RUN_UNSYNCED)
+            ).order_by('id')
+        )
+        pending = [m.id for m in batch if m.run_state == ChatMessage.RUN_PENDING]
+        if not pending:
+            release_run_lock(chat.id, token)
+            return None, []
+        # Unsynced messages stay unsynced until the run succeeds
+        ChatMessage.objects.filter(id__in=pending).update(run_state=ChatMessage.RUN_RUNNING)
+    return token, batch
+
+
+def complete_run(chat, batch, token, reply=None, error='', usage=None, release=True):
+    """Store the reply, settle the batch, record usage and release the lease, in one transaction.
+
+    With ``release=False`` the lease is kept until it lapses (its run may still be active).
+    """
+    try:
+        with transaction.atomic():
+            if reply is not None:
+                ChatMessage.objects.create(
+                    chat=chat, role='assistant', content=reply, **rendered_fields('assistant', reply),
+                    **(usage or {}),
+                )
+            usage_ledger.record(chat, usage, replied=reply is not None)
+            if error:
+                # Unsynced messages are left as they are and resent next run
+                ids = [m.id for m in batch if m.run_state != ChatMessage.RUN_UNSYNCED]
+            else:
+                ids = [m.id for m in batch]
+            ChatMessage.objects.filter(id__in=ids).update(
+                run_state=ChatMessage.RUN_FAILED if error else ChatMessage.RUN_DONE,
+                run_error=error[:255],
+            )
+            if release:
+                release_run_lock(chat.id, token)
+    except Exception:
+        if release:
+            release_run_lock(chat.id, token)
+        raise
+    metrics.RUNS.labels(chat.assistant.mode_id, 'failed' if error else 'completed').inc()
+
+
+def turn_result(message):
+    """Return ``(reply, error)`` once the message has been answered, else None."""
+    message.refresh_from_db(fields=['run_state', 'run_error'])
+    if message.run_state == ChatMessage.RUN_FAILED:
+        return None, message.run_error or 'Assistant run failed'
+    if message.run_state != ChatMessage.RUN_DONE:
+        return None
+    reply = message.chat.messages.filter(role='assistant', id__gt=message.id).order_by('id').first()
+    if reply is None:
+        return None, 'No response from assistant'
+    return reply.content, None
+
+
+def run_messages(batch):
+    """Thread messages for a claimed batch, passed as ``additional_messages``."""
+    return [{'role': m.role, 'content': m.content} for m in batch]
+
+
+def execute_batch(chat, batch, client):
+    """Run the assistant on a claimed batch; return ``(reply, error, usage)``. No DB writes."""
+    label = chat.assistant.mode_id
+    if chat.assistant.engine == Assistant.ENGINE_CHAT_COMPLETIONS:
+        with metrics.phase('run', label):
+            return completions.complete(chat, batch, client)
+    try:
+        with metrics.phase('run', label):
+            run = client.beta.threads.runs.create_and_poll(
+                thread_id=chat.thread_id,
+                assistant_id=chat.assistant.assistant_id,
+                additional_messages=run_messages(batch),
+                **chat.assistant.run_limits(),
+            )
+        usage = usage_ledger.from_response(run)
+        if run.status != 'completed':
+            return None, f'Assistant run failed with status: {run.status}', usage
+
+        with metrics.phase('messages_list', label):
+            messages = client.beta.threads.messages.list(
+                thread_id=chat.thread_id,
+                order="desc",
+                limit=1
+            )
+        if not messages.data:
+            return None, 'No response from assistant', usage
+        return messages.data[0].content[0].text.value, '', usage
+    except Exception as e:
+        metrics.record_error(label, e)
+        return None, str(e), None
+
+
+def run_turn(chat, message, client):
+    """Get the assistant reply for ``message``, serialized with other runs on the chat.
+
+    Returns ``(reply, error)``.
+    """
+    label = chat.assistant.mode_id
+    waiting = time.perf_counter()
+    deadline = time.monotonic() + settings.CHAT_RUN_WAIT_TIMEOUT
+    while True:
+        with metrics.phase('claim', label):
+            token, batch = begin_run(chat)
+        if token:
+            if waiting is not None:
+                metrics.observe_phase('queue_wait', label, time.perf_counter() - waiting)
+                waiting = None
+            with metrics.RUNS_IN_FLIGHT.labels(label).track_in_progress(), renewing_run_lock(chat.id, token):
+                reply, error, usage = execute_batch(chat, batch, client)
+                with metrics.phase('complete', label):
+                    complete_run(chat, batch, token, reply, error, usage)
+            if any(m.id == message.id for m in batch):
+                return reply, error or None
+            continue
+
+        result = turn_result(message)
+        if result is not None:
+            # Answered by the run of another request on the same chat
+            if waiting is not None:
+                metrics.observe_phase('queue_wait', label, time.perf_counter() - waiting)
+            return result
+        if time.monotonic() > deadline:
+            return None, 'Chat is busy, please try again shortly'
+        time.sleep(settings.CHAT_RUN_POLL_INTERVAL)
+
+
+async def aexecute_batch(chat, batch, client):
+    """Async version of execute_batch for AsyncOpenAI clients."""
+    label = chat.assistant.mode_id
+    if chat.assistant.engine == Assistant.ENGINE_CHAT_COMPLETIONS:
+        with metrics.phase('run', label):
+            return await completions.acomplete(chat, batch, client)
+    try:
+        with metrics.phase('run', label):
+            run = await client.beta.threads.runs.create_and_poll(
+                thread_id=chat.thread_id,
+                assistant_id=chat.assistant.assistant_id,
+                additional_messages=run_messages(batch),
+                **chat.assistant.run_limits(),
+            )
+        usage = usage_ledger.from_response(run)
+        if run.status != 'completed':
+            return None, f'Assistant run failed with status: {run.status}', usage
+
+        with metrics.phase('messages_list', label):
+            messages = await client.beta.threads.messages.list(
+                thread_id=chat.thread_id,
+                order="desc",
+                limit=1
+            )
+        if not messages.data:
+            return None, 'No response from assistant', usage
+        return messages.data[0].content[0].text.value, '', usage
+    except Exception as e:
+        metrics.record_error(label, e)
+        return None, str(e), None
+
+
+async def arun_turn(chat, message, client):
+    """Async version of run_turn."""
+    label = chat.assistant.mode_id
+    waiting = time.perf_counter()
+    deadline = time.monotonic() + settings.CHAT_RUN_WAIT_TIMEOUT
+    while True:
+        with metrics.phase('claim', label):
+            token, batch = await sync_to_async(begin_run)(chat)
+        if token:
+            if waiting is not None:
+                metrics.observe_phase('queue_wait', label, time.perf_counter() - waiting)
+                waiting = None
+            with metrics.RUNS_IN_FLIGHT.labels(label).track_in_progress(), renewing_run_lock(chat.id, token):
+                reply, error, usage = await aexecute_batch(chat, batch, client)
+                with metrics.phase('complete', label):
+                    await sync_to_async(complete_run)(chat, batch, token, reply, error, usage)
+            if any(m.id == message.id for m in batch):
+                return reply, error or None
+            continue
+
+        result = await sync_to_async(turn_result)(message)
+        if result is not None:
+            if waiting is not None:
+                metrics.observe_phase('queue_wait', label, time.perf_counter() - waiting)
+            return result
+        if time.monotonic() > deadline:
+            return None, 'Chat is busy, please try again shortly'
+        await asyncio.sleep(settings.CHAT_RUN_POLL_INTERVAL)
@@ -0,0 +1,230 @@
+"""
+Production static files pipeline.
+
+``CompressedManifestStaticFilesStorage`` extends Django's manifest storage:
+``collectstatic`` writes content-hashed copies of every asset to STATIC_ROOT,
+plus ``.gz`` (and ``.br`` when the ``brotli`` package is installed) variants
+of compressible files.
+
+``StaticFilesMiddleware`` serves STATIC_ROOT from the Django process, so no
+CDN or separate web server is needed. It picks the smallest variant the
+client accepts, and marks hashed URLs immutable for a year. Unhashed names
+get ``STATIC_MAX_AGE``. Both are only active with ``STATIC_PIPELINE=true``;
+otherwise the middleware drops out of the chain. It runs in the handler's
+mode (sync under WSGI, async under ASGI), so it adds no thread hop.
+"""
+import asyncio
+import gzip
+import json
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+# Already compressed formats gain nothing from gzip/brotli
+SKIP_COMPRESS_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.ico',
+    '.woff', '.woff2', '.gz', '.br', '.zip', '.mp3', '.mp4', '.webm', '.pdf',
+}
+# Keep a compressed variant only if it saves at least this fraction
+MIN_SAVING = 0.05
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def compress(data):
+    """Return ``{suffix: bytes}`` of worthwhile compressed variants of ``data``."""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return {suffix: body for suffix, body in variants.items()
+            if len(body) <= len(data) * (1 - MIN_SAVING)}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes precompressed variants at collect time."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in SKIP_COMPRESS_EXTENSIONS or not self.exists(name):
+                continue
+            with self.open(name) as f:
+                data = f.read()
+            for suffix, body in compress(data).items():
+                with open(self.path(name) + suffix, 'wb') as out:
+                    out.write(body)
+
+
+def _accepted_encodings(header):
+    """Content codings accepted by an ``Accept-Encoding`` header (q > 0)."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                if float(match.group(1)) == 0:
+                    continue
+            except ValueError:
+                # Unparsable q value: treat the coding as not acceptable
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _etag_matches(header, etag):
+    """Whether an ``If-None-Match`` header matches ``etag`` (``*``, lists, weak comparison)."""
+    tags = parse_etags(header)
+    return tags == ['*'] or any(tag.removeprefix('W/') == etag for tag in tags)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class StaticFilesMiddleware:
+    """Serve collected static files with compression negotiation and cache headers."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not (settings.STATIC_PIPELINE and settings.STATIC_ROOT):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Stay in the handler's mode, so async views are not pushed onto a thread
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.files = {}
+        self.immutable = set()
+        self._index()
+
+    def _index(self):
+        """Stat every collected file once; STATIC_ROOT does not change while running."""
+        root = str(settings.STATIC_ROOT)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                stat = os.stat(path)
+                self.files[name] = (path, stat.st_size, stat.st_mtime)
+        try:
+            with open(os.path.join(root, CompressedManifestStaticFilesStorage.manifest_name), encoding='utf-8') as f:
+                self.immutable = set(json.load(f).get('paths', {}).values())
+        except (OSError, ValueError):
+            self.immutable = set()
+
+    def _match(self, request):
+        """Collected file name for the request, or None to pass it on."""
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefix):
+            return None
+        name = request.path[len(self.prefix):]
+        if name not in self.files or name.endswith(('.gz', '.br')):
+            return None
+        return name
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        name = self._match(request)
+        if name is None:
+            return self.get_response(request)
+        return self.serve(request, name)
+
+    async def __acall__(self, request):
+        name = self._match(request)
+        if name is None:
+            return await self.get_response(request)
+        variant = self._negotiate(request, name)
+        content = None
+        if request.method == 'GET' and not self._not_modified(request, variant):
+            # ASGI drains a FileResponse through sync_to_async; read the file off the loop instead
+            content = await asyncio.to_thread(_read, variant[0])
+        return self._respond(request, name, variant, content)
+
+    def serve(self, request, name):
+        return self._respond(request, name, self._negotiate(request, name))
+
+    def _negotiate(self, request, name):
+        """Pick the variant to send: ``(path, size, mtime, encoding, has_variants)``."""
+        path, size, mtime = self.files[name]
+        encoding = None
+        has_variants = False
+        accepted = _accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for coding, suffix in ENCODINGS:
+            variant = self.files.get(name + suffix)
+            if variant is None:
+                continue
+            has_variants = True
+            if encoding is None and coding in accepted:
+                encoding = coding
+                path, size, mtime = variant
+        return path, size, mtime, encoding, has_variants
+
+    @staticmethod
+    def _etag(variant):
+        _, size, mtime, _, _ = variant
+        return f'"{int(mtime):x}-{size:x}"'
+
+    def _not_modified(self, request, variant):
+        if 'HTTP_IF_NONE_MATCH' in request.META:
+            return _etag_matches(request.META['HTTP_IF_NONE_MATCH'], self._etag(variant))
+        return self._not_modified_since(request, variant[2])
+
+    def _respond(self, request, name, variant, content=None):
+        """Response for ``variant``; ``content`` is its body if already read, else it is streamed."""
+        path, size, mtime, encoding, has_variants = variant
+        if self._not_modified(request, variant):
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=content_type)
+            elif content is not None:
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response['Content-Length'] = str(size)
+            if encoding:
+                response['Content-Encoding'] = encoding
+
+        response['ETag'] = self._etag(variant)
+        response['Last-Modified'] = formatdate(mtime, usegmt=True)
+        if has_variants:
+            response['Vary'] = 'Accept-Encoding'
+        if name in self.immutable:
+            response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response['Cache-Control'] = f'public, max-age={settings.STATIC_MAX_AGE}'
+        return response
+
+    @staticmethod
+    def _not_modified_since(request, mtime):
+        header = request.META.get('HTTP_IF_MODIFIED_SINCE')
+        if not header:
+            return False
+        try:
+            return int(mtime) <= parsedate_to_datetime(header).timestamp()
+        except (TypeError, ValueError):
+            return False
@@ -0,0 +1,285 @@
+"""
+In-process stub model backend (``LLM_BACKEND='stub'``).
+
+Implements the part of the ``openai`` SDK the chat pipeline uses, so views,
+run queue, jobs and management commands run unchanged without the network:
+
+* threads: ``beta.threads.create``
+* message append and reply fetch: ``beta.threads.messages.create`` / ``.list``
+* runs: ``beta.threads.runs.create_and_poll`` / ``.stream`` / ``.list`` /
+  ``.retrieve`` / ``.cancel`` / ``.poll``
+* ``chat.completions.create`` (whole or streamed)
+* ``beta.assistants.create`` / ``.update``
+
+Replies are a fixed text and ids are sequential, so runs are deterministic.
+``LLM_STUB_LATENCY`` simulates model time per run (time to first token when
+streaming) and ``LLM_STUB_TOKEN_RATE`` the streaming speed (0 = instant).
+With both at 0, a profile of a chat turn shows only this project's overhead.
+
+Threads live in process memory; the least recently used ones are dropped
+beyond ``MAX_THREADS``.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from django.conf import settings
+
+
+REPLY_TEXT = (
+    'This is a reply from the in-process stub backend. It stands in for a model '
+    'so the chat pipeline can be run and profiled without the network.'
+)
+MODEL = 'stub'
+MAX_THREADS = 10000
+RUNS_PER_THREAD = 20
+
+
+def _words(text):
+    return len(str(text or '').split())
+
+
+def _text_message(thread_id, message_id, role, text):
+    return SimpleNamespace(
+        id=message_id, object='thread.message', thread_id=thread_id, role=role,
+        created_at=int(time.time()),
+        content=[SimpleNamespace(type='text', text=SimpleNamespace(value=text, annotations=[]))],
+    )
+
+
+def _usage(prompt_tokens, completion_tokens):
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+class StubState:
+    """Threads, messages and runs of the stub, shared by its sync and async clients."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._threads = OrderedDict()
+
+    def new_id(self, prefix):
+        return f'{prefix}_stub{next(self._ids)}'
+
+    def _thread(self, thread_id):
+        thread = self._threads.get(thread_id)
+        if thread is None:
+            # Unknown ids (e.g. created by another backend) start out empty
+            thread = self._threads[thread_id] = {'messages': [], 'runs': deque(maxlen=RUNS_PER_THREAD)}
+            while len(self._threads) > MAX_THREADS:
+                self._threads.popitem(last=False)
+        self._threads.move_to_end(thread_id)
+        return thread
+
+    def create_thread(self):
+        thread_id = self.new_id('thread')
+        with self._lock:
+            self._thread(thread_id)
+        return SimpleNamespace(id=thread_id, object='thread', created_at=int(time.time()), metadata={})
+
+    def add_message(self, thread_id, role, content):
+        message = _text_message(thread_id, self.new_id('msg'), role, content)
+        with self._lock:
+            self._thread(thread_id)['messages'].append(message)
+        return message
+
+    def list_messages(self, thread_id, order='desc', limit=20):
+        with self._lock:
+            messages = list(self._thread(thread_id)['messages'])
+        if order == 'desc':
+            messages.reverse()
+        return SimpleNamespace(data=messages[:limit])
+
+    def start_run(self, thread_id, assistant_id, additional_messages=None, truncation_strategy=None,
+                  max_prompt_tokens=None, **kwargs):
+        """Append the run's messages and return it in progress, with its usage worked out."""
+        for message in additional_messages or []:
+            self.add_message(thread_id, message['role'], message['content'])
+        with self._lock:
+            messages = self._thread(thread_id)['messages']
+            if (truncation_strategy or {}).get('type') == 'last_messages':
+                messages = messages[-truncation_strategy['last_messages']:]
+            prompt_tokens = sum(_words(m.content[0].text.value) for m in messages)
+        if max_prompt_tokens:
+            prompt_tokens = min(prompt_tokens, max_prompt_tokens)
+        run = SimpleNamespace(
+            id=self.new_id('run'), object='thread.run', thread_id=thread_id, assistant_id=assistant_id,
+            created_at=int(time.time()), status='in_progress', model=MODEL, last_error=None,
+            usage=_usage(prompt_tokens, _words(REPLY_TEXT)),
+        )
+        with self._lock:
+            self._thread(thread_id)['runs'].appendleft(run)
+        return run
+
+    def finish_run(self, run):
+        run.status = 'completed'
+        self.add_message(run.thread_id, 'assistant', REPLY_TEXT)
+        return run
+
+    def get_run(self, run_id, thread_id):
+        with self._lock:
+            return next(run for run in self._thread(thread_id)['runs'] if run.id == run_id)
+
+    def cancel_run(self, run_id, thread_id):
+        run = self.get_run(run_id, thread_id)
+        if run.status == 'in_progress':
+            run.status = 'cancelled'
+        return run
+
+    def list_runs(self, thread_id, order='desc', limit=20):
+        with self._lock:
+            runs = list(self._thread(thread_id)['runs'])
+        if order != 'desc':
+            runs.reverse()
+        return SimpleNamespace(data=runs[:limit])
+
+    def completion(self, messages, model=None):
+        return SimpleNamespace(
+            id=self.new_id('chatcmpl'), object='chat.completion', created=int(time.time()),
+            model=model or MODEL,
+            choices=[SimpleNamespace(index=0, finish_reason='stop',
+                                     message=SimpleNamespace(role='assistant', content=REPLY_TEXT))],
+            usage=_usage(sum(_words(m.get('content')) for m in messages), _words(REPLY_TEXT)),
+        )
+
+    def assistant(self, assistant_id=None, **spec):
+        return SimpleNamespace(id=assistant_id or self.new_id('asst'), object='assistant', **spec)
+
+
+def _tokens():
+    words = REPLY_TEXT.split(' ')
+    return [word if i == 0 else ' ' + word for i, word in enumerate(words)]
+
+
+def _first_token_delay(tokens):
+    """Run latency minus streaming time, like the fake HTTP server."""
+    rate = settings.LLM_STUB_TOKEN_RATE
+    return max(settings.LLM_STUB_LATENCY - (len(tokens) / rate if rate else 0), 0)
+
+
+def _sleep(seconds):
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+def _event(name, data):
+    return SimpleNamespace(event=name, data=data)
+
+
+def _delta_event(message_id, text):
+    block = SimpleNamespace(index=0, type='text', text=SimpleNamespace(value=text, annotations=[]))
+    return _event('thread.message.delta', SimpleNamespace(
+        id=message_id, object='thread.message.delta', delta=SimpleNamespace(content=[block]),
+    ))
+
+
+class StubClient:
+    """Sync stand-in for ``openai.OpenAI``."""
+
+    def __init__(self, state):
+        self.state = state
+        self.beta = SimpleNamespace(
+            threads=SimpleNamespace(
+                create=lambda **kwargs: state.create_thread(),
+                messages=SimpleNamespace(create=self._create_message, list=state.list_messages),
+                runs=SimpleNamespace(create_and_poll=self._create_and_poll, stream=self._stream_run,
+                                     list=state.list_runs, retrieve=state.get_run, cancel=state.cancel_run,
+                                     poll=state.get_run),
+            ),
+            assistants=SimpleNamespace(
+                create=lambda **spec: state.assistant(**spec),
+                update=lambda assistant_id, **spec: state.assistant(assistant_id, **spec),
+            ),
+        )
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+
+    def _create_message(self, thread_id, role, content, **kwargs):
+        return self.state.add_message(thread_id, role, content)
+
+    def _create_and_poll(self, thread_id, assistant_id, **kwargs):
+        run = self.state.start_run(thread_id, assistant_id, **kwargs)
+        _sleep(settings.LLM_STUB_LATENCY)
+        return self.state.finish_run(run)
+
+    @contextmanager
+    def _stream_run(self, thread_id, assistant_id, **kwargs):
+        yield self._run_events(self.state.start_run(thread_id, assistant_id, **kwargs))
+
+    def _run_events(self, run):
+        yield _event('thread.run.created', run)
+        tokens = _tokens()
+        _sleep(_first_token_delay(tokens))
+        message_id = self.state.new_id('msg')
+        for token in tokens:
+            yield _delta_event(message_id, token)
+            if settings.LLM_STUB_TOKEN_RATE:
+                _sleep(1 / settings.LLM_STUB_TOKEN_RATE)
+        yield _event('thread.run.completed', self.state.finish_run(run))
+
+    def _create_completion(self, messages, model=None, stream=False, stream_options=None, **kwargs):
+        completion = self.state.completion(messages, model)
+        if not stream:
+            _sleep(settings.LLM_STUB_LATENCY)
+            return completion
+        return self._completion_chunks(completion, (stream_options or {}).get('include_usage'))
+
+    def _completion_chunks(self, completion, include_usage):
+        tokens = _tokens()
+        _sleep(_first_token_delay(tokens))
+        for token in tokens:
+            yield SimpleNamespace(
+                id=completion.id, model=completion.model, usage=None,
+                choices=[SimpleNamespace(index=0, finish_reason=None, delta=SimpleNamespace(content=token))],
+            )
+            if settings.LLM_STUB_TOKEN_RATE:
+                _sleep(1 / settings.LLM_STUB_TOKEN_RATE)
+        if include_usage:
+            yield SimpleNamespace(id=completion.id, model=completion.model, choices=[], usage=completion.usage)
+
+
+class AsyncStubClient:
+    """Async stand-in for ``openai.AsyncOpenAI`` (the calls the async views make)."""
+
+    def __init__(self, state):
+        self.state = state
+        self.beta = SimpleNamespace(
+            threads=SimpleNamespace(
+                create=self._create_thread,
+                messages=SimpleNamespace(create=self._create_message, list=self._list_messages),
+                runs=SimpleNamespace(create_and_poll=self._create_and_poll),
+            ),
+        )
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+
+    async def _create_thread(self, **kwargs):
+        return self.state.create_thread()
+
+    async def _create_message(self, thread_id, role, content, **kwargs):
+        return self.state.add_message(thread_id, role, content)
+
+    async def _list_messages(self, thread_id, **kwargs):
+        return self.state.list_messages(thread_id, **kwargs)
+
+    async def _create_and_poll(self, thread_id, assistant_id, **kwargs):
+        run = self.state.start_run(thread_id, assistant_id, **kwargs)
+        if settings.LLM_STUB_LATENCY > 0:
+            await asyncio.sleep(settings.LLM_STUB_LATENCY)
+        return self.state.finish_run(run)
+
+    async def _create_completion(self, messages, model=None, **kwargs):
+        if settings.LLM_STUB_LATENCY > 0:
+            await asyncio.sleep(settings.LLM_STUB_LATENCY)
+        return self.state.completion(messages, model)
+
+
+_state = StubState()
+client = StubClient(_state)
+async_client = AsyncStubClient(_state)
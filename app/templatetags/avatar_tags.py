@@ -0,0 +1,36 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from ..avatars import load_manifest
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar(path, alt, size=80, css_class=''):
+    """Lazy-loaded ``<picture>`` for a static avatar using the build_avatars thumbnails.
+
+    Falls back to a plain ``<img>`` of the source file when it has not been built.
+    """
+    entry = load_manifest().get(path)
+    if entry is None:
+        return format_html(
+            '<img src="{}" alt="{}" width="{}" height="{}" loading="lazy" decoding="async" class="{}">',
+            static(path), alt, size, size, css_class,
+        )
+
+    def srcset(files):
+        return ', '.join(f'{static(files[d])} {d}x' for d in sorted(files))
+
+    *alternatives, fallback = entry['sources']
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}">',
+        ((s['type'], srcset(s['files'])) for s in alternatives),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" alt="{}" width="{}" height="{}" '
+        'loading="lazy" decoding="async" class="{}"></picture>',
+        sources, static(fallback['files']['1']), srcset(fallback['files']),
+        alt, size, size, css_class,
+    )
@@ -1,3 +1,983 @@
-from django.test import TestCase
+import json
+from contextlib import nullcontext
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from .models import Assistant, Chat, ChatMessage
+
+
+def fake_client(reply='Hello there'):
+    """Stand-in for the OpenAI client returning one completed run."""
+    client = mock.Mock()
+    client.beta.threads.runs.create_and_poll.return_value = SimpleNamespace(
+        status='completed', model='gpt-4o-mini',
+        usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30),
+    )
+    client.beta.threads.messages.list.return_value = SimpleNamespace(data=[
+        SimpleNamespace(content=[SimpleNamespace(text=SimpleNamespace(value=reply))])
+    ])
+    return client
+
+
+@override_settings(OPENAI_API_KEY='sk-test')
+class ChatTestCase(TestCase):
+    def setUp(self):
+        self.assistant = Assistant.objects.create(
+            mode_id='teacher_tutor', assistant_id='asst_test', name='AI Teacher/Tutor',
+            system_prompt='Teach.', mode='professional',
+        )
+        session = self.client.session
+        session.save()
+        self.chat = Chat.objects.create(
+            assistant=self.assistant, session_key=session.session_key,
+            thread_id='thread_test', title='New Chat',
+        )
+
+    def post_chat(self, message, **extra):
+        return self.client.post(
+            '/api/chat/', json.dumps({'message': message, 'chat_id': self.chat.id, **extra}),
+            content_type='application/json',
+        )
+
+
+class ChatApiQueryBudgetTests(ChatTestCase):
+    """Guard the number of queries one chat turn costs."""
+
+    # chat + assistant, session; intake (insert, chat UPDATE); claim (lease
+    # UPDATE, orphan UPDATE, SELECT pending, batch UPDATE); completion (reply
+    # insert, batch UPDATE, usage rollups, lease release). Each of the three
+    # transactions adds a SAVEPOINT/RELEASE pair inside TestCase. A rollup is
+    # one UPDATE; the first turn of the day also inserts the row and updates
+    # again (2 rollups x 3 queries here).
+    TURN_QUERY_BUDGET = 23
+
+    def test_turn_query_budget(self):
+        with mock.patch('app.views.get_client', return_value=fake_client()):
+            with self.assertNumQueries(self.TURN_QUERY_BUDGET):
+                response = self.post_chat('What can you do?')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'reply': 'Hello there'})
+        self.assertEqual(
+            list(self.chat.messages.values_list('role', 'run_state')),
+            [('user', ChatMessage.RUN_DONE), ('assistant', '')],
+        )
+
+    def test_assistant_limits_sent_with_run(self):
+        Assistant.objects.filter(id=self.assistant.id).update(
+            truncation_last_messages=6, max_prompt_tokens=2000,
+        )
+        client = fake_client()
+        with mock.patch('app.views.get_client', return_value=client):
+            self.post_chat('Hi')
+
+        kwargs = client.beta.threads.runs.create_and_poll.call_args.kwargs
+        self.assertEqual(kwargs['truncation_strategy'], {'type': 'last_messages', 'last_messages': 6})
+        self.assertEqual(kwargs['max_prompt_tokens'], 2000)
+        self.assertNotIn('max_completion_tokens', kwargs)
+
+    def test_first_message_sets_title_without_full_save(self):
+        with mock.patch('app.views.get_client', return_value=fake_client()):
+            self.post_chat('Explain photosynthesis')
+            self.post_chat('And respiration?')
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.title, 'Explain photosynthesis')
+        self.assertEqual(self.chat.run_lock_token, '')
+        self.assertIsNone(self.chat.run_lock_expires_at)
+
+
+def run_events(*parts, status='completed'):
+    """Run stream events: one text delta per part, then the run's final event."""
+    events = [
+        SimpleNamespace(event='thread.message.delta', data=SimpleNamespace(delta=SimpleNamespace(content=[
+            SimpleNamespace(type='text', text=SimpleNamespace(value=part)),
+        ]))) for part in parts
+    ]
+    events.append(SimpleNamespace(event=f'thread.run.{status}', data=SimpleNamespace(
+        status=status, model='gpt-4o-mini', usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2),
+    )))
+    return events
+
+
+class StreamingTests(ChatTestCase):
+    def post_stream(self, client, message):
+        with mock.patch('app.views.get_client', return_value=client):
+            response = self.client.post(
+                '/api/chat/stream/', json.dumps({'message': message, 'chat_id': self.chat.id}),
+                content_type='application/json',
+            )
+            return response, b''.join(response.streaming_content).decode()
+
+    def test_deltas_then_done_and_reply_stored(self):
+        client = fake_client()
+        client.beta.threads.runs.stream.return_value = nullcontext(run_events('Hel', 'lo'))
+        response, body = self.post_stream(client, 'Hi')
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(body, (
+            'event: delta\ndata: {"text": "Hel"}\n\n'
+            'event: delta\ndata: {"text": "lo"}\n\n'
+            'event: done\ndata: {"reply": "Hello"}\n\n'
+        ))
+        self.assertEqual(
+            list(self.chat.messages.values_list('role', 'content', 'run_state')),
+            [('user', 'Hi', ChatMessage.RUN_DONE), ('assistant', 'Hello', '')],
+        )
+
+    def test_failed_run_ends_with_error_event(self):
+        client = fake_client()
+        client.beta.threads.runs.stream.return_value = nullcontext(run_events('Par', status='failed'))
+        _, body = self.post_stream(client, 'Hi')
+
+        self.assertTrue(body.endswith('event: error\ndata: {"error": "Assistant run failed with status: failed"}\n\n'))
+        self.assertEqual(self.chat.messages.get().run_state, ChatMessage.RUN_FAILED)
+
+    def test_interrupted_stream_keeps_the_lease_until_the_run_is_cancelled(self):
+        client = fake_client()
+        created = SimpleNamespace(event='thread.run.created', data=SimpleNamespace(id='run_1'))
+        client.beta.threads.runs.retrieve.return_value = SimpleNamespace(status='in_progress')
+        for poll, held in ((SimpleNamespace(status='cancelled'), False), (RuntimeError('timeout'), True)):
+            client.beta.threads.runs.stream.return_value = nullcontext([created, *run_events('Hel', 'lo')])
+            client.beta.threads.runs.poll.side_effect = [poll]
+            with mock.patch('app.views.get_client', return_value=client):
+                response = self.client.post(
+                    '/api/chat/stream/', json.dumps({'message': 'Hi', 'chat_id': self.chat.id}),
+                    content_type='application/json',
+                )
+                self.assertIn(b'Hel', next(iter(response.streaming_content)))
+                response.close()
+
+            client.beta.threads.runs.cancel.assert_called_with('run_1', thread_id='thread_test')
+            self.chat.refresh_from_db()
+            self.assertEqual(bool(self.chat.run_lock_token), held)
+            self.assertEqual(self.chat.messages.last().run_error, 'Stream was interrupted')
+            Chat.objects.filter(id=self.chat.id).update(run_lock_token='', run_lock_expires_at=None)
+
+
+class AsyncViewTests(ChatTestCase):
+    def async_client_for(self, reply):
+        client = mock.Mock()
+        client.beta.threads.create = mock.AsyncMock(return_value=SimpleNamespace(id='thread_async'))
+        sync = fake_client(reply)
+        client.beta.threads.runs.create_and_poll = mock.AsyncMock(
+            return_value=sync.beta.threads.runs.create_and_poll.return_value,
+        )
+        client.beta.threads.messages.list = mock.AsyncMock(return_value=sync.beta.threads.messages.list.return_value)
+        return client
+
+    async def test_async_chat_api_runs_turn_on_async_client(self):
+        self.async_client.cookies = self.client.cookies
+        client = self.async_client_for('Async hello')
+        with mock.patch('app.views.get_async_client', return_value=client):
+            response = await self.async_client.post(
+                '/api/chat/async/', json.dumps({'message': 'Hi', 'chat_id': self.chat.id}),
+                content_type='application/json',
+            )
+
+        self.assertEqual(response.json(), {'reply': 'Async hello'})
+        client.beta.threads.runs.create_and_poll.assert_awaited_once()
+        roles = [role async for role in self.chat.messages.values_list('role', flat=True)]
+        self.assertEqual(roles, ['user', 'assistant'])
+
+    async def test_async_create_chat_reuses_the_open_chat(self):
+        self.async_client.cookies = self.client.cookies
+        client = self.async_client_for('')
+        with mock.patch('app.views.get_async_client', return_value=client), \
+                mock.patch('app.thread_pool.schedule_refill'):
+            response = await self.async_client.get('/chat/create/async/?assistant_id=teacher_tutor')
+            self.assertEqual(response.url, f'/chat/{self.chat.id}/')
+            await self.chat.adelete()
+            response = await self.async_client.get('/chat/create/async/?assistant_id=teacher_tutor')
+
+        chat = await Chat.objects.aget()
+        self.assertEqual((response.url, chat.thread_id), (f'/chat/{chat.id}/', 'thread_async'))
+
+
+class SharedClientTests(TestCase):
+    def tearDown(self):
+        from .openai_client import reset_clients
+        reset_clients()
+
+    def test_one_client_per_process_reuses_connections(self):
+        from .fake_openai import FakeOpenAIServer
+        from .openai_client import get_client, pool_stats, reset_clients
+        server = FakeOpenAIServer().start()
+        self.addCleanup(server.stop)
+        with self.settings(LLM_BACKEND='openai', OPENAI_API_KEY='sk-fake', OPENAI_BASE_URL=server.base_url):
+            reset_clients()
+            client = get_client()
+            self.assertIs(get_client(), client)
+            client.beta.threads.create()
+            client.beta.threads.create()
+            self.assertEqual(pool_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+            # A forked worker builds its own client
+            with mock.patch('app.openai_client.os.getpid', return_value=-1):
+                self.assertIsNot(get_client(), client)
+
+
+class RunQueueTests(ChatTestCase):
+    def test_concurrent_send_is_batched_into_the_holders_run(self):
+        from .runs import queue_user_message, run_turn
+        first = queue_user_message(self.chat, 'First')
+        second = queue_user_message(self.chat, 'Second')  # sent while the first waits for its run
+        client = fake_client('Both answered')
+
+        self.assertEqual(run_turn(self.chat, first, client), ('Both answered', None))
+        self.assertEqual(run_turn(self.chat, second, client), ('Both answered', None))
+
+        client.beta.threads.runs.create_and_poll.assert_called_once()
+        sent = client.beta.threads.runs.create_and_poll.call_args.kwargs['additional_messages']
+        self.assertEqual([m['content'] for m in sent], ['First', 'Second'])
+
+    def test_waiter_receives_the_holders_reply(self):
+        from .runs import acquire_run_lock, begin_run, complete_run, queue_user_message, release_run_lock, run_turn
+        holder = acquire_run_lock(self.chat.id)
+        self.assertIsNone(acquire_run_lock(self.chat.id))
+        message = queue_user_message(self.chat, 'Hello?')
+
+        def holder_runs(seconds):
+            # The holder finishes its run and picks up the waiting message
+            release_run_lock(self.chat.id, holder)
+            token, batch = begin_run(self.chat)
+            complete_run(self.chat, batch, token, 'From the holder')
+
+        client = fake_client()
+        with mock.patch('app.runs.time.sleep', side_effect=holder_runs) as sleep:
+            self.assertEqual(run_turn(self.chat, message, client), ('From the holder', None))
+        sleep.assert_called_once()
+        client.beta.threads.runs.create_and_poll.assert_not_called()
+
+    def test_expired_lease_is_taken_over(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .runs import queue_user_message, run_turn
+        orphan = ChatMessage.objects.create(chat=self.chat, role='user', content='Lost', run_state=ChatMessage.RUN_RUNNING)
+        Chat.objects.filter(id=self.chat.id).update(
+            run_lock_token='dead', run_lock_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        message = queue_user_message(self.chat, 'Anyone there?')
+
+        self.assertEqual(run_turn(self.chat, message, fake_client('Yes')), ('Yes', None))
+        orphan.refresh_from_db()
+        self.assertEqual((orphan.run_state, orphan.run_error), (ChatMessage.RUN_FAILED, 'Assistant run was interrupted'))
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.run_lock_token, '')
+
+    @override_settings(CHAT_RUN_LOCK_TTL=0.03)
+    def test_lease_is_renewed_while_the_run_is_in_flight(self):
+        import time
+        from .runs import acquire_run_lock, queue_user_message, renew_run_lock, run_turn
+        token = acquire_run_lock(self.chat.id)
+        self.assertFalse(renew_run_lock(self.chat.id, 'other'))
+        self.assertTrue(renew_run_lock(self.chat.id, token))
+        Chat.objects.filter(id=self.chat.id).update(run_lock_token='', run_lock_expires_at=None)
+
+        message = queue_user_message(self.chat, 'Slow question')
+        client = fake_client('Slow answer')
+        reply = client.beta.threads.runs.create_and_poll.return_value
+
+        def slow_run(**kwargs):
+            time.sleep(0.1)
+            return reply
+
+        client.beta.threads.runs.create_and_poll.side_effect = slow_run
+        with mock.patch('app.runs.renew_run_lock', return_value=True) as renew:
+            self.assertEqual(run_turn(self.chat, message, client), ('Slow answer', None))
+        self.assertGreaterEqual(renew.call_count, 2)
+
+
+@mock.patch('app.jobs.close_old_connections')
+class JobModeTests(ChatTestCase):
+    def post_job(self):
+        with mock.patch('app.jobs.get_executor') as executor, self.captureOnCommitCallbacks(execute=True):
+            response = self.post_chat('Take your time', mode='job')
+        executor.return_value.submit.assert_called_once()
+        return response
+
+    def test_job_answers_202_and_status_reports_the_reply(self, close_old_connections):
+        from .jobs import process_job
+        from .models import ChatJob
+        response = self.post_job()
+        self.assertEqual(response.status_code, 202)
+        job = ChatJob.objects.get()
+        self.assertEqual(response.json(), {
+            'job_id': str(job.id), 'status': 'queued', 'status_url': f'/api/chat/jobs/{job.id}/',
+        })
+
+        with mock.patch('app.jobs.get_client', return_value=fake_client('Done now')):
+            process_job(job.id)
+        self.assertEqual(self.client.get(response.json()['status_url']).json(), {
+            'job_id': str(job.id), 'status': 'done', 'reply': 'Done now',
+        })
+
+    def test_status_long_polls_until_the_job_finishes(self, close_old_connections):
+        from .models import ChatJob
+        status_url = self.post_job().json()['status_url']
+
+        async def job_finishes(seconds):
+            await ChatJob.objects.aupdate(status=ChatJob.DONE, reply='Eventually')
+
+        with mock.patch('app.views.asyncio.sleep', side_effect=job_finishes) as sleep:
+            response = self.client.get(status_url, {'wait': 5})
+        self.assertEqual(response.json()['reply'], 'Eventually')
+        sleep.assert_awaited_once()
+
+    def test_stale_job_is_requeued_and_runs_the_turn(self, close_old_connections):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .jobs import process_job, requeue_stale_jobs
+        from .models import ChatJob
+        self.post_job()
+        job = ChatJob.objects.get()
+        # The worker died mid-run, and a later run marked its message interrupted
+        long_ago = timezone.now() - timedelta(hours=1)
+        ChatJob.objects.update(status=ChatJob.RUNNING, started_at=long_ago)
+        ChatMessage.objects.filter(id=job.message_id).update(
+            run_state=ChatMessage.RUN_FAILED, run_error='Assistant run was interrupted',
+        )
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        client = fake_client('Recovered')
+        with mock.patch('app.jobs.get_client', return_value=client):
+            process_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.reply), (ChatJob.DONE, 'Recovered'))
+        client.beta.threads.runs.create_and_poll.assert_called_once()
+
+
+class ModesCatalogTests(TestCase):
+    def test_slim_catalog_revalidates_with_etag(self):
+        response = self.client.get('/api/modes/')
+        etag = response['ETag']
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Cache-Control'].startswith('public, max-age='))
+        self.assertNotIn(b'system_prompt', response.content)
+
+        for if_none_match in (etag, f'"stale", {etag}', '*'):
+            response = self.client.get('/api/modes/', HTTP_IF_NONE_MATCH=if_none_match)
+            self.assertEqual((response.status_code, response['ETag']), (304, etag))
+        self.assertEqual(self.client.get('/api/modes/', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+        self.assertIn(b'system_prompt', self.client.get('/api/modes/?include=prompts').content)
+
+
+class MessageHistoryTests(ChatTestCase):
+    def test_keyset_pages_walk_back_through_history(self):
+        from django.utils import timezone
+        messages = ChatMessage.objects.bulk_create([
+            ChatMessage(chat=self.chat, role='user', content=f'm{i}') for i in range(5)
+        ])
+        # Ties on created_at are broken by id
+        ChatMessage.objects.filter(id__in=[m.id for m in messages]).update(created_at=timezone.now())
+
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2, **({'before': cursor} if cursor else {})}
+            page = self.client.get(f'/api/chat/{self.chat.id}/messages/', params).json()
+            seen = [m['content'] for m in page['messages']] + seen
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['m0', 'm1', 'm2', 'm3', 'm4'])
+
+    def test_bad_cursor_is_rejected(self):
+        for cursor in ('abc', '1_2_3', '9' * 30 + '_1', '-' + '9' * 17 + '_1', '1_' + '9' * 30, '1_0'):
+            response = self.client.get(f'/api/chat/{self.chat.id}/messages/', {'before': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+
+class DatabaseProfileTests(TestCase):
+    def test_pragmas_applied_to_new_sqlite_connections(self):
+        from django.db import connection
+        from .db import configure_sqlite
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            original = cursor.fetchone()[0]
+            with self.settings(SQLITE_PRAGMAS={'busy_timeout': 1234}):
+                configure_sqlite(sender=None, connection=connection)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 1234)
+            cursor.execute(f'PRAGMA busy_timeout = {original}')
+
+        other = mock.Mock(vendor='postgresql')
+        configure_sqlite(sender=None, connection=other)
+        other.cursor.assert_not_called()
+
+
+@override_settings(REPLY_CACHE_ENABLED=True)
+class ReplyCacheTests(ChatTestCase):
+    def tearDown(self):
+        from django.core.cache import caches
+        caches['replies'].clear()
+
+    def test_hit_records_turn_and_seeds_thread_on_next_run(self):
+        client = fake_client('I can teach.')
+        with mock.patch('app.views.get_client', return_value=client):
+            self.post_chat('What can you do?')
+            # A new chat with the same assistant, after the first one was archived
+            Chat.objects.filter(id=self.chat.id).update(is_active=False)
+            other = Chat.objects.create(
+                assistant=self.assistant, session_key=self.chat.session_key,
+                thread_id='thread_other', title='New Chat',
+            )
+            self.chat = other
+            response = self.post_chat('  what can you DO ')
+            self.assertEqual(response.json(), {'reply': 'I can teach.', 'cached': True})
+            self.assertEqual(client.beta.threads.runs.create_and_poll.call_count, 1)
+
+            self.post_chat('Tell me more')
+
+        sent = client.beta.threads.runs.create_and_poll.call_args.kwargs['additional_messages']
+        self.assertEqual([m['role'] for m in sent], ['user', 'assistant', 'user'])
+        self.assertFalse(other.messages.filter(run_state=ChatMessage.RUN_UNSYNCED).exists())
+
+
+@override_settings(CHAT_CONTEXT_TOKEN_BUDGET=60, CHAT_COMPLETION_MAX_TOKENS=20)
+class ChatCompletionsEngineTests(ChatTestCase):
+    def test_single_call_with_budgeted_history(self):
+        Assistant.objects.filter(id=self.assistant.id).update(engine=Assistant.ENGINE_CHAT_COMPLETIONS)
+        for i in range(5):
+            ChatMessage.objects.create(chat=self.chat, role='user', content=f'old question {i} ' * 10)
+        client = mock.Mock()
+        client.chat.completions.create.return_value = SimpleNamespace(choices=[
+            SimpleNamespace(message=SimpleNamespace(content='Short answer'))
+        ])
+        with mock.patch('app.views.get_client', return_value=client):
+            response = self.post_chat('Newest question')
+
+        self.assertEqual(response.json(), {'reply': 'Short answer'})
+        client.beta.threads.runs.create_and_poll.assert_not_called()
+        sent = client.chat.completions.create.call_args.kwargs['messages']
+        self.assertEqual(sent[0], {'role': 'system', 'content': 'Teach.'})
+        self.assertEqual(sent[-1], {'role': 'user', 'content': 'Newest question'})
+        self.assertLess(len(sent), 7)
+
+    def test_turn_queries_do_not_grow_with_history(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        Assistant.objects.filter(id=self.assistant.id).update(engine=Assistant.ENGINE_CHAT_COMPLETIONS)
+        client = mock.Mock()
+        client.chat.completions.create.return_value = SimpleNamespace(choices=[
+            SimpleNamespace(message=SimpleNamespace(content='Short answer'))
+        ])
+        counts = []
+        with mock.patch('app.views.get_client', return_value=client):
+            for i in range(3):
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.post_chat(f'Question {i}').status_code, 200)
+                counts.append(len(queries))
+        self.assertEqual(counts[1], counts[2])
+
+
+@override_settings(LLM_BACKEND='stub', OPENAI_API_KEY='')
+class PromptTokenReportTests(ChatTestCase):
+    def test_limits_changed_at_moves_only_with_the_limits(self):
+        self.assertIsNone(self.assistant.limits_changed_at)
+        self.assistant.sync_hash = 'abc'
+        self.assistant.save()
+        self.assertIsNone(Assistant.objects.get(id=self.assistant.id).limits_changed_at)
+
+        assistant = Assistant.objects.get(id=self.assistant.id)
+        assistant.max_prompt_tokens = 500
+        assistant.save()
+        changed = Assistant.objects.get(id=self.assistant.id).limits_changed_at
+        self.assertIsNotNone(changed)
+        assistant.save()
+        self.assertEqual(Assistant.objects.get(id=self.assistant.id).limits_changed_at, changed)
+
+    def test_report_splits_on_the_limits_change_with_the_stub_backend(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .openai_client import get_client
+        Chat.objects.filter(id=self.chat.id).update(thread_id='thread_report')
+        get_client().beta.threads.runs.create_and_poll(thread_id='thread_report', assistant_id='asst_test')
+
+        err = StringIO()
+        call_command('prompt_token_report', '--json', stdout=StringIO(), stderr=err)
+        self.assertIn('pass --since', err.getvalue())
+
+        Assistant.objects.filter(id=self.assistant.id).update(limits_changed_at=timezone.now() - timedelta(hours=1))
+        out = StringIO()
+        call_command('prompt_token_report', '--json', stdout=out)
+        row = json.loads(out.getvalue())['teacher_tutor']
+        self.assertEqual((row['before']['runs'], row['after']['runs']), (0, 1))
+
+
+@override_settings(OPENAI_API_KEY='sk-test')
+class SyncAssistantsTests(TestCase):
+    def sync(self, client, *args):
+        from io import StringIO
+        from django.core.management import call_command
+        with mock.patch('app.management.commands.create_assistants.get_client', return_value=client):
+            call_command('create_assistants', *args, stdout=StringIO())
+
+    def remote_client(self):
+        client = mock.Mock()
+        client.beta.assistants.create.side_effect = lambda **spec: SimpleNamespace(id=f'asst_{spec["name"]}')
+        client.beta.assistants.update.side_effect = lambda assistant_id, **spec: SimpleNamespace(id=assistant_id)
+        return client
+
+    def test_unchanged_assistants_are_skipped_and_changed_ones_updated(self):
+        from .modes import MODES
+        total = sum(len(mode['assistants']) for mode in MODES.values())
+        client = self.remote_client()
+        self.sync(client)
+        self.assertEqual(client.beta.assistants.create.call_count, total)
+        self.assertEqual(Assistant.objects.exclude(sync_hash='').count(), total)
+
+        client = self.remote_client()
+        self.sync(client)
+        client.beta.assistants.create.assert_not_called()
+        client.beta.assistants.update.assert_not_called()
+
+        stale = Assistant.objects.first()
+        Assistant.objects.filter(id=stale.id).update(sync_hash='old')
+        self.sync(client)
+        client.beta.assistants.update.assert_called_once()
+        self.assertEqual(client.beta.assistants.update.call_args.args, (stale.assistant_id,))
+        client.beta.assistants.create.assert_not_called()
+
+    def test_assistant_deleted_remotely_is_recreated(self):
+        import httpx
+        import openai
+        self.sync(self.remote_client())
+        stale = Assistant.objects.first()
+        Assistant.objects.filter(id=stale.id).update(sync_hash='old')
+
+        client = self.remote_client()
+        response = httpx.Response(404, request=httpx.Request('POST', 'https://api.openai.com/v1/assistants'))
+        client.beta.assistants.update.side_effect = openai.NotFoundError('gone', response=response, body=None)
+        client.beta.assistants.create.side_effect = lambda **spec: SimpleNamespace(id='asst_new')
+        self.sync(client)
+        client.beta.assistants.create.assert_called_once()
+        stale.refresh_from_db()
+        self.assertEqual(stale.assistant_id, 'asst_new')
+        self.assertNotEqual(stale.sync_hash, 'old')
+
+
+class AvatarTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from pathlib import Path
+        from PIL import Image
+        from .avatars import load_manifest
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(load_manifest.cache_clear)
+        self.static_dir = Path(tmp.name)
+        (self.static_dir / 'img').mkdir()
+        Image.new('RGB', (400, 300), 'red').save(self.static_dir / 'img' / 'Tutor.png')
+        overrides = override_settings(
+            STATICFILES_DIRS=[self.static_dir], AVATAR_OUTPUT_DIR=self.static_dir / 'img' / 'avatars',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def build(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('build_avatars', stdout=out)
+        return out.getvalue()
+
+    def test_build_writes_hashed_thumbnails_and_skips_unchanged_sources(self):
+        from PIL import Image
+        from .avatars import load_manifest
+        self.assertIn('img/Tutor.png', self.build())
+        entry = load_manifest()['img/Tutor.png']
+        self.assertEqual(entry['sources'][-1]['format'], 'png')
+        for source in entry['sources']:
+            for density, path in source['files'].items():
+                with Image.open(self.static_dir / path) as thumb:
+                    self.assertEqual(thumb.size, (80 * int(density),) * 2)
+
+        self.assertNotIn('img/Tutor.png', self.build())
+        self.assertEqual(load_manifest()['img/Tutor.png'], entry)
+
+    def test_tag_renders_a_lazy_picture_and_falls_back_to_the_source(self):
+        from .templatetags.avatar_tags import avatar
+        fallback = avatar('img/Tutor.png', 'Tutor')
+        self.assertTrue(fallback.startswith('<img src="/static/img/Tutor.png"'))
+
+        self.build()
+        html = avatar('img/Tutor.png', 'Tutor')
+        self.assertTrue(html.startswith('<picture>'))
+        self.assertIn('width="80" height="80" loading="lazy"', html)
+        self.assertIn(' 2x"', html)
+
+
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        import gzip
+        import tempfile
+        from pathlib import Path
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+        self.body = b'body { color: red; }\n' * 50
+        (root / 'app.0123abcd.css').write_bytes(self.body)
+        (root / 'app.0123abcd.css.gz').write_bytes(gzip.compress(self.body))
+        (root / 'staticfiles.json').write_text(json.dumps({'paths': {'app.css': 'app.0123abcd.css'}}))
+        overrides = override_settings(STATIC_PIPELINE=True, STATIC_ROOT=root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def get(self, path='/static/app.0123abcd.css', **headers):
+        from django.test import RequestFactory
+        return RequestFactory().get(path, **headers)
+
+    def test_not_used_when_the_pipeline_is_off(self):
+        from django.core.exceptions import MiddlewareNotUsed
+        from .staticfiles import StaticFilesMiddleware
+        with override_settings(STATIC_PIPELINE=False), self.assertRaises(MiddlewareNotUsed):
+            StaticFilesMiddleware(lambda request: None)
+
+    def test_negotiates_encoding_and_matches_if_none_match_lists(self):
+        from .staticfiles import StaticFilesMiddleware
+        middleware = StaticFilesMiddleware(lambda request: None)
+        response = middleware(self.get(HTTP_ACCEPT_ENCODING='gzip, br;q=0'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response['Content-Encoding'], response['Vary']), ('gzip', 'Accept-Encoding'))
+        self.assertIn('immutable', response['Cache-Control'])
+        etag = response['ETag']
+
+        for header in (f'"other", W/{etag}', '*'):
+            response = middleware(self.get(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=header))
+            self.assertEqual(response.status_code, 304)
+        self.assertEqual(middleware(self.get(HTTP_IF_NONE_MATCH=etag)).status_code, 200)
+        self.assertIsNone(middleware(self.get('/static/missing.css')))
+
+    def test_malformed_q_values_are_not_acceptable(self):
+        from .staticfiles import StaticFilesMiddleware
+        middleware = StaticFilesMiddleware(lambda request: None)
+        for header in ('gzip;q=.', 'gzip;q=1.2.3'):
+            response = middleware(self.get(HTTP_ACCEPT_ENCODING=header))
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('Content-Encoding'))
+
+    async def test_async_handler_stays_async(self):
+        from asgiref.sync import iscoroutinefunction
+        from .staticfiles import StaticFilesMiddleware
+
+        async def view(request):
+            return 'passed on'
+
+        middleware = StaticFilesMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(self.get())
+        self.assertEqual(response.content, self.body)
+        self.assertEqual(await middleware(self.get('/static/missing.css')), 'passed on')
+
+
+class RenderingTests(ChatTestCase):
+    def test_markdown_is_escaped_and_rendered(self):
+        from .rendering import render_markdown
+        self.assertEqual(
+            render_markdown('### Plan\n\n**Step** <script>x</script>\nnext'),
+            '<h3 class="text-lg font-semibold mt-4">Plan</h3>'
+            '<p><strong>Step</strong> &lt;script&gt;x&lt;/script&gt;\nnext</p>',
+        )
+
+    def test_stale_messages_rendered_once_on_display(self):
+        from .rendering import RENDER_VERSION
+        message = ChatMessage.objects.create(chat=self.chat, role='assistant', content='**Hi**')
+        self.client.get(f'/chat/{self.chat.id}/')
+        message.refresh_from_db()
+        self.assertEqual(message.content_html, '<p><strong>Hi</strong></p>')
+        self.assertEqual(message.render_version, RENDER_VERSION)
+
+        # Already rendered: served from the stored HTML
+        with mock.patch('app.rendering.render_markdown', side_effect=AssertionError):
+            response = self.client.get(f'/api/chat/{self.chat.id}/messages/')
+        self.assertEqual(response.json()['messages'][0]['html'], '<p><strong>Hi</strong></p>')
+
+
+@override_settings(ADMISSION_CONTROL_ENABLED=True, ADMISSION_BURST=2, ADMISSION_RATE=0.01)
+class AdmissionControlTests(ChatTestCase):
+    def test_rate_limit_answers_429_with_retry_after(self):
+        with mock.patch('app.views.get_client', return_value=fake_client()):
+            statuses = [self.post_chat(f'Message {i}').status_code for i in range(2)]
+            response = self.post_chat('One too many')
+
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.chat.messages.filter(content='One too many').count(), 0)
+
+    @override_settings(ADMISSION_MAX_IN_FLIGHT=0, ADMISSION_QUEUE_SIZE=0)
+    def test_cached_replies_spend_tokens_but_take_no_run_slot(self):
+        statuses = []
+        with mock.patch('app.views.reply_cache.get_reply', return_value='Cached'):
+            for i in range(3):
+                Chat.objects.filter(id=self.chat.id).update(title='New Chat')
+                statuses.append(self.post_chat('Same first prompt').status_code)
+        self.assertEqual(statuses, [200, 200, 429])
+
+    @override_settings(ADMISSION_MODE_LIMITS={'creative': {'rate': 0}})
+    def test_retention_prunes_buckets_that_refilled(self):
+        import time
+        from .models import RateBucket
+        from .retention import clear_idle_buckets
+        now = time.time()
+        RateBucket.objects.bulk_create([
+            RateBucket(key='professional:session:idle', tokens=0, refilled_at=now - 201),
+            RateBucket(key='professional:session:recent', tokens=0, refilled_at=now - 100),
+            RateBucket(key='creative:session:idle', tokens=0, refilled_at=now - 10000),
+        ])
+        self.assertEqual(clear_idle_buckets(batch_size=1), 1)
+        self.assertEqual(
+            sorted(RateBucket.objects.values_list('key', flat=True)),
+            ['creative:session:idle', 'professional:session:recent'],
+        )
+
+    @override_settings(ADMISSION_MAX_IN_FLIGHT=1, ADMISSION_QUEUE_SIZE=0)
+    def test_full_run_slots_reject_without_waiting(self):
+        from .admission import acquire_slot, release_slot
+        held = acquire_slot('global', 1)
+        try:
+            response = self.post_chat('Hello')
+        finally:
+            release_slot(held)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['error'], 'Server is busy, please try again shortly')
+
+
+class PageCacheTests(ChatTestCase):
+    def test_modes_page_revalidates_until_assistant_changes(self):
+        first = self.client.get('/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        self.assistant.name = 'AI Tutor'
+        self.assistant.save()
+        second = self.client.get('/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertContains(self.client.get(f'/chat/{self.chat.id}/'), '<h1 id="assistantName">AI Tutor</h1>')
+
+    def test_version_follows_deletes_and_the_avatar_manifest(self):
+        from .page_cache import page_version
+        version = page_version()
+        Assistant.objects.create(mode_id='poet', assistant_id='asst_poet', name='AI Poet', mode='creative')
+        added = page_version()
+        self.assertNotEqual(added, version)
+        Assistant.objects.filter(mode_id='poet').delete()
+        self.assertNotEqual(page_version(), added)
+
+        with mock.patch('app.page_cache.load_manifest', return_value={'img/a.png': {'source_hash': 'x'}}):
+            self.assertNotEqual(page_version(), version)
+
+
+class MetricsTests(ChatTestCase):
+    def test_turn_phases_exported_to_staff_and_token_holders(self):
+        from django.contrib.auth.models import User
+        with mock.patch('app.views.get_client', return_value=fake_client()):
+            self.post_chat('Hello')
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape'):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        for line in (
+            'chat_request_seconds_count{view="chat_api",status="200"}',
+            'chat_phase_seconds_count{phase="run",assistant="teacher_tutor"}',
+            'chat_phase_seconds_count{phase="messages_list",assistant="teacher_tutor"}',
+            'assistant_runs_total{assistant="teacher_tutor",status="completed"}',
+            'chat_requests_in_flight{view="chat_api"} 0',
+        ):
+            self.assertIn(line, body)
+
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class UsageLedgerTests(ChatTestCase):
+    @override_settings(MODEL_PRICES={'gpt-4o-mini': {'prompt': 1.0, 'completion': 2.0}})
+    def test_usage_stored_and_rolled_up(self):
+        from django.contrib.auth.models import User
+        with mock.patch('app.views.get_client', return_value=fake_client()):
+            self.post_chat('First')
+            self.post_chat('Second')
+
+        reply = self.chat.messages.filter(role='assistant').last()
+        self.assertEqual((reply.model, reply.prompt_tokens, reply.completion_tokens), ('gpt-4o-mini', 120, 30))
+
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        rows = self.client.get('/api/usage/').json()['assistants']
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(
+            {k: rows[0][k] for k in ('assistant', 'turns', 'prompt_tokens', 'completion_tokens', 'cost')},
+            {'assistant': 'teacher_tutor', 'turns': 2, 'prompt_tokens': 240, 'completion_tokens': 60,
+             'cost': 0.00036},
+        )
+        owners = self.client.get('/api/usage/?by=owner').json()['owners']
+        self.assertEqual([(o['owner'], o['turns']) for o in owners], [(f'session:{self.chat.session_key}', 2)])
+
+
+@override_settings(LLM_BACKEND='stub', OPENAI_API_KEY='')
+class StubBackendTests(ChatTestCase):
+    def test_chat_runs_in_process_without_api_key(self):
+        from .stub_backend import REPLY_TEXT
+        self.chat.delete()
+        response = self.client.get('/chat/create/?assistant_id=teacher_tutor')
+        chat = Chat.objects.get(id=response.url.rstrip('/').split('/')[-1])
+        self.assertTrue(chat.thread_id.startswith('thread_stub'))
+
+        response = self.client.post(
+            '/api/chat/stream/', json.dumps({'message': 'Hello', 'chat_id': chat.id}),
+            content_type='application/json',
+        )
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('event: done', body)
+        reply = chat.messages.get(role='assistant')
+        self.assertEqual((reply.content, reply.model), (REPLY_TEXT, 'stub'))
+        self.assertGreater(reply.prompt_tokens, 0)
+
+
+@override_settings(THREAD_POOL_SIZE=3, THREAD_POOL_LOW_WATER=2)
+class ThreadPoolTests(ChatTestCase):
+    def test_new_chat_takes_spare_thread_and_pool_refills(self):
+        from .models import SpareThread
+        from . import thread_pool
+        SpareThread.objects.create(thread_id='thread_spare')
+        self.chat.delete()
+        client = fake_client()
+        client.beta.threads.create.return_value = SimpleNamespace(id='thread_live')
+        with mock.patch('app.views.get_client', return_value=client), \
+                mock.patch.object(thread_pool, 'schedule_refill') as schedule_refill, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.get('/chat/create/?assistant_id=teacher_tutor')
+            first = Chat.objects.get()
+            first.delete()
+            self.client.get('/chat/create/?assistant_id=teacher_tutor')
+
+        self.assertEqual(first.thread_id, 'thread_spare')
+        self.assertEqual(Chat.objects.get().thread_id, 'thread_live')
+        self.assertEqual(client.beta.threads.create.call_count, 1)
+        self.assertEqual(schedule_refill.call_count, 2)
+
+        client.beta.threads.create.side_effect = [SimpleNamespace(id=f'thread_new{i}') for i in range(3)]
+        self.assertEqual(thread_pool.refill(client), 3)
+        self.assertEqual(SpareThread.objects.count(), 3)
+        self.assertEqual(thread_pool.refill(client), 0)
+
+
+class UniqueChatTests(ChatTestCase):
+    def test_visits_reuse_one_chat_and_race_loser_returns_thread(self):
+        from .models import SpareThread
+        from . import thread_pool
+        response = self.client.get('/chat/create/?assistant_id=teacher_tutor')
+        self.assertRedirects(response, f'/chat/{self.chat.id}/', fetch_redirect_response=False)
+        self.client.get('/chat/create/?assistant_id=teacher_tutor')
+        self.assertEqual(Chat.objects.count(), 1)
+
+        self.chat.delete()
+
+        def concurrent_create(client):
+            # Another request creates the chat while this one fetches a thread
+            Chat.objects.create(assistant=self.assistant, session_key=self.client.session.session_key,
+                                thread_id='thread_winner', title='New Chat')
+            return 'thread_loser'
+
+        with mock.patch.object(thread_pool, 'new_thread_id', side_effect=concurrent_create), \
+                mock.patch('app.views.get_client'):
+            self.client.get('/chat/create/?assistant_id=teacher_tutor')
+        self.assertEqual(Chat.objects.get().thread_id, 'thread_winner')
+        self.assertTrue(SpareThread.objects.filter(thread_id='thread_loser').exists())
+
+    def test_migration_merges_groups_with_a_run_in_progress(self):
+        from datetime import timedelta
+        from django.db import connection
+        from django.utils import timezone
+        from .chat_merge import merge_duplicates
+        from .models import ChatJob
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX unique_active_session_assistant')
+        duplicate = Chat.objects.create(
+            assistant=self.assistant, session_key=self.chat.session_key, thread_id='thread_test', title='Kept title',
+            run_lock_expires_at=timezone.now() + timedelta(minutes=1),
+        )
+        ChatMessage.objects.create(chat=duplicate, role='user', content='Earlier')
+        Chat.objects.filter(id=self.chat.id).update(last_activity=timezone.now() + timedelta(seconds=1))
+
+        self.assertEqual(merge_duplicates(Chat, ChatMessage, ChatJob)['skipped'], 1)
+        totals = merge_duplicates(Chat, ChatMessage, ChatJob, force=True)
+        self.assertEqual((totals['merged'], totals['messages'], totals['skipped']), (1, 1, 0))
+        self.assertEqual(list(Chat.objects.filter(is_active=True)), [self.chat])
+        self.assertEqual(self.chat.messages.get().content, 'Earlier')
+
+
+class RetentionTests(ChatTestCase):
+    def test_archives_idle_and_orphaned_chats_and_resumes(self):
+        import gzip
+        import json
+        import os
+        import tempfile
+        from datetime import timedelta
+        from django.contrib.sessions.models import Session
+        from django.utils import timezone
+        from . import retention
+
+        old = timezone.now() - timedelta(days=60)
+        idle = Chat.objects.create(assistant=self.assistant, session_key='gone', thread_id='thread_idle', title='Idle')
+        ChatMessage.objects.create(chat=idle, role='user', content='Hello')
+        orphan = Chat.objects.create(assistant=self.assistant, session_key='expired', thread_id='thread_orphan')
+        Session.objects.create(session_key='expired', session_data='', expire_date=old)
+        Chat.objects.filter(id=idle.id).update(last_activity=old)
+        Chat.objects.filter(id=orphan.id).update(last_activity=timezone.now() - timedelta(hours=2))
+
+        with tempfile.TemporaryDirectory() as archive_dir, self.settings(CHAT_ARCHIVE_DIR=archive_dir):
+            # An interrupted pass: the idle chat was archived but not deleted,
+            # and the next member was cut off while being written
+            name = f'chats-{timezone.localdate().isoformat()}.jsonl.gz'
+            path = os.path.join(archive_dir, name)
+            size = retention._append(path, retention._records([idle]))
+            with open(path, 'ab') as f:
+                f.write(b'\x1f\x8b partial')
+            retention._save_state(archive_dir, {'file': name, 'size': size, 'pending': [idle.id], 'last_id': 0})
+
+            totals = retention.archive(batch_size=1, duty_cycle=1)
+
+            with gzip.open(path, 'rt') as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual([r['thread_id'] for r in records], ['thread_idle', 'thread_orphan'])
+        self.assertEqual(records[0]['messages'][0]['content'], 'Hello')
+        self.assertEqual((totals['chats'], totals['messages'], totals['sessions']), (2, 1, 1))
+        self.assertEqual(list(Chat.objects.all()), [self.chat])
+        self.assertFalse(Session.objects.filter(session_key='expired').exists())
+
+    def test_partial_member_in_a_fresh_file_is_cut_off(self):
+        import gzip
+        import json
+        import os
+        import tempfile
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import retention
+
+        idle = Chat.objects.create(assistant=self.assistant, session_key='gone', thread_id='thread_idle', title='Idle')
+        Chat.objects.filter(id=idle.id).update(last_activity=timezone.now() - timedelta(days=60))
+
+        def interrupted(path, records):
+            with open(path, 'ab') as f:
+                f.write(b'\x1f\x8b partial')
+            raise KeyboardInterrupt
+
+        with tempfile.TemporaryDirectory() as archive_dir, self.settings(CHAT_ARCHIVE_DIR=archive_dir):
+            with mock.patch.object(retention, '_append', side_effect=interrupted), \
+                    self.assertRaises(KeyboardInterrupt):
+                retention.archive(duty_cycle=1)
+            self.assertTrue(Chat.objects.filter(id=idle.id).exists())
+
+            totals = retention.archive(duty_cycle=1)
+            with gzip.open(os.path.join(archive_dir, totals['file']), 'rt') as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual([r['thread_id'] for r in records], ['thread_idle'])
+        self.assertFalse(Chat.objects.filter(id=idle.id).exists())
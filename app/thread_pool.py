@@ -0,0 +1,160 @@
+"""
+Pool of pre-created OpenAI threads for new chats.
+
+Creating a thread is a round trip to OpenAI that ``create_chat`` would
+otherwise make before it can redirect. Spare thread ids are kept in the
+``SpareThread`` table instead; a new chat takes the oldest one with a
+conditional DELETE (whoever deletes the row owns the thread, so two processes
+never get the same id) and only creates a thread live when the pool is empty.
+
+After each take, a refill is scheduled on a single background thread per
+process. It tops the pool up to ``THREAD_POOL_SIZE`` once fewer than
+``THREAD_POOL_LOW_WATER`` are left, and drops spares older than
+``THREAD_POOL_MAX_AGE`` days. ``THREAD_POOL_SIZE=0`` turns the pool off.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import SpareThread
+from .openai_client import get_client
+
+
+# Concurrent threads.create calls during a refill
+REFILL_CONCURRENCY = 4
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_refilling = False
+
+# Per-process counters: a "hit" is a chat that got a spare thread, a "miss"
+# one that had to create its thread live
+_stats = {'hits': 0, 'misses': 0, 'refill_errors': 0}
+
+POOL_TAKES = metrics.Counter('thread_pool_takes', 'New chat threads by source', ['result'])
+POOL_AVAILABLE = metrics.Gauge('thread_pool_available', 'Spare threads seen at the last refill')
+
+
+def _enabled():
+    return settings.THREAD_POOL_SIZE > 0
+
+
+def _record(hit):
+    with _lock:
+        _stats['hits' if hit else 'misses'] += 1
+    POOL_TAKES.labels('hit' if hit else 'miss').inc()
+
+
+def stats():
+    """Snapshot of this process's hit/miss counters and the current pool size."""
+    with _lock:
+        snapshot = dict(_stats)
+    total = snapshot['hits'] + snapshot['misses']
+    snapshot['hit_rate'] = snapshot['hits'] / total if total else None
+    snapshot['available'] = SpareThread.objects.count()
+    return snapshot
+
+
+def take():
+    """Claim the oldest spare thread id, or return None when the pool is empty."""
+    for _ in range(3):
+        candidate = SpareThread.objects.order_by('id').values_list('id', 'thread_id').first()
+        if candidate is None:
+            return None
+        if SpareThread.objects.filter(id=candidate[0]).delete()[0]:
+            return candidate[1]
+        # Taken by a concurrent request; try the next one
+    return None
+
+
+def refill(client=None, low_water=None):
+    """Top the pool up if it is below the low-water mark; return how many threads were added."""
+    SpareThread.objects.filter(
+        created_at__lt=timezone.now() - timedelta(days=settings.THREAD_POOL_MAX_AGE),
+    ).delete()
+    available = SpareThread.objects.count()
+    POOL_AVAILABLE.labels().set(available)
+    if available >= (settings.THREAD_POOL_LOW_WATER if low_water is None else low_water):
+        return 0
+    client = client or get_client()
+    added = 0
+    with ThreadPoolExecutor(max_workers=REFILL_CONCURRENCY) as pool:
+        futures = [pool.submit(client.beta.threads.create) for _ in range(settings.THREAD_POOL_SIZE - available)]
+        for future in as_completed(futures):
+            # Stored one by one so chats can take them while the refill goes on
+            SpareThread.objects.create(thread_id=future.result().id)
+            added += 1
+    POOL_AVAILABLE.labels().set(available + added)
+    return added
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    with _lock:
+        if _executor is None or _executor_pid != pid:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thread-pool')
+            _executor_pid = pid
+        return _executor
+
+
+def _run_refill():
+    global _refilling
+    close_old_connections()
+    try:
+        refill()
+    except Exception:
+        with _lock:
+            _stats['refill_errors'] += 1
+    finally:
+        with _lock:
+            _refilling = False
+        close_old_connections()
+
+
+def schedule_refill():
+    """Refill in the background, unless a refill is already pending in this process."""
+    global _refilling
+    with _lock:
+        if _refilling:
+            return
+        _refilling = True
+    _get_executor().submit(_run_refill)
+
+
+def give_back(thread_id):
+    """Return an unused thread id to the pool (e.g. its chat lost a get-or-create race)."""
+    if _enabled():
+        SpareThread.objects.bulk_create([SpareThread(thread_id=thread_id)], ignore_conflicts=True)
+
+
+def new_thread_id(client):
+    """Thread id for a new chat: a spare one if available, else created with ``client``."""
+    if not _enabled():
+        return client.beta.threads.create().id
+    thread_id = take()
+    _record(hit=thread_id is not None)
+    transaction.on_commit(schedule_refill)
+    if thread_id is None:
+        thread_id = client.beta.threads.create().id
+    return thread_id
+
+
+async def anew_thread_id(client):
+    """Async version of new_thread_id for AsyncOpenAI clients."""
+    if not _enabled():
+        return (await client.beta.threads.create()).id
+    thread_id = await sync_to_async(take)()
+    _record(hit=thread_id is not None)
+    schedule_refill()
+    if thread_id is None:
+        thread_id = (await client.beta.threads.create()).id
+    return thread_id
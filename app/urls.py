@@ -6,7 +6,15 @@ urlpatterns = [
     path('chat/create/', views.create_chat, name='create_chat'),
     path('chat/<int:chat_id>/', views.chat_detail, name='chat_detail'),
     path('api/chat/', views.chat_api, name='chat_api'),
+    path('api/chat/<int:chat_id>/messages/', views.chat_messages, name='chat_messages'),
+    path('api/chat/jobs/<uuid:job_id>/', views.chat_job_status, name='chat_job_status'),
+    path('api/chat/stream/', views.chat_stream_api, name='chat_stream_api'),
+    path('chat/create/async/', views.create_chat_async, name='create_chat_async'),
+    path('api/chat/async/', views.chat_api_async, name='chat_api_async'),
     path('api/modes/', views.list_modes, name='list_modes'),
+    path('api/openai/pool/', views.openai_pool_stats, name='openai_pool_stats'),
+    path('api/usage/', views.usage_rollups, name='usage_rollups'),
+    path('metrics', views.metrics_endpoint, name='metrics'),
 ]
 
 
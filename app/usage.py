@@ -0,0 +1,108 @@
+"""
+Token usage ledger.
+
+Every assistant reply stores the model and the prompt/completion tokens of the
+run (or completion) that produced it. In the same transaction, two daily
+rollups are bumped:
+
+* ``AssistantUsageDaily``: per assistant, day and model
+* ``OwnerUsageDaily``: per owner (``user:<id>`` or ``session:<key>``) and day
+
+A bump is one conditional UPDATE of ``F()`` increments; the row is created
+(ignoring conflicts) on the first turn of the day. So dashboards and quotas
+read a few rollup rows and never scan ``ChatMessage``. Tokens of failed runs
+are counted too, since they are billed, but only replies count as turns.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AssistantUsageDaily, OwnerUsageDaily
+
+
+def from_response(response):
+    """``model``/``prompt_tokens``/``completion_tokens`` of a run or completion, or None."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return None
+    return {
+        'model': getattr(response, 'model', None) or '',
+        'prompt_tokens': usage.prompt_tokens or 0,
+        'completion_tokens': usage.completion_tokens or 0,
+    }
+
+
+def owner_key(chat):
+    if chat.user_id:
+        return f'user:{chat.user_id}'
+    return f'session:{chat.session_key}'
+
+
+def _bump(model, lookup, turns, usage):
+    changes = {
+        'turns': F('turns') + turns,
+        'prompt_tokens': F('prompt_tokens') + usage['prompt_tokens'],
+        'completion_tokens': F('completion_tokens') + usage['completion_tokens'],
+    }
+    if not model.objects.filter(**lookup).update(**changes):
+        model.objects.bulk_create([model(**lookup)], ignore_conflicts=True)
+        model.objects.filter(**lookup).update(**changes)
+
+
+def record(chat, usage, replied):
+    """Add one run's usage to the daily rollups (call inside the turn's transaction)."""
+    if usage is None:
+        return
+    day = timezone.localdate()
+    turns = 1 if replied else 0
+    _bump(AssistantUsageDaily, {'assistant_id': chat.assistant_id, 'day': day, 'model': usage['model']},
+          turns, usage)
+    _bump(OwnerUsageDaily, {'owner': owner_key(chat), 'day': day}, turns, usage)
+
+
+def cost(model, prompt_tokens, completion_tokens):
+    """USD cost from ``MODEL_PRICES`` (per million tokens), or None if the model has no price."""
+    prices = settings.MODEL_PRICES.get(model)
+    if not prices:
+        return None
+    return round(
+        (prompt_tokens * prices['prompt'] + completion_tokens * prices['completion']) / 1_000_000, 6,
+    )
+
+
+def assistant_rollups(days):
+    """Rows of the last ``days`` days of per-assistant usage, newest first."""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = (
+        AssistantUsageDaily.objects.filter(day__gte=since)
+        .order_by('-day', 'assistant__mode_id', 'model')
+        .values('day', 'assistant__mode_id', 'model', 'turns', 'prompt_tokens', 'completion_tokens')
+    )
+    return [{
+        'day': row['day'].isoformat(),
+        'assistant': row['assistant__mode_id'],
+        'model': row['model'],
+        'turns': row['turns'],
+        'prompt_tokens': row['prompt_tokens'],
+        'completion_tokens': row['completion_tokens'],
+        'cost': cost(row['model'], row['prompt_tokens'], row['completion_tokens']),
+    } for row in rows]
+
+
+def owner_rollups(days, owner=None):
+    """Rows of the last ``days`` days of per-owner usage, newest first."""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = OwnerUsageDaily.objects.filter(day__gte=since)
+    if owner:
+        rows = rows.filter(owner=owner)
+    return [{
+        'day': row['day'].isoformat(),
+        'owner': row['owner'],
+        'turns': row['turns'],
+        'prompt_tokens': row['prompt_tokens'],
+        'completion_tokens': row['completion_tokens'],
+    } for row in rows.order_by('-day', 'owner').values(
+        'day', 'owner', 'turns', 'prompt_tokens', 'completion_tokens',
+    )]
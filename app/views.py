@@ -1,24 +1,66 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.template.loader import render_to_string
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, HttpResponseNotModified, JsonResponse, StreamingHttpResponse,
+)
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.http import http_date, parse_http_date_safe
 from django.utils.safestring import mark_safe
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.db import transaction
+from django.db.models import Q
+from asgiref.sync import sync_to_async
+import asyncio
 import json
 import os
-from openai import OpenAI
-from .modes import get_assistant_prompt, list_modes as modes_catalog, get_assistant_meta
-from .models import Assistant, Chat, ChatMessage
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .modes import (
+    get_assistant_prompt, list_modes as modes_catalog, get_assistant_meta,
+    CATALOG_ETAG, CATALOG_JSON, CATALOG_SCRIPT_JSON,
+)
+from .models import Assistant, Chat, ChatMessage, ChatJob
+from .jobs import enqueue, job_payload
+from . import admission, completions, metrics, page_cache, reply_cache, thread_pool, usage as usage_ledger
+from .rendering import ensure_rendered
+from .openai_client import get_client, get_async_client, is_configured, pool_stats
+from .runs import (
+    queue_user_message, record_local_turn, begin_run, complete_run, execute_batch, turn_result,
+    run_messages, run_turn, arun_turn, end_run, renewing_run_lock,
+)
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
 
 
 def modes_page(request):
-    return render(request, 'modes.html', {})
+    """Landing page, rendered once per page version and served with ETag/Last-Modified."""
+    version = page_cache.page_version()
+    cached = page_cache.get_page('modes', version)
+    if cached is None:
+        cached = (render_to_string('modes.html', {}), int(time.time()))
+        page_cache.set_page('modes', version, *cached)
+    html, rendered_at = cached
+
+    etag = f'"{version}"'
+    if_none_match = request.headers.get('If-None-Match')
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if if_none_match is not None:
+        not_modified = etag in [tag.strip() for tag in if_none_match.split(',')]
+    else:
+        not_modified = if_modified_since is not None and rendered_at <= if_modified_since
+    response = HttpResponseNotModified() if not_modified else HttpResponse(html)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(rendered_at)
+    response['Cache-Control'] = f'public, max-age={settings.PAGE_CACHE_MAX_AGE}'
+    return response
 
 
 def create_chat(request):
-    """Create a new chat with the selected assistant or reuse existing one"""
+    """Open the owner's chat with the selected assistant, creating it on the first visit"""
     assistant_id = request.GET.get('assistant_id')
     if not assistant_id:
         return redirect('modes_page')
@@ -36,40 +78,24 @@ def create_chat(request):
         request.session.create()
         session_key = request.session.session_key
     
-    # Check if user/session already has a thread with this assistant
-    existing_thread_id = None
-    try:
-        if user:
-            existing_chat = Chat.objects.filter(user=user, assistant=assistant).order_by('-created_at').first()
+    # One active chat per owner and assistant (see the constraints on Chat)
+    owner = {'user': user} if user else {'session_key': session_key}
+    chat = Chat.objects.filter(assistant=assistant, is_active=True, **owner).order_by('-last_activity').first()
+    if chat is None:
+        if assistant.engine == Assistant.ENGINE_CHAT_COMPLETIONS:
+            # History is kept locally, no OpenAI thread needed
+            openai_thread_id = ''
         else:
-            existing_chat = Chat.objects.filter(session_key=session_key, assistant=assistant).order_by('-created_at').first()
-        
-        if existing_chat:
-            existing_thread_id = existing_chat.thread_id
-        
-    except Chat.DoesNotExist:
-        pass
-    
-    # Create new chat (always create new chat record)
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
-    
-    if existing_thread_id:
-        # Reuse existing thread
-        openai_thread_id = existing_thread_id
-    else:
-        # Create new thread
-        openai_thread = client.beta.threads.create()
-        openai_thread_id = openai_thread.id
-    
-    # Create new chat in database
-    chat = Chat.objects.create(
-        assistant=assistant,
-        user=user,
-        session_key=session_key if not user else None,
-        thread_id=openai_thread_id,
-        title="New Chat"
-    )
-    
+            # Take a pre-created thread, or create one if the pool is empty
+            openai_thread_id = thread_pool.new_thread_id(get_client())
+        chat, created = Chat.objects.get_or_create(
+            assistant=assistant, is_active=True, **owner,
+            defaults={'thread_id': openai_thread_id, 'title': 'New Chat'},
+        )
+        if not created and openai_thread_id:
+            # A concurrent request created the chat first
+            thread_pool.give_back(openai_thread_id)
+
     return redirect('chat_detail', chat_id=chat.id)
 
 
@@ -81,117 +107,606 @@ def chat_detail(request, chat_id):
     user = request.user if request.user.is_authenticated else None
     session_key = request.session.session_key
     
-    if user and chat.user != user:
+    if user and chat.user_id != user.id:
         return redirect('modes_page')
     elif not user and chat.session_key != session_key:
         return redirect('modes_page')
     
-    # Get chat messages
-    messages = chat.messages.all()
+    # Only the most recent page is rendered; older messages load on scroll
+    messages, has_more = _message_page(chat, settings.CHAT_HISTORY_PAGE_SIZE)
+    ensure_rendered(messages)
     
     context = {
         'chat': chat,
         'messages': messages,
+        'history_cursor': _message_cursor(messages[0]) if has_more else '',
         'assistant': chat.assistant,
+        # Inlined so the page can draw the mode tabs without fetching /api/modes/
+        'modes_catalog_json': mark_safe(CATALOG_SCRIPT_JSON),
+        # Static parts of the page are cached per assistant and page version
+        'page_version': page_cache.page_version(),
+        'page_cache_timeout': settings.PAGE_CACHE_TIMEOUT,
     }
     
     return render(request, 'chat.html', context)
 
 
-@csrf_exempt
-@require_POST
-def chat_api(request):
+def _message_cursor(message):
+    """Opaque keyset cursor for a message: ``<created_at in epoch microseconds>_<id>``."""
+    delta = message.created_at - _EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return f'{micros}_{message.id}'
+
+
+# Largest id a database integer column holds
+_MAX_ID = 2 ** 63 - 1
+
+
+def _parse_cursor(cursor):
+    """Inverse of _message_cursor; raises ValueError or OverflowError on a bad cursor."""
+    micros, message_id = cursor.split('_')
+    message_id = int(message_id)
+    if not 0 < message_id <= _MAX_ID:
+        raise ValueError(f'Message id out of range: {message_id}')
+    return _EPOCH + timedelta(microseconds=int(micros)), message_id
+
+
+def _message_page(chat, limit, before=None):
+    """Return up to ``limit`` messages older than ``before`` (oldest first) and
+    whether more exist. Walks the ``(chat, created_at)`` index backwards."""
+    queryset = chat.messages.order_by('-created_at', '-id')
+    if before:
+        created_at, message_id = before
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id)
+        )
+    page = list(queryset[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+    return page, has_more
+
+
+def chat_messages(request, chat_id):
+    """Older messages of a chat, keyset-paginated with ``?before=<cursor>&limit=<n>``"""
+    if request.method != 'GET':
+        return HttpResponseBadRequest('Only GET allowed')
+
+    chat = get_object_or_404(Chat, id=chat_id)
+
+    user = request.user if request.user.is_authenticated else None
+    session_key = request.session.session_key
+
+    if user and chat.user_id != user.id:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    elif not user and chat.session_key != session_key:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    try:
+        before = _parse_cursor(request.GET['before']) if request.GET.get('before') else None
+        limit = int(request.GET.get('limit', settings.CHAT_HISTORY_PAGE_SIZE))
+    except (ValueError, OverflowError, OSError):
+        return HttpResponseBadRequest('Invalid cursor or limit')
+    limit = max(1, min(limit, settings.CHAT_HISTORY_MAX_PAGE_SIZE))
+
+    messages, has_more = _message_page(chat, limit, before)
+    ensure_rendered(messages)
+    return JsonResponse({
+        'messages': [
+            {
+                'id': m.id,
+                'role': m.role,
+                'content': m.content,
+                'html': m.content_html if m.role == 'assistant' else None,
+                'created_at': m.created_at.isoformat(),
+            }
+            for m in messages
+        ],
+        'next_cursor': _message_cursor(messages[0]) if has_more else None,
+    })
+
+
+def _rejected(rejection):
+    """429 response for a request turned away by admission control."""
+    response = JsonResponse(
+        {'error': rejection.reason, 'retry_after': rejection.retry_after}, status=429,
+    )
+    response['Retry-After'] = str(rejection.retry_after)
+    return response
+
+
+def _load_chat_request(request):
+    """Parse a chat API request body and resolve the chat it targets.
+
+    Returns ``(chat, payload, None)`` on success or ``(None, None, response)``
+    with the error response to send back.
+    """
     try:
         payload = json.loads(request.body.decode('utf-8'))
     except json.JSONDecodeError:
-        return HttpResponseBadRequest('Invalid JSON')
+        return None, None, HttpResponseBadRequest('Invalid JSON')
 
     message = payload.get('message')
     if not message or not isinstance(message, str):
-        return HttpResponseBadRequest('message must be a non-empty string')
+        return None, None, HttpResponseBadRequest('message must be a non-empty string')
 
     chat_id = payload.get('chat_id')
     if not chat_id:
-        return HttpResponseBadRequest('chat_id is required')
+        return None, None, HttpResponseBadRequest('chat_id is required')
 
     # Get chat
     try:
-        chat = Chat.objects.get(id=chat_id)
+        chat = Chat.objects.select_related('assistant').get(id=chat_id)
     except Chat.DoesNotExist:
-        return JsonResponse({'error': f'Chat {chat_id} not found'}, status=404)
+        return None, None, JsonResponse({'error': f'Chat {chat_id} not found'}, status=404)
 
     # Check if user has access to this chat
     user = request.user if request.user.is_authenticated else None
     session_key = request.session.session_key
     
-    if user and chat.user != user:
-        return JsonResponse({'error': 'Access denied'}, status=403)
+    if user and chat.user_id != user.id:
+        return None, None, JsonResponse({'error': 'Access denied'}, status=403)
     elif not user and chat.session_key != session_key:
-        return JsonResponse({'error': 'Access denied'}, status=403)
+        return None, None, JsonResponse({'error': 'Access denied'}, status=403)
+
+    return chat, payload, None
+
 
-    api_key = settings.OPENAI_API_KEY
-    if not api_key:
+@csrf_exempt
+@require_POST
+@metrics.instrumented('chat_api')
+def chat_api(request):
+    chat, payload, error = _load_chat_request(request)
+    if error:
+        return error
+    message = payload['message']
+
+    if not is_configured():
         return JsonResponse({'error': 'Server missing OPENAI_API_KEY'}, status=500)
 
-    client = OpenAI(api_key=api_key)
+    client = get_client()
 
     try:
-        # Store user message in database
-        user_message = ChatMessage.objects.create(
-            chat=chat,
-            role='user',
-            content=message
-        )
-        
-        # Update chat title if it's the first message
-        if chat.title == "New Chat" and not chat.messages.filter(role='assistant').exists():
-            chat.title = message[:50] + "..." if len(message) > 50 else message
-            chat.save()
-        
-        # Add user message to OpenAI thread
-        client.beta.threads.messages.create(
-            thread_id=chat.thread_id,
-            role="user",
-            content=message
-        )
-        
-        # Run the assistant
-        run = client.beta.threads.runs.create_and_poll(
+        label = chat.assistant.mode_id
+        try:
+            with metrics.phase('admission', label):
+                admission.check_rate(request, chat.assistant.mode)
+        except admission.Rejected as rejection:
+            return _rejected(rejection)
+
+        # A chat's first message may be answered from the reply cache
+        first_turn = chat.title == "New Chat"
+        cached = reply_cache.get_reply(chat.assistant, message) if first_turn else None
+        if cached is not None:
+            record_local_turn(chat, message, cached)
+            return JsonResponse({'reply': cached, 'cached': True})
+
+        mode = payload.get('mode') or ('job' if settings.CHAT_API_JOB_MODE else 'sync')
+        # Jobs take no run slot; the job pool bounds their concurrency
+        try:
+            with metrics.phase('admission', label):
+                ticket = admission.take_slots(chat.assistant.mode) if mode != 'job' else admission.Ticket()
+        except admission.Rejected as rejection:
+            return _rejected(rejection)
+
+        try:
+            if mode == 'job':
+                # Job mode: hand the turn to the background pool and answer right away
+                with metrics.phase('intake', label), transaction.atomic():
+                    user_message = queue_user_message(chat, message)
+                    job = enqueue(chat, user_message)
+                data = job_payload(job)
+                data['status_url'] = reverse('chat_job_status', kwargs={'job_id': job.id})
+                return JsonResponse(data, status=202)
+
+            # Store user message and bump the chat in one transaction; the run
+            # queue picks the message up from there
+            with metrics.phase('intake', label):
+                user_message = queue_user_message(chat, message)
+
+            # Run the assistant (serialized per chat, batched with concurrent sends)
+            reply, error = run_turn(chat, user_message, client)
+        finally:
+            ticket.release()
+        if error:
+            return JsonResponse({'error': error}, status=500)
+        if first_turn:
+            reply_cache.store_reply(chat.assistant, message, reply)
+        return JsonResponse({'reply': reply})
+            
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _sse(event, data):
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _stream_run(chat, batch, client, run):
+    """Run ``batch`` with run streaming, yielding SSE ``delta`` frames.
+
+    Returns ``(reply, error, usage)`` as the generator's return value. The
+    OpenAI run id is stored in ``run['id']`` as soon as it is known.
+    """
+    parts = []
+    failed_status = None
+    usage = None
+    try:
+        with client.beta.threads.runs.stream(
             thread_id=chat.thread_id,
-            assistant_id=chat.assistant.assistant_id
+            assistant_id=chat.assistant.assistant_id,
+            additional_messages=run_messages(batch),
+            **chat.assistant.run_limits(),
+        ) as stream:
+            for event in stream:
+                if event.event == 'thread.run.created':
+                    run['id'] = event.data.id
+                elif event.event == 'thread.message.delta':
+                    for block in event.data.delta.content or []:
+                        if block.type == 'text' and block.text and block.text.value:
+                            parts.append(block.text.value)
+                            yield _sse('delta', {'text': block.text.value})
+                elif event.event in ('thread.run.failed', 'thread.run.cancelled',
+                                     'thread.run.expired', 'thread.run.incomplete'):
+                    failed_status = event.data.status
+                    usage = usage_ledger.from_response(event.data)
+                elif event.event == 'thread.run.completed':
+                    usage = usage_ledger.from_response(event.data)
+    except Exception as e:
+        metrics.record_error(chat.assistant.mode_id, e)
+        return None, str(e), usage
+
+    if failed_status:
+        return None, f'Assistant run failed with status: {failed_status}', usage
+    content = ''.join(parts)
+    if not content:
+        return None, 'No response from assistant', usage
+    return content, '', usage
+
+
+def _stream_completion(chat, batch, client):
+    """Chat Completions counterpart of _stream_run."""
+    deltas = completions.stream(chat, batch, client)
+    while True:
+        try:
+            text = next(deltas)
+        except StopIteration as stop:
+            return stop.value
+        yield _sse('delta', {'text': text})
+
+
+@csrf_exempt
+@require_POST
+@metrics.instrumented('chat_stream_api')
+def chat_stream_api(request):
+    """Stream the assistant reply as Server-Sent Events.
+
+    Emits ``delta`` events carrying text fragments as the run produces them,
+    then a single ``done`` event with the full reply (or an ``error`` event).
+    The complete reply is stored as a ChatMessage once the stream ends.
+    """
+    chat, payload, error = _load_chat_request(request)
+    if error:
+        return error
+    message = payload['message']
+
+    if not is_configured():
+        return JsonResponse({'error': 'Server missing OPENAI_API_KEY'}, status=500)
+
+    client = get_client()
+
+    # Store user message before the stream starts so request errors still
+    # surface as a regular JSON response.
+    label = chat.assistant.mode_id
+    ticket = admission.Ticket()
+    try:
+        with metrics.phase('admission', label):
+            admission.check_rate(request, chat.assistant.mode)
+        first_turn = chat.title == "New Chat"
+        cached = reply_cache.get_reply(chat.assistant, message) if first_turn else None
+        if cached is not None:
+            record_local_turn(chat, message, cached)
+        else:
+            with metrics.phase('admission', label):
+                ticket = admission.take_slots(chat.assistant.mode)
+            with metrics.phase('intake', label):
+                user_message = queue_user_message(chat, message)
+    except admission.Rejected as rejection:
+        return _rejected(rejection)
+    except Exception as e:
+        ticket.release()
+        return JsonResponse({'error': str(e)}, status=500)
+
+    if cached is not None:
+        response = StreamingHttpResponse(
+            iter([_sse('delta', {'text': cached}), _sse('done', {'reply': cached})]),
+            content_type='text/event-stream',
         )
-        
-        if run.status == 'completed':
-            # Get the latest assistant message
-            messages = client.beta.threads.messages.list(
-                thread_id=chat.thread_id,
-                order="desc",
-                limit=1
-            )
-            
-            if messages.data:
-                content = messages.data[0].content[0].text.value
-                
-                # Store assistant message in database
-                assistant_message = ChatMessage.objects.create(
-                    chat=chat,
-                    role='assistant',
-                    content=content
-                )
-                
-                return JsonResponse({'reply': content})
-            else:
-                return JsonResponse({'error': 'No response from assistant'}, status=500)
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def result_event(result):
+        reply, error = result
+        if error:
+            return _sse('error', {'error': error})
+        return _sse('done', {'reply': reply})
+
+    def event_stream():
+        # The run slot is held while streaming. If the response is closed
+        # before streaming starts, the slot's lease lapses on its own.
+        try:
+            yield from run_stream()
+        finally:
+            ticket.release()
+
+    def run_stream():
+        # Wait for the chat's run lock; if another request answers this
+        # message in the meantime (batched into its run), send that reply.
+        waiting = time.perf_counter()
+        deadline = time.monotonic() + settings.CHAT_RUN_WAIT_TIMEOUT
+        while True:
+            with metrics.phase('claim', label):
+                token, batch = begin_run(chat)
+            if token:
+                if waiting is not None:
+                    metrics.observe_phase('queue_wait', label, time.perf_counter() - waiting)
+                    waiting = None
+                ours = any(m.id == user_message.id for m in batch)
+                settled = False
+                run = {}
+                try:
+                    with metrics.RUNS_IN_FLIGHT.labels(label).track_in_progress(), \
+                            renewing_run_lock(chat.id, token):
+                        if ours:
+                            with metrics.phase('run', label):
+                                if chat.assistant.engine == Assistant.ENGINE_CHAT_COMPLETIONS:
+                                    reply, error, usage = yield from _stream_completion(chat, batch, client)
+                                else:
+                                    reply, error, usage = yield from _stream_run(chat, batch, client, run)
+                        else:
+                            reply, error, usage = execute_batch(chat, batch, client)
+                        with metrics.phase('complete', label):
+                            complete_run(chat, batch, token, reply, error, usage)
+                    settled = True
+                finally:
+                    if not settled:
+                        # Client went away mid-stream; the OpenAI run goes on unless
+                        # cancelled, so the lease is kept until it has ended
+                        released = end_run(client, chat.thread_id, run.get('id'))
+                        complete_run(chat, batch, token, None, 'Stream was interrupted', release=released)
+                if ours:
+                    if first_turn and not error:
+                        reply_cache.store_reply(chat.assistant, message, reply)
+                    yield result_event((reply, error or None))
+                    return
+                continue
+
+            result = turn_result(user_message)
+            if result is not None:
+                if waiting is not None:
+                    metrics.observe_phase('queue_wait', label, time.perf_counter() - waiting)
+                yield result_event(result)
+                return
+            if time.monotonic() > deadline:
+                yield _sse('error', {'error': 'Chat is busy, please try again shortly'})
+                return
+            time.sleep(settings.CHAT_RUN_POLL_INTERVAL)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Async variants ---------------------------------------------------------------
+#
+# Under ASGI these hold no worker thread while waiting on OpenAI, so a single
+# process can keep many runs pending at once. They mirror the sync views above.
+
+async def create_chat_async(request):
+    """Async version of create_chat built on AsyncOpenAI and the async ORM"""
+    assistant_id = request.GET.get('assistant_id')
+    if not assistant_id:
+        return redirect('modes_page')
+
+    try:
+        assistant = await Assistant.objects.aget(mode_id=assistant_id)
+    except Assistant.DoesNotExist:
+        return redirect('modes_page')
+
+    user = await request.auser()
+    user = user if user.is_authenticated else None
+    session_key = request.session.session_key
+
+    # Ensure session exists
+    if not session_key:
+        await request.session.acreate()
+        session_key = request.session.session_key
+
+    owner = {'user': user} if user else {'session_key': session_key}
+    chat = await Chat.objects.filter(assistant=assistant, is_active=True, **owner).order_by('-last_activity').afirst()
+    if chat is None:
+        if assistant.engine == Assistant.ENGINE_CHAT_COMPLETIONS:
+            openai_thread_id = ''
         else:
-            return JsonResponse({'error': f'Assistant run failed with status: {run.status}'}, status=500)
-            
+            openai_thread_id = await thread_pool.anew_thread_id(get_async_client())
+        chat, created = await Chat.objects.aget_or_create(
+            assistant=assistant, is_active=True, **owner,
+            defaults={'thread_id': openai_thread_id, 'title': 'New Chat'},
+        )
+        if not created and openai_thread_id:
+            await sync_to_async(thread_pool.give_back)(openai_thread_id)
+
+    return redirect('chat_detail', chat_id=chat.id)
+
+
+async def _aload_chat_request(request):
+    """Async version of _load_chat_request."""
+    try:
+        payload = json.loads(request.body.decode('utf-8'))
+    except json.JSONDecodeError:
+        return None, None, HttpResponseBadRequest('Invalid JSON')
+
+    message = payload.get('message')
+    if not message or not isinstance(message, str):
+        return None, None, HttpResponseBadRequest('message must be a non-empty string')
+
+    chat_id = payload.get('chat_id')
+    if not chat_id:
+        return None, None, HttpResponseBadRequest('chat_id is required')
+
+    try:
+        chat = await Chat.objects.select_related('assistant').aget(id=chat_id)
+    except Chat.DoesNotExist:
+        return None, None, JsonResponse({'error': f'Chat {chat_id} not found'}, status=404)
+
+    user = await request.auser()
+    user = user if user.is_authenticated else None
+    session_key = request.session.session_key
+
+    if user and chat.user_id != user.id:
+        return None, None, JsonResponse({'error': 'Access denied'}, status=403)
+    elif not user and chat.session_key != session_key:
+        return None, None, JsonResponse({'error': 'Access denied'}, status=403)
+
+    return chat, payload, None
+
+
+@csrf_exempt
+@require_POST
+@metrics.instrumented('chat_api_async')
+async def chat_api_async(request):
+    """Async version of chat_api built on AsyncOpenAI and the async ORM"""
+    chat, payload, error = await _aload_chat_request(request)
+    if error:
+        return error
+    message = payload['message']
+
+    if not is_configured():
+        return JsonResponse({'error': 'Server missing OPENAI_API_KEY'}, status=500)
+
+    client = get_async_client()
+
+    try:
+        label = chat.assistant.mode_id
+        try:
+            with metrics.phase('admission', label):
+                await admission.acheck_rate(request, chat.assistant.mode)
+        except admission.Rejected as rejection:
+            return _rejected(rejection)
+
+        first_turn = chat.title == "New Chat"
+        cached = await reply_cache.aget_reply(chat.assistant, message) if first_turn else None
+        if cached is not None:
+            await sync_to_async(record_local_turn)(chat, message, cached)
+            return JsonResponse({'reply': cached, 'cached': True})
+
+        try:
+            with metrics.phase('admission', label):
+                ticket = await admission.atake_slots(chat.assistant.mode)
+        except admission.Rejected as rejection:
+            return _rejected(rejection)
+
+        try:
+            with metrics.phase('intake', label):
+                user_message = await sync_to_async(queue_user_message)(chat, message)
+            reply, error = await arun_turn(chat, user_message, client)
+        finally:
+            await sync_to_async(ticket.release)()
+        if error:
+            return JsonResponse({'error': error}, status=500)
+        if first_turn:
+            await reply_cache.astore_reply(chat.assistant, message, reply)
+        return JsonResponse({'reply': reply})
+
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
-def list_modes(request):
+async def chat_job_status(request, job_id):
+    """Report a chat job's state, long-polling up to ``?wait=<seconds>`` for it to finish."""
     if request.method != 'GET':
         return HttpResponseBadRequest('Only GET allowed')
-    return JsonResponse({'modes': modes_catalog()})
 
-# Create your views here.
+    try:
+        job = await ChatJob.objects.select_related('chat').aget(id=job_id)
+    except ChatJob.DoesNotExist:
+        return JsonResponse({'error': f'Job {job_id} not found'}, status=404)
+
+    user = await request.auser()
+    user = user if user.is_authenticated else None
+    if user and job.chat.user_id != user.id:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    elif not user and job.chat.session_key != request.session.session_key:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return HttpResponseBadRequest('wait must be a number of seconds')
+    deadline = time.monotonic() + min(max(wait, 0), settings.CHAT_JOB_LONG_POLL_TIMEOUT)
+
+    while job.status in (ChatJob.QUEUED, ChatJob.RUNNING) and time.monotonic() < deadline:
+        await asyncio.sleep(settings.CHAT_RUN_POLL_INTERVAL)
+        job = await ChatJob.objects.only('id', 'status', 'reply', 'error').aget(id=job_id)
+
+    return JsonResponse(job_payload(job))
+
+
+def list_modes(request):
+    """Modes catalog without system prompts (``?include=prompts`` for the full MODES).
+
+    The compact catalog is serialized once at startup and served with a strong
+    ETag, so repeat requests are answered with 304 Not Modified.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseBadRequest('Only GET allowed')
+    if request.GET.get('include') == 'prompts':
+        return JsonResponse({'modes': modes_catalog()})
+
+    cache_control = f'public, max-age={settings.MODES_CATALOG_MAX_AGE}'
+    if_none_match = request.headers.get('If-None-Match', '')
+    if CATALOG_ETAG in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(CATALOG_JSON, content_type='application/json')
+    response['ETag'] = CATALOG_ETAG
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def openai_pool_stats(request):
+    """Connection reuse counters for the shared OpenAI client and spare-thread pool hit rate (staff only)."""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    return JsonResponse({'pid': os.getpid(), **pool_stats(), 'thread_pool': thread_pool.stats()})
+
+
+def usage_rollups(request):
+    """Daily token usage per assistant (and per owner with ``?by=owner``), staff only.
+
+    ``?days=`` selects how many days back (default 30); ``?owner=`` narrows the
+    per-owner rollup to one ``user:<id>``/``session:<key>``.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), 366)
+    except ValueError:
+        return HttpResponseBadRequest('days must be a whole number')
+    if request.GET.get('by') == 'owner':
+        return JsonResponse({'days': days, 'owners': usage_ledger.owner_rollups(days, request.GET.get('owner'))})
+    return JsonResponse({'days': days, 'assistants': usage_ledger.assistant_rollups(days)})
+
+
+def metrics_endpoint(request):
+    """Chat pipeline metrics of this process in Prometheus text format.
+
+    Open to staff, or to scrapers sending ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+    token = settings.METRICS_TOKEN
+    authorized = bool(token) and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized and not request.user.is_staff:
+        return HttpResponse('Access denied', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
 from dotenv import load_dotenv
 
@@ -28,7 +29,7 @@ load_dotenv(BASE_DIR / '.env')
 SECRET_KEY = 'django-insecure-@6(5p9llpsv7q(3m4nz5prtpw6z)h3+_o1*ej17yf^-4l19z&k'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'true').lower() == 'true'
 
 ALLOWED_HOSTS = ['*']
 
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,12 +80,65 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_PROFILE selects the database setup:
+#   sqlite        - plain SQLite with default journaling (development)
+#   sqlite-tuned  - SQLite in WAL mode with a busy timeout, synchronous=NORMAL and
+#                   memory-mapped I/O, so concurrent chat writes wait instead of
+#                   failing with "database is locked" (default)
+#   postgres      - PostgreSQL with persistent connections and health checks, or
+#                   a psycopg connection pool when DB_POOL=true
+
+DB_PROFILE = os.getenv('DB_PROFILE', 'sqlite-tuned')
+
+if DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'chatbot'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.getenv('DB_POOL', 'false').lower() == 'true':
+        # Pooling replaces persistent connections (requires psycopg[pool])
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '20')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {},
+        }
     }
+
+# The sqlite-tuned profile (also used by bench_db_writes for its comparison)
+SQLITE_TUNED_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
 }
+# Take the write lock when a transaction starts, so two writers never
+# deadlock upgrading read locks (busy_timeout can then do its job)
+SQLITE_TUNED_OPTIONS = {'transaction_mode': 'IMMEDIATE'}
+
+# PRAGMAs applied to every new SQLite connection by app.db.configure_sqlite
+SQLITE_PRAGMAS = {}
+if DB_PROFILE == 'sqlite-tuned':
+    SQLITE_PRAGMAS = dict(SQLITE_TUNED_PRAGMAS)
+    DATABASES['default']['OPTIONS'].update(SQLITE_TUNED_OPTIONS)
 
 
 # Password validation
@@ -124,7 +179,26 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     BASE_DIR / 'static'
 ]
-# STATIC_ROOT = BASE_DIR / 'static'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Production static pipeline: collectstatic writes content-hashed, gzip/brotli
+# precompressed files to STATIC_ROOT, and app.staticfiles.StaticFilesMiddleware
+# serves them with long-lived cache headers. Run collectstatic before enabling.
+STATIC_PIPELINE = os.getenv('STATIC_PIPELINE', 'false').lower() == 'true'
+# Browser cache lifetime (seconds) for static files without a content hash
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', '60'))
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'app.staticfiles.CompressedManifestStaticFilesStorage' if STATIC_PIPELINE
+        else 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Where build_avatars writes avatar thumbnails and their manifest
+# (inside a static dir, so they are served and collected like other assets)
+AVATAR_OUTPUT_DIR = BASE_DIR / 'static' / 'img' / 'avatars'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -134,9 +208,127 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches. 'replies' holds first-turn replies (see app/reply_cache.py); point
+# REPLY_CACHE_BACKEND/REPLY_CACHE_LOCATION at a shared backend (e.g. Redis) to
+# share it between worker processes.
+REPLY_CACHE_ENABLED = os.getenv('REPLY_CACHE_ENABLED', 'false').lower() == 'true'
+REPLY_CACHE_ALIAS = 'replies'
+REPLY_CACHE_TTL = int(os.getenv('REPLY_CACHE_TTL', str(24 * 3600)))
+
+# Rendered modes page and chat-shell fragments. Entries are versioned by
+# Assistant changes, MODES and templates, so the TTL only reclaims memory. Use
+# a shared backend (e.g. Redis) so invalidation reaches every process.
+PAGE_CACHE_ALIAS = 'pages'
+PAGE_CACHE_TIMEOUT = int(os.getenv('PAGE_CACHE_TIMEOUT', '86400'))
+# Browser cache lifetime (seconds) for the modes page before it revalidates
+PAGE_CACHE_MAX_AGE = int(os.getenv('PAGE_CACHE_MAX_AGE', '60'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    REPLY_CACHE_ALIAS: {
+        'BACKEND': os.getenv('REPLY_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('REPLY_CACHE_LOCATION', 'replies'),
+        'TIMEOUT': REPLY_CACHE_TTL,
+        'OPTIONS': {
+            # LocMemCache evicts least recently used entries beyond this
+            'MAX_ENTRIES': int(os.getenv('REPLY_CACHE_MAX_ENTRIES', '1000')),
+        },
+    },
+    PAGE_CACHE_ALIAS: {
+        'BACKEND': os.getenv('PAGE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('PAGE_CACHE_LOCATION', 'pages'),
+        'TIMEOUT': PAGE_CACHE_TIMEOUT,
+    },
+}
+
+# Chat history: messages rendered with the chat page, and the largest page
+# the history API returns
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', '50'))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_MAX_PAGE_SIZE', '200'))
+
+# Browser cache lifetime (seconds) for the /api/modes/ catalog
+MODES_CATALOG_MAX_AGE = int(os.getenv('MODES_CATALOG_MAX_AGE', '3600'))
+
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+# Optional API base URL override (e.g. a local fake server for benchmarks)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+# Model backend: 'openai' (the OpenAI API, or OPENAI_BASE_URL) or 'stub', a
+# deterministic in-process stand-in (app/stub_backend.py) for running and
+# profiling without the network. The stub's simulated run latency (seconds)
+# and streaming speed (tokens per second, 0 = instant) are set below.
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')
+LLM_STUB_LATENCY = float(os.getenv('LLM_STUB_LATENCY', '0'))
+LLM_STUB_TOKEN_RATE = float(os.getenv('LLM_STUB_TOKEN_RATE', '0'))
+
+# Shared OpenAI client: connection pool limits, timeouts (seconds) and retries
+OPENAI_POOL_MAX_CONNECTIONS = int(os.getenv('OPENAI_POOL_MAX_CONNECTIONS', '100'))
+OPENAI_POOL_MAX_KEEPALIVE = int(os.getenv('OPENAI_POOL_MAX_KEEPALIVE', '20'))
+OPENAI_POOL_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_POOL_KEEPALIVE_EXPIRY', '30'))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '600'))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+
+# Spare-thread pool (app/thread_pool.py): pre-created OpenAI threads handed to
+# new chats. Refilled to THREAD_POOL_SIZE in the background when fewer than
+# THREAD_POOL_LOW_WATER are left; spares older than THREAD_POOL_MAX_AGE days
+# are dropped. THREAD_POOL_SIZE=0 creates every thread live.
+THREAD_POOL_SIZE = int(os.getenv('THREAD_POOL_SIZE', '10'))
+THREAD_POOL_LOW_WATER = int(os.getenv('THREAD_POOL_LOW_WATER', '3'))
+THREAD_POOL_MAX_AGE = int(os.getenv('THREAD_POOL_MAX_AGE', '30'))
+
+# Per-chat run queue: lock lease length, how long a request waits for its
+# turn, and how often waiters poll (all in seconds). The lease is renewed
+# every third of its length while a run is in flight, so it only bounds how
+# long a crashed worker blocks its chat.
+CHAT_RUN_LOCK_TTL = int(os.getenv('CHAT_RUN_LOCK_TTL', '600'))
+CHAT_RUN_WAIT_TIMEOUT = int(os.getenv('CHAT_RUN_WAIT_TIMEOUT', '300'))
+CHAT_RUN_POLL_INTERVAL = float(os.getenv('CHAT_RUN_POLL_INTERVAL', '0.25'))
+
+# Job mode for POST /api/chat/: answer 202 with a job id and run the turn on a
+# background thread pool. Clients can also opt in per request with "mode": "job".
+CHAT_API_JOB_MODE = os.getenv('CHAT_API_JOB_MODE', 'false').lower() == 'true'
+CHAT_JOB_WORKERS = int(os.getenv('CHAT_JOB_WORKERS', '8'))
+CHAT_JOB_LONG_POLL_TIMEOUT = float(os.getenv('CHAT_JOB_LONG_POLL_TIMEOUT', '25'))
+
+# Retention (app/retention.py, `manage.py archive_chats`): anonymous and
+# archived (is_active=False) chats idle for CHAT_RETENTION_DAYS, and signed-in
+# users' chats idle for USER_CHAT_RETENTION_DAYS (0 keeps them), are written to
+# gzipped JSONL files in CHAT_ARCHIVE_DIR and deleted
+CHAT_RETENTION_DAYS = int(os.getenv('CHAT_RETENTION_DAYS', '30'))
+USER_CHAT_RETENTION_DAYS = int(os.getenv('USER_CHAT_RETENTION_DAYS', '0'))
+CHAT_ARCHIVE_DIR = os.getenv('CHAT_ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+
+# Admission control (app/admission.py): per-client token bucket (ADMISSION_RATE
+# messages per second, bursts of ADMISSION_BURST), a global cap on in-flight
+# runs, and a bounded wait queue; overload is answered with 429 + Retry-After.
+# ADMISSION_MODE_LIMITS overrides per Assistant.mode as JSON, e.g.
+# {"creative": {"rate": 0.1, "burst": 3, "max_in_flight": 8}}
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'false').lower() == 'true'
+ADMISSION_RATE = float(os.getenv('ADMISSION_RATE', '0.2'))
+ADMISSION_BURST = int(os.getenv('ADMISSION_BURST', '5'))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '32'))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '64'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '5'))
+ADMISSION_MODE_LIMITS = json.loads(os.getenv('ADMISSION_MODE_LIMITS', '{}'))
+
+# Prices (USD per million tokens) used to estimate cost in /api/usage/, as
+# JSON keyed by model, e.g. {"gpt-4o-mini": {"prompt": 0.15, "completion": 0.6}}
+MODEL_PRICES = json.loads(os.getenv('MODEL_PRICES', '{}'))
+
+# Bearer token for Prometheus scrapes of /metrics (staff users need none)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Chat Completions engine: context window (tokens) the prompt history is cut
+# to fit, tokens reserved for the reply, and most stored messages considered
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv('CHAT_CONTEXT_TOKEN_BUDGET', '8000'))
+CHAT_COMPLETION_MAX_TOKENS = int(os.getenv('CHAT_COMPLETION_MAX_TOKENS', '1024'))
+CHAT_CONTEXT_MAX_MESSAGES = int(os.getenv('CHAT_CONTEXT_MAX_MESSAGES', '100'))
 
 # Assistant API Configuration
 OPENAI_ASSISTANT_MODEL = os.getenv('OPENAI_ASSISTANT_MODEL', 'gpt-4o-mini')